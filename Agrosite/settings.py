@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'core',
     'service_providers',
     'farmers',
     'store',
@@ -51,13 +53,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.instrumentation.QueryInstrumentationMiddleware',
+    'core.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiling.ProfilingMiddleware',
     # 'django_browser_reload.middleware.BrowserReloadMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",   
@@ -95,6 +101,105 @@ DATABASES = {
     }
 }
 
+# Production SQLite mode for several gunicorn workers sharing one file:
+# WAL lets readers run alongside the single writer, busy_timeout makes a
+# writer wait for the lock instead of failing with "database is locked", and
+# IMMEDIATE transactions take the write lock up front so two transactions can
+# never deadlock upgrading from a read lock. Off unless SQLITE_TUNING=1, so
+# local manage.py runs keep Django's defaults. The journal mode is stored in
+# the database file: switch it once at deploy time with
+# `manage.py enable_sqlite_wal` (build.sh does when SQLITE_TUNING=1); the
+# other pragmas are set on every connection.
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '0') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 10000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+if SQLITE_TUNING:
+    DATABASES['default']['OPTIONS'] = {
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join(
+            f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items() if name != 'journal_mode'
+        ),
+    }
+
+# Let only one thread per process write at a time in core.db.run_write (see
+# core/db.py); lock errors are retried with jitter for up to
+# SQLITE_WRITE_ATTEMPTS tries and SQLITE_WRITE_TIMEOUT seconds. The last try
+# may still wait busy_timeout, so keep the sum under gunicorn's 30s timeout.
+SQLITE_SERIALIZE_WRITES = os.environ.get('SQLITE_SERIALIZE_WRITES', '1') == '1'
+SQLITE_WRITE_ATTEMPTS = 5
+SQLITE_WRITE_TIMEOUT = 15
+
+# Optional read replica for the catalogue apps (core.routers). Set
+# SQLITE_REPLICA_PATH to a second file and keep it fresh with
+# `manage.py refresh_read_replica --loop`. Browsers that just changed catalogue
+# data read the primary for REPLICA_PIN_SECONDS.
+SQLITE_REPLICA_PATH = os.environ.get('SQLITE_REPLICA_PATH')
+if SQLITE_REPLICA_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_REPLICA_PATH,
+        'OPTIONS': {
+            'init_command': 'PRAGMA query_only=1;PRAGMA mmap_size=134217728;PRAGMA cache_size=-20000',
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10
+
+# Per-request query counts, DB time and N+1 detection (core.instrumentation),
+# logged as one JSON line per request. On with DEBUG; set
+# QUERY_INSTRUMENTATION=1 to turn it on elsewhere. Budgets per view name are
+# committed in core/query_budgets.json and enforced by the tests in core/tests.py
+# (core.testing.QueryBudgetMixin).
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', '1' if DEBUG else '0') == '1'
+QUERY_N_PLUS_ONE_THRESHOLD = 5
+QUERY_BUDGETS_FILE = BASE_DIR / 'core' / 'query_budgets.json'
+
+# Latency histograms per view (core.metrics). Each worker dumps its totals to
+# METRICS_DIR; /metrics/ merges them for staff users or a Bearer METRICS_TOKEN.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'agroplug-metrics'))
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# On-demand request profiling (core.profiling), off unless PROFILING_ENABLED=1
+# and never with the insecure SECRET_KEY above: a logged-in staff user sends
+# the header printed by `manage.py profile_report --token USERNAME`, or a
+# fraction of all requests is sampled. Profiles are written to PROFILING_DIR
+# (mode 0700, newest PROFILING_MAX_PROFILES kept) and read by
+# `manage.py profile_report`.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_HEADER = 'X-Profile'
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'agroplug-profiles'))
+PROFILING_MAX_PROFILES = 500
+PROFILING_PRUNE_SECONDS = 60
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'json_lines': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        'core.instrumentation': {
+            'handlers': ['json_lines'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -144,6 +249,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'userauths.CustomUser'
 
+# Loads the profile/farmer/service-provider rows with the user in one query.
+AUTHENTICATION_BACKENDS = ['userauths.backends.ProfileBackend']
+
+# Seconds a session may reuse its cached role (userauths.roles) before
+# re-reading the profile; saving the profile invalidates it immediately.
+ROLE_SNAPSHOT_TTL = 5 * 60
+
 # In your settings.py file
 
 JAZZMIN_SETTINGS = {
@@ -348,4 +460,42 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 #     "staticfiles": {
 #         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
 #     },
-# }
\ No newline at end of file
+# }
+# Weather (farmers.weather). Point the URLs at a local stub server in tests.
+OPEN_METEO_GEOCODE_URL = os.environ.get('OPEN_METEO_GEOCODE_URL', 'https://geocoding-api.open-meteo.com/v1/search')
+OPEN_METEO_FORECAST_URL = os.environ.get('OPEN_METEO_FORECAST_URL', 'https://api.open-meteo.com/v1/forecast')
+WEATHER_FORECAST_TTL = 30 * 60
+WEATHER_FORECAST_MAX_STALE = 6 * 60 * 60
+WEATHER_HTTP_TIMEOUT = 4
+# Per-worker geocode and forecast LRU size; failed geocodes are retried after
+# WEATHER_GEOCODE_FAILURE_TTL. Registered farm and residence locations are
+# reloaded every WEATHER_PLACES_TTL seconds.
+WEATHER_CACHE_SIZE = 1024
+WEATHER_GEOCODE_FAILURE_TTL = 24 * 60 * 60
+WEATHER_PLACES_TTL = 5 * 60
+
+# HTTP caching for catalogue pages (store.conditional). Anonymous visitors
+# without a session may keep marketplace pages for MARKETPLACE_CACHE_SECONDS
+# and reuse them stale for MARKETPLACE_STALE_SECONDS while revalidating.
+# Change HTTP_ETAG_SALT on a deploy that alters page markup so browsers drop
+# their cached product pages.
+MARKETPLACE_CACHE_SECONDS = 60
+MARKETPLACE_STALE_SECONDS = 5 * 60
+HTTP_ETAG_SALT = os.environ.get('HTTP_ETAG_SALT', '')
+
+# Delta sync for offline clients (store.sync): changes per page, how far each
+# cycle re-reads behind its watermark to catch late commits, and how long
+# deletions are remembered (older tokens get a full resync).
+SYNC_PAGE_SIZE = 500
+SYNC_OVERLAP_SECONDS = 60
+SYNC_TOMBSTONE_DAYS = 30
+
+# Analytics rollups (store.analytics): buckets start at midnight / on the hour
+# in ANALYTICS_TIME_ZONE, hourly rows are kept for ANALYTICS_HOURLY_DAYS (daily
+# rows forever), and the incremental job folds in events a batch at a time.
+ANALYTICS_TIME_ZONE = 'Africa/Lagos'
+ANALYTICS_HOURLY_DAYS = 14
+ANALYTICS_BATCH_SIZE = 5000
+
+# Listings with fewer units than this are flagged on the farmer dashboard.
+LOW_STOCK_THRESHOLD = 10
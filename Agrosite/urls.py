@@ -27,6 +27,8 @@ urlpatterns = [
     path('', include('store.urls')),
     path('userauths/', include('userauths.urls')),
     path('farmers/', include('farmers.urls')),
+    path('', include('core.urls')),
+    path('api/v1/', include('store.api_urls')),
 ]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -6,3 +6,7 @@ python manage.py collectstatic --noinput
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
 
+if [ "${SQLITE_TUNING:-0}" = "1" ]; then
+    python manage.py enable_sqlite_wal
+fi
+
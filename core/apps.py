@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from . import routers
+
+        if routers.replica_configured():
+            post_save.connect(routers.note_write, dispatch_uid='core.routers.note_write.save')
+            post_delete.connect(routers.note_write, dispatch_uid='core.routers.note_write.delete')
@@ -0,0 +1,80 @@
+"""
+Response compression for API views: brotli when the client accepts it and
+the optional `brotli` package is installed, gzip otherwise. Streaming
+responses are compressed chunk by chunk.
+"""
+import re
+from functools import wraps
+
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Compressing less than this costs more than it saves.
+MIN_LENGTH = 200
+BROTLI_QUALITY = 5
+
+
+def _accepts(request, coding):
+    return bool(re.search(rf'\b{coding}\b', request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def choose_encoding(request):
+    if brotli is not None and _accepts(request, 'br'):
+        return 'br'
+    if _accepts(request, 'gzip'):
+        return 'gzip'
+    return None
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(view):
+    """Compress the view's response for clients that accept br or gzip."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_encoding(request)
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if coding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            if len(response.content) < MIN_LENGTH:
+                return response
+            if coding == 'br':
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The compressed body is not byte-identical any more.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
+
+    return wrapped
@@ -0,0 +1,103 @@
+"""
+Write helpers for running several gunicorn workers against one SQLite file.
+
+SQLite allows a single writer at a time. The settings make every atomic block
+BEGIN IMMEDIATE and wait up to busy_timeout for the lock; on top of that,
+`run_write(fn)` runs fn in a transaction that is
+
+* serialized with the other writing threads of this process (when
+  SQLITE_SERIALIZE_WRITES is on), so threads queue on a cheap in-process lock
+  instead of spinning on the file lock, and
+* retried with jittered exponential backoff if SQLite still reports lock
+  contention, since the rolled-back transaction left nothing behind.
+
+fn is run again on a retry, so it must only touch the database: views store
+uploads before calling run_write and add messages after it, and work that
+should follow a commit (image derivatives) goes through on_commit hooks,
+which run once, after the in-process lock is released. The whole call gives
+up after SQLITE_WRITE_TIMEOUT seconds (plus at most one busy_timeout), well
+inside the gunicorn worker timeout.
+"""
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+from . import routers
+
+logger = logging.getLogger(__name__)
+
+_write_lock = threading.Lock()
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def _serialized_atomic(fn, timeout):
+    if not _write_lock.acquire(timeout=max(timeout, 0)):
+        raise OperationalError('database is locked (waited for another writer in this process)')
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            _write_lock.release()
+
+    try:
+        with transaction.atomic():
+            # Registered first, so it runs before fn's own commit hooks.
+            transaction.on_commit(release)
+            return fn()
+    finally:
+        release()
+
+
+def run_write(fn, attempts=None, base_delay=0.05, timeout=None):
+    """
+    Call fn() in an atomic block, retrying on SQLite lock contention for at
+    most `attempts` tries and `timeout` seconds.
+    """
+    if transaction.get_connection().in_atomic_block:
+        # An enclosing transaction owns the retry decision.
+        return fn()
+
+    attempts = attempts or getattr(settings, 'SQLITE_WRITE_ATTEMPTS', 5)
+    timeout = timeout if timeout is not None else getattr(settings, 'SQLITE_WRITE_TIMEOUT', 15)
+    serialize = getattr(settings, 'SQLITE_SERIALIZE_WRITES', False)
+    deadline = time.monotonic() + timeout
+    for attempt in range(1, attempts + 1):
+        try:
+            if serialize:
+                return _serialized_atomic(fn, deadline - time.monotonic())
+            with transaction.atomic():
+                return fn()
+        except OperationalError as exc:
+            if attempt == attempts or not is_lock_error(exc):
+                raise
+            delay = base_delay * 2 ** (attempt - 1)
+            delay = random.uniform(delay / 2, delay * 1.5)
+            if time.monotonic() + delay >= deadline:
+                raise
+            logger.warning('Database locked (attempt %s/%s), retrying in %.0fms', attempt, attempts, delay * 1000)
+            time.sleep(delay)
+
+
+def write_view(view_func):
+    """
+    For views that change data: read the primary database for the whole
+    request (never a possibly stale replica, see core.routers). The view
+    wraps its own database writes in run_write().
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        routers.read_from_primary()
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
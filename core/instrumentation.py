@@ -0,0 +1,137 @@
+"""
+Per-request database instrumentation.
+
+QueryInstrumentationMiddleware wraps every query a request runs (via
+connection.execute_wrapper) and writes one JSON line per request to the
+`core.instrumentation` logger:
+
+    {"view": "store:home", "status": 200, "queries": 5, "db_ms": 3.1,
+     "budget": 6, "over_budget": false, "n_plus_one": [...], ...}
+
+Queries are grouped by fingerprint (the SQL with literals and IN lists
+collapsed); a fingerprint run QUERY_N_PLUS_ONE_THRESHOLD or more times in
+one request is reported as an N+1 pattern, at WARNING level. Budgets per
+view name live in QUERY_BUDGETS_FILE ("store:add_product" for GET and HEAD,
+"store:add_product POST" for other methods) and are enforced in tests by
+core.testing.QueryBudgetMixin.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s|\?)(?:, ?(?:%s|\?))*\)', re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+
+
+def fingerprint(sql):
+    """Normalise SQL so the same query with different parameters compares equal."""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return ' '.join(sql.split())
+
+
+@lru_cache(maxsize=1)
+def load_budgets(path=None):
+    path = path or getattr(settings, 'QUERY_BUDGETS_FILE', None)
+    if not path:
+        return {}
+    try:
+        with open(path, encoding='utf-8') as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def budget_key(name, method):
+    """The budget file key for a request: writes are budgeted apart from reads."""
+    return name if method in ('GET', 'HEAD') else f'{name} {method}'
+
+
+class QueryRecorder:
+    """execute_wrapper that times every query and counts fingerprints."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.exact = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+            try:
+                self.exact[(sql, repr(params))] += 1
+            except Exception:
+                pass
+
+    def record(self, threshold):
+        """Plain-dict summary of what was recorded."""
+        repeated = [
+            {'count': count, 'sql': sql[:300]}
+            for sql, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+        duplicates = sum(count - 1 for count in self.exact.values() if count > 1)
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'duplicate_queries': duplicates,
+            'n_plus_one': repeated,
+        }
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        name = view_name(request)
+        entry = {
+            'view': name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+            **recorder.record(self.threshold),
+        }
+        budget = load_budgets().get(budget_key(name, request.method))
+        if budget is not None:
+            entry['budget'] = budget
+            entry['over_budget'] = entry['queries'] > budget
+        level = logging.WARNING if entry['n_plus_one'] or entry.get('over_budget') else logging.INFO
+        logger.log(level, json.dumps(entry))
+        return response
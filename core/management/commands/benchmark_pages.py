@@ -0,0 +1,313 @@
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.middleware.csrf import CSRF_ALLOWED_CHARS
+from django.test import Client, RequestFactory, override_settings
+from django.test.client import MULTIPART_CONTENT
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from core.seeding import PER_SCALE, ScaleSeeder, jpeg_bytes
+from userauths.models import CustomUser
+
+BENCH_PASSWORD = 'bench-password-1'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies, queries, errors, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else 0,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+    }
+
+
+class Scenario:
+    def __init__(self, name, method, path, user=None, expect=200, data=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.user = user
+        self.expect = expect
+        self.data = data
+
+
+class Command(BaseCommand):
+    help = 'Seed a scratch database and benchmark the main pages through the test client and a WSGI load loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=0.1,
+            help=f'Data volume multiplier for the seed (1 = {PER_SCALE["products"]:,} products, see seed_scale)'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and request mix')
+        parser.add_argument('--requests', type=int, default=50, help='Test-client requests per page')
+        parser.add_argument('--concurrency', type=int, default=4, help='Threads in the WSGI load loop')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds of WSGI load per page')
+        parser.add_argument(
+            '--pages',
+            help='Comma-separated subset of: home, product_detail, view_products, dashboard, login, add_product'
+        )
+        parser.add_argument('--skip-wsgi', action='store_true', help='Only run the test-client pass')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Print the change against an earlier JSON result')
+        parser.add_argument(
+            '--db',
+            help='Scratch database file to create (defaults to a temporary file); must not exist yet'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_pages runs against a scratch SQLite file.')
+        if options['db']:
+            self.check_scratch_path(options['db'])
+        self.rng = random.Random(options['seed'])
+        workdir = tempfile.mkdtemp(prefix='agroplug-bench-')
+        db_path = options['db'] or os.path.join(workdir, 'bench.sqlite3')
+
+        # Never touch the real database or media: benchmark a throwaway copy.
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = db_path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        for alias in connections:
+            if alias != connection.alias:
+                connections[alias].settings_dict['NAME'] = db_path
+        try:
+            with override_settings(MEDIA_ROOT=os.path.join(workdir, 'media'), EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.print_results(results)
+        if options['output']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+            with open(options['output'], 'w', encoding='utf-8') as fp:
+                json.dump(results, fp, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as fp:
+                self.print_comparison(json.load(fp), results)
+
+    def check_scratch_path(self, path):
+        # create_test_db(autoclobber=True) deletes whatever is at the path.
+        target = os.path.realpath(path)
+        for alias, database in settings.DATABASES.items():
+            name = database.get('NAME')
+            if name and os.path.realpath(str(name)) == target:
+                raise CommandError(f'--db {path} is the {alias!r} database; pick a scratch file.')
+        if os.path.exists(path):
+            raise CommandError(f'--db {path} already exists; benchmark_pages only creates new files.')
+
+    # Data --------------------------------------------------------------------
+
+    def seed(self, options):
+        from store.models import Product
+
+        seeder = ScaleSeeder(scale=options['scale'], seed=options['seed'], prefix='bench', password=BENCH_PASSWORD)
+        summary = seeder.run()
+        farmer = CustomUser.objects.get(pk=summary['top_farmer_user_id'])
+        slugs = list(Product.objects.filter(farm__user=farmer).values_list('slug', flat=True)[:500])
+        return {'farmer': farmer, 'slugs': slugs}
+
+    def scenarios(self, context, selected):
+        from store.models import Category
+
+        rng = self.rng
+        category_id = Category.objects.values_list('pk', flat=True).first()
+
+        def product_data():
+            return {
+                'name': f'Bench tomatoes {rng.random():.6f}', 'category': category_id,
+                'description': 'Fresh tomatoes from the benchmark farm.', 'price': '2500', 'unit_type': 'kg',
+                'availability_status': 'in_stock', 'stock_quantity': '40', 'harvest_date': date.today().isoformat(),
+                'expiry_date': (date.today() + timedelta(days=10)).isoformat(), 'farm_location': 'Umuahia, Abia',
+                'image': [SimpleUploadedFile(f'bench-{n}.jpg', context['upload'], content_type='image/jpeg') for n in range(2)],
+            }
+
+        all_scenarios = [
+            Scenario('home', 'GET', lambda: reverse('store:home')),
+            Scenario('product_detail', 'GET',
+                     lambda: reverse('store:product_detail', args=[rng.choice(context['slugs'])]), user='farmer'),
+            Scenario('view_products', 'GET', lambda: reverse('store:view_products'), user='farmer'),
+            Scenario('dashboard', 'GET', lambda: reverse('store:dashboard'), user='farmer', expect=302),
+            Scenario('login', 'POST', lambda: reverse('userauths:login'), expect=302,
+                     data=lambda: {'username': context['farmer'].username, 'password': BENCH_PASSWORD}),
+            Scenario('add_product', 'POST', lambda: reverse('store:add_product'), user='farmer', expect=302,
+                     data=product_data),
+        ]
+        if selected:
+            names = {name.strip() for name in selected.split(',')}
+            unknown = names - {scenario.name for scenario in all_scenarios}
+            if unknown:
+                raise CommandError(f'Unknown page(s): {", ".join(sorted(unknown))}')
+            all_scenarios = [scenario for scenario in all_scenarios if scenario.name in names]
+        return all_scenarios
+
+    # Drivers -----------------------------------------------------------------
+
+    def run(self, options):
+        started = time.monotonic()
+        context = self.seed(options)
+        context['upload'] = jpeg_bytes(self.rng)
+        self.stdout.write(f'Seeded scale {options["scale"]} in {time.monotonic() - started:.1f}s')
+
+        farmer_client = Client()
+        farmer_client.force_login(context['farmer'])
+        context['farmer_cookie'] = f'{settings.SESSION_COOKIE_NAME}={farmer_client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+        results = {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'concurrency': options['concurrency'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite_tuning': getattr(settings, 'SQLITE_TUNING', False),
+            },
+            'pages': {},
+        }
+        for scenario in self.scenarios(context, options['pages']):
+            page = results['pages'][scenario.name] = {}
+            page['client'] = self.run_client(scenario, farmer_client, options['requests'])
+            if not options['skip_wsgi']:
+                page['wsgi'] = self.run_wsgi(scenario, context, options['concurrency'], options['duration'])
+            connection.close()
+        return results
+
+    def run_client(self, scenario, farmer_client, count):
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(count):
+            # Logging in replaces the session, so every login gets a fresh client.
+            client = farmer_client if scenario.user == 'farmer' else Client()
+            data = scenario.data() if scenario.data else None
+            path = scenario.path()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                request_started = time.perf_counter()
+                response = getattr(client, scenario.method.lower())(path, data)
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(counter.count)
+            if response.status_code != scenario.expect:
+                errors += 1
+        return summarize(latencies, queries, errors, time.perf_counter() - started)
+
+    def run_wsgi(self, scenario, context, concurrency, duration):
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        lock = threading.Lock()
+        latencies, queries = [], []
+        errors = [0]
+        deadline = time.monotonic() + duration
+
+        def build_environ():
+            csrf = get_random_string(32, CSRF_ALLOWED_CHARS)
+            cookies = [f'{settings.CSRF_COOKIE_NAME}={csrf}']
+            if scenario.user == 'farmer':
+                cookies.append(context['farmer_cookie'])
+            extra = {'HTTP_COOKIE': '; '.join(cookies), 'HTTP_X_CSRFTOKEN': csrf}
+            if scenario.method == 'GET':
+                return factory.get(scenario.path(), **extra).environ
+            return factory.post(scenario.path(), scenario.data(), content_type=MULTIPART_CONTENT, **extra).environ
+
+        def worker():
+            local_latencies, local_queries, local_errors = [], [], 0
+            statuses = []
+            while time.monotonic() < deadline:
+                environ = build_environ()
+                counter = QueryCounter()
+                with connections['default'].execute_wrapper(counter):
+                    request_started = time.perf_counter()
+                    response = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+                    for _ in response:
+                        pass
+                    response.close()
+                    local_latencies.append(time.perf_counter() - request_started)
+                local_queries.append(counter.count)
+                if not statuses[-1].startswith(str(scenario.expect)):
+                    local_errors += 1
+            connections.close_all()
+            with lock:
+                latencies.extend(local_latencies)
+                queries.extend(local_queries)
+                errors[0] += local_errors
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, queries, errors[0], time.perf_counter() - started)
+
+    # Reporting ---------------------------------------------------------------
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_results(self, results):
+        self.stdout.write(f'{"page":<16}{"driver":<8}{"reqs":>7}{"err":>5}{"p50":>9}{"p95":>9}{"p99":>9}'
+                          f'{"q/req":>7}{"req/s":>9}')
+        for name, drivers in results['pages'].items():
+            for driver, row in drivers.items():
+                self.stdout.write(
+                    f'{name:<16}{driver:<8}{row["requests"]:>7}{row["errors"]:>5}{row["p50_ms"]:>9.1f}'
+                    f'{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}{row["queries_per_request"]:>7.1f}'
+                    f'{row["throughput_rps"]:>9.1f}'
+                )
+
+    def print_comparison(self, before, after):
+        self.stdout.write(f'\nAgainst {before["meta"].get("commit")} ({before["meta"].get("timestamp")}):')
+        for name, drivers in after['pages'].items():
+            for driver, row in drivers.items():
+                old = before['pages'].get(name, {}).get(driver)
+                if not old:
+                    continue
+                changes = []
+                for key in ('p50_ms', 'p95_ms', 'queries_per_request', 'throughput_rps'):
+                    if old[key]:
+                        changes.append(f'{key} {(row[key] - old[key]) / old[key] * 100:+.0f}%')
+                self.stdout.write(f'  {name:<16}{driver:<8}' + ', '.join(changes))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Switch the SQLite database file to write-ahead logging (run once per file, at deploy time)'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Write-ahead logging is an SQLite setting.')
+        mode = settings.SQLITE_PRAGMAS['journal_mode']
+        # The journal mode is stored in the file, so one switch covers every
+        # later connection (and leaves -wal/-shm files beside it).
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={mode}')
+            current = cursor.fetchone()[0]
+        if current.lower() != mode.lower():
+            raise CommandError(f'SQLite kept journal_mode={current} for {connection.settings_dict["NAME"]}.')
+        self.stdout.write(self.style.SUCCESS(f'journal_mode={current} for {connection.settings_dict["NAME"]}.'))
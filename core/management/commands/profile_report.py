@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import pstats
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.instrumentation import fingerprint
+from core.profiling import insecure_secret_key, make_token
+
+
+class Command(BaseCommand):
+    help = 'Merge stored request profiles per endpoint and print the top cumulative hotspots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            help='Profile directory (defaults to PROFILING_DIR)'
+        )
+        parser.add_argument(
+            '--view',
+            dest='views',
+            action='append',
+            help='Only report this URL name, e.g. store:home (repeatable)'
+        )
+        parser.add_argument(
+            '--since',
+            type=float,
+            help='Only include profiles from the last N hours'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Functions to show per endpoint'
+        )
+        parser.add_argument(
+            '--sort',
+            choices=['cumulative', 'tottime', 'ncalls'],
+            default='cumulative',
+            help='pstats sort key'
+        )
+        parser.add_argument(
+            '--token',
+            metavar='USERNAME',
+            help='Print a signed header value that lets this staff user profile their requests, then exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.print_token(options['token'])
+            return
+
+        directory = options['dir'] or str(settings.PROFILING_DIR)
+        if not os.path.isdir(directory):
+            raise CommandError(f'No profiles found in {directory}')
+        cutoff = time.time() - options['since'] * 3600 if options['since'] else None
+
+        groups = defaultdict(list)
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    with open(path, encoding='utf-8') as fp:
+                        meta = json.load(fp)
+                except (OSError, ValueError):
+                    continue
+                prof = path[:-len('.json')] + '.prof'
+                if not os.path.exists(prof):
+                    continue
+                if cutoff and meta.get('started_at', 0) < cutoff:
+                    continue
+                view = meta.get('view') or 'unmatched'
+                if options['views'] and view not in options['views']:
+                    continue
+                groups[view].append((meta, prof))
+
+        if not groups:
+            self.stdout.write(self.style.WARNING('No matching profiles.'))
+            return
+
+        for view in sorted(groups, key=lambda name: -len(groups[name])):
+            self.report(view, groups[view], options)
+
+    def print_token(self, username):
+        if insecure_secret_key():
+            raise CommandError('Set a real SECRET_KEY first; profiling is disabled with the insecure default.')
+        User = get_user_model()
+        user = User.objects.filter(**{User.USERNAME_FIELD: username}).first()
+        if user is None or not user.is_staff:
+            raise CommandError(f'No staff user "{username}".')
+        header = getattr(settings, 'PROFILING_HEADER', 'X-Profile')
+        self.stdout.write(f'{header}: {make_token(user)}')
+
+    def report(self, view, profiles, options):
+        durations = sorted(meta['duration_ms'] for meta, _ in profiles)
+        query_counts = [len(meta.get('queries', [])) for meta, _ in profiles]
+        self.stdout.write(self.style.SUCCESS(
+            f'\n== {view}: {len(profiles)} profile(s), '
+            f'median {durations[len(durations) // 2]:.1f}ms, max {durations[-1]:.1f}ms, '
+            f'{sum(query_counts) / len(query_counts):.1f} queries/request'
+        ))
+
+        repeated = Counter()
+        query_ms = Counter()
+        for meta, _ in profiles:
+            for query in meta.get('queries', []):
+                key = fingerprint(query['sql'])
+                repeated[key] += 1
+                query_ms[key] += query['ms']
+        if repeated:
+            self.stdout.write('Top queries (calls, total ms):')
+            for sql, calls in repeated.most_common(5):
+                self.stdout.write(f'  {calls:>5}  {query_ms[sql]:>8.1f}  {sql[:150]}')
+
+        # pstats prints piecemeal; buffer it so OutputWrapper adds no newlines.
+        buffer = io.StringIO()
+        stats = pstats.Stats(profiles[0][1], stream=buffer)
+        for _, prof in profiles[1:]:
+            stats.add(prof)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(buffer.getvalue())
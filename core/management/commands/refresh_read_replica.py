@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.routers import PRIMARY_ALIAS, REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to the read replica with the online backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=-1,
+            help='Pages copied per backup step (-1 copies everything in one consistent step)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep refreshing instead of exiting after one copy'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30.0,
+            help='Seconds between refreshes (with --loop)'
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica database configured; set SQLITE_REPLICA_PATH.')
+        source = str(settings.DATABASES[PRIMARY_ALIAS]['NAME'])
+        target = str(settings.DATABASES[REPLICA_ALIAS]['NAME'])
+        if os.path.abspath(source) == os.path.abspath(target):
+            raise CommandError('The replica must be a different file from the primary.')
+
+        while True:
+            started = time.monotonic()
+            self.refresh(source, target, options['pages'])
+            elapsed = time.monotonic() - started
+            size = os.path.getsize(target) / (1024 * 1024)
+            self.stdout.write(self.style.SUCCESS(f'Replica refreshed: {size:.1f} MB in {elapsed:.2f}s -> {target}'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, source, target, pages):
+        """
+        Back up into a temporary file and rename it over the replica, so
+        readers see either the old copy or the new one, never a partial one.
+        Connections already open keep reading the old file until they close
+        (Django closes them at the end of each request).
+        """
+        tmp = f'{target}.tmp'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(tmp)
+        try:
+            # In WAL mode the backup reads a snapshot and does not block writers.
+            src.backup(dst, pages=pages)
+            # The replica is read-only; a rollback journal avoids -wal/-shm files.
+            dst.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, target)
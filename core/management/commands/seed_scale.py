@@ -0,0 +1,63 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.seeding import PER_SCALE, ScaleSeeder, scaled_counts
+from userauths.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a realistic synthetic marketplace: users, profiles, farmers, service providers, '
+        f'categories, products, variants and images. One unit of --scale is {PER_SCALE["products"]:,} products.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help='Data volume multiplier (may be fractional)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+        parser.add_argument(
+            '--as-of',
+            type=date.fromisoformat,
+            help='Date the data is generated relative to, YYYY-MM-DD (defaults to today)'
+        )
+        parser.add_argument(
+            '--prefix',
+            default='seed',
+            help='Prefix for usernames, e-mail domains, SKUs and image files, so runs can coexist'
+        )
+        parser.add_argument('--password', default='agroplug-seed', help='Password for every generated user')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per transaction')
+        parser.add_argument(
+            '--no-image-files',
+            action='store_true',
+            help='Reference the placeholder images without writing them to media storage'
+        )
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0:
+            raise CommandError('--scale must be positive')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        prefix = options['prefix']
+        if CustomUser.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Data with prefix "{prefix}" already exists; pick another --prefix.')
+
+        counts = scaled_counts(options['scale'])
+        self.stdout.write(', '.join(f'{count:,} {name}' for name, count in counts.items()))
+        seeder = ScaleSeeder(
+            scale=options['scale'],
+            seed=options['seed'],
+            as_of=options['as_of'],
+            prefix=prefix,
+            password=options['password'],
+            batch_size=options['batch_size'],
+            write_images=not options['no_image_files'],
+            log=self.stdout.write,
+        )
+        summary = seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {summary["products"]:,} product(s), {summary["images"]:,} image(s), '
+            f'{summary["variants"]:,} variant(s), {summary["sales"]:,} sale(s), {summary["farmers"]:,} farmer(s), '
+            f'{summary["service_providers"]:,} service provider(s) and {summary["buyers"]:,} buyer(s) '
+            f'in {summary["seconds"]}s.'
+        ))
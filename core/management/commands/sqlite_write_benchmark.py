@@ -0,0 +1,231 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = ('default', 'tuned', 'serialized')
+
+SCHEMA = """
+CREATE TABLE bench_farm (id INTEGER PRIMARY KEY, product_count INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE bench_product (
+    id INTEGER PRIMARY KEY, farm_id INTEGER NOT NULL, name TEXT NOT NULL,
+    description TEXT NOT NULL, created_at REAL NOT NULL
+);
+CREATE INDEX bench_product_farm ON bench_product (farm_id);
+CREATE TABLE bench_image (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, path TEXT NOT NULL);
+"""
+
+FARMS = 50
+
+
+def _connect(path, mode, pragmas):
+    # "default" mirrors Django's stock SQLite settings: rollback journal,
+    # synchronous=FULL, 5s timeout and DEFERRED transactions.
+    conn = sqlite3.connect(path, timeout=5 if mode == 'default' else 20,
+                           isolation_level=None, check_same_thread=False)
+    if mode != 'default':
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+def _add_product(conn, mode, rng):
+    """One add_product-shaped transaction: read, insert product + images, bump a counter."""
+    farm_id = rng.randint(1, FARMS)
+    conn.execute('BEGIN' if mode == 'default' else 'BEGIN IMMEDIATE')
+    try:
+        conn.execute('SELECT count(*) FROM bench_product WHERE farm_id = ?', (farm_id,)).fetchone()
+        product_id = conn.execute(
+            'INSERT INTO bench_product (farm_id, name, description, created_at) VALUES (?, ?, ?, ?)',
+            (farm_id, f'product {rng.random()}', 'x' * 400, time.time()),
+        ).lastrowid
+        conn.executemany(
+            'INSERT INTO bench_image (product_id, path) VALUES (?, ?)',
+            [(product_id, f'products/{product_id}-{n}.jpg') for n in range(2)],
+        )
+        conn.execute('UPDATE bench_farm SET product_count = product_count + 1 WHERE id = ?', (farm_id,))
+        conn.execute('COMMIT')
+    except sqlite3.OperationalError:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+
+def _run_worker(path, mode, pragmas, writers, readers, duration, seed):
+    """Body of one benchmark process (stands in for one gunicorn worker)."""
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+    stats = {'commits': 0, 'failures': 0, 'retries': 0, 'reads': 0, 'read_failures': 0}
+    latencies = []
+    stats_lock = threading.Lock()
+
+    def write_loop(n):
+        rng = random.Random(seed * 1000 + n)
+        conn = _connect(path, mode, pragmas)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            ok = False
+            retries = 0
+            for attempt in range(1, 6 if mode == 'serialized' else 2):
+                try:
+                    if mode == 'serialized':
+                        with lock:
+                            _add_product(conn, mode, rng)
+                    else:
+                        _add_product(conn, mode, rng)
+                    ok = True
+                    break
+                except sqlite3.OperationalError:
+                    if mode != 'serialized' or attempt == 5:
+                        break
+                    retries += 1
+                    delay = 0.05 * 2 ** (attempt - 1)
+                    time.sleep(rng.uniform(delay / 2, delay * 1.5))
+            elapsed = (time.perf_counter() - started) * 1000
+            with stats_lock:
+                stats['retries'] += retries
+                if ok:
+                    stats['commits'] += 1
+                    latencies.append(elapsed)
+                else:
+                    stats['failures'] += 1
+        conn.close()
+
+    def read_loop(n):
+        conn = _connect(path, mode, pragmas)
+        while time.monotonic() < deadline:
+            try:
+                conn.execute('SELECT id, name FROM bench_product ORDER BY id DESC LIMIT 24').fetchall()
+                key = 'reads'
+            except sqlite3.OperationalError:
+                key = 'read_failures'
+            with stats_lock:
+                stats[key] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=write_loop, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=read_loop, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, latencies
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent SQLite write throughput with stock settings vs the production SQLite mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes',
+            default=','.join(MODES),
+            help=f'Comma-separated modes to run: {", ".join(MODES)}'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Processes, standing in for gunicorn workers'
+        )
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=2,
+            help='Writing threads per process'
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=2,
+            help='Reading threads per process'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5.0,
+            help='Seconds to run each mode'
+        )
+        parser.add_argument(
+            '--seed-rows',
+            type=int,
+            default=2000,
+            help='Products inserted before each run'
+        )
+
+    def prepare(self, path, mode, pragmas, rows):
+        conn = _connect(path, mode, pragmas)
+        if mode == 'default':
+            conn.execute('PRAGMA journal_mode=DELETE')
+        conn.executescript(SCHEMA)
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO bench_farm (id) VALUES (?)', [(n,) for n in range(1, FARMS + 1)])
+        conn.executemany(
+            'INSERT INTO bench_product (farm_id, name, description, created_at) VALUES (?, ?, ?, ?)',
+            [(n % FARMS + 1, f'seed {n}', 'x' * 400, time.time()) for n in range(rows)],
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f'Unknown mode(s): {", ".join(sorted(unknown))}')
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+
+        self.stdout.write(
+            f'{options["workers"]} process(es) x {options["writers"]} writer(s) + {options["readers"]} reader(s), '
+            f'{options["duration"]:.0f}s per mode'
+        )
+        self.stdout.write(f'{"mode":<12}{"writes/s":>10}{"failed":>8}{"retries":>9}'
+                          f'{"p50 ms":>9}{"p99 ms":>9}{"reads/s":>10}{"read err":>10}')
+
+        results = {}
+        workdir = tempfile.mkdtemp(prefix='sqlite-bench-')
+        try:
+            for mode in modes:
+                path = os.path.join(workdir, f'{mode}.sqlite3')
+                self.prepare(path, mode, pragmas, options['seed_rows'])
+                totals = {'commits': 0, 'failures': 0, 'retries': 0, 'reads': 0, 'read_failures': 0}
+                latencies = []
+                with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                    futures = [
+                        pool.submit(_run_worker, path, mode, pragmas, options['writers'],
+                                    options['readers'], options['duration'], seed)
+                        for seed in range(options['workers'])
+                    ]
+                    for future in futures:
+                        stats, worker_latencies = future.result()
+                        for key, value in stats.items():
+                            totals[key] += value
+                        latencies.extend(worker_latencies)
+                latencies.sort()
+                duration = options['duration']
+                results[mode] = totals['commits'] / duration
+                self.stdout.write(
+                    f'{mode:<12}{totals["commits"] / duration:>10.1f}{totals["failures"]:>8}{totals["retries"]:>9}'
+                    f'{_percentile(latencies, 50):>9.1f}{_percentile(latencies, 99):>9.1f}'
+                    f'{totals["reads"] / duration:>10.0f}{totals["read_failures"]:>10}'
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if 'default' in results and results['default']:
+            for mode, rate in results.items():
+                if mode != 'default':
+                    self.stdout.write(self.style.SUCCESS(
+                        f'{mode}: {rate / results["default"]:.1f}x the write throughput of default'
+                    ))
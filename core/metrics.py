@@ -0,0 +1,274 @@
+"""
+Request latency histograms, status counts and in-flight gauges.
+
+Each thread records into its own structures (no locks on the request path).
+Every METRICS_FLUSH_SECONDS a worker writes a JSON snapshot of its totals to
+METRICS_DIR/worker-<pid>.json; the /metrics/ endpoint merges the snapshots
+of all live workers on the host and renders them in Prometheus text format.
+
+Counters must never go down, so when a worker exits (or gunicorn recycles it)
+its histograms and status counts are folded into METRICS_DIR/retired.json
+before its snapshot is removed, as prometheus_client's multiprocess mode
+does. Only its in-flight gauge is dropped.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Upper bounds in seconds; the last bucket is +Inf.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = 'unmatched'
+RETIRED = 'retired.json'
+# Snapshots already folded into RETIRED, remembered so a collector that died
+# between saving RETIRED and removing the snapshot cannot count it twice.
+RETIRED_MEMORY = 256
+
+
+class _ThreadMetrics:
+    __slots__ = ('histograms', 'statuses', 'in_flight')
+
+    def __init__(self):
+        # view -> [count per bucket..., +Inf count, sum of seconds]
+        self.histograms = {}
+        # (view, status) -> count
+        self.statuses = {}
+        self.in_flight = 0
+
+
+_registry = []
+_local = threading.local()
+_flush_lock = threading.Lock()
+_next_flush = 0.0
+_started_at = time.time()
+_claimed_file = False
+
+
+def _thread_metrics():
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None:
+        metrics = _local.metrics = _ThreadMetrics()
+        _registry.append(metrics)
+    return metrics
+
+
+def observe(metrics, view, status, seconds):
+    histogram = metrics.histograms.get(view)
+    if histogram is None:
+        histogram = metrics.histograms[view] = [0] * (len(BUCKETS) + 2)
+    histogram[bisect_left(BUCKETS, seconds)] += 1
+    histogram[-1] += seconds
+    key = (view, status)
+    metrics.statuses[key] = metrics.statuses.get(key, 0) + 1
+
+
+def snapshot():
+    """This worker's totals across all its threads, as plain JSON data."""
+    histograms = {}
+    statuses = {}
+    in_flight = 0
+    for metrics in list(_registry):
+        in_flight += metrics.in_flight
+        for view, values in list(metrics.histograms.items()):
+            merged = histograms.setdefault(view, [0] * len(values))
+            for index, value in enumerate(values):
+                merged[index] += value
+        for (view, status), count in list(metrics.statuses.items()):
+            key = f'{view}|{status}'
+            statuses[key] = statuses.get(key, 0) + count
+    return {
+        'pid': os.getpid(),
+        'started_at': _started_at,
+        'written_at': time.time(),
+        'histograms': histograms,
+        'statuses': statuses,
+        'in_flight': in_flight,
+    }
+
+
+def metrics_dir():
+    return str(settings.METRICS_DIR)
+
+
+def _write_json(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(target, data):
+    for view, values in data['histograms'].items():
+        merged = target['histograms'].setdefault(view, [0] * len(values))
+        for index, value in enumerate(values):
+            merged[index] += value
+    for key, count in data['statuses'].items():
+        target['statuses'][key] = target['statuses'].get(key, 0) + count
+
+
+@contextmanager
+def _retired_lock(directory):
+    # Held while snapshots are folded into RETIRED or merged with it, so a
+    # worker is never counted twice or missed by concurrent collectors.
+    with open(os.path.join(directory, 'retired.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _retire(directory, path, data):
+    """Fold a finished worker's counters into RETIRED, then drop its snapshot."""
+    retired_path = os.path.join(directory, RETIRED)
+    retired = _read_json(retired_path) or {'histograms': {}, 'statuses': {}, 'folded': []}
+    key = f"{data['pid']}:{data.get('started_at')}:{data['written_at']}"
+    if key not in retired['folded']:
+        _merge(retired, data)
+        retired['folded'] = (retired['folded'] + [key])[-RETIRED_MEMORY:]
+        _write_json(retired_path, retired)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def flush():
+    global _claimed_file
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'worker-{os.getpid()}.json')
+    if not _claimed_file:
+        # A previous process with our pid left totals behind; keep them.
+        previous = _read_json(path)
+        if previous is not None and previous.get('started_at') != _started_at:
+            with _retired_lock(directory):
+                _retire(directory, path, previous)
+        _claimed_file = True
+    _write_json(path, snapshot())
+
+
+def maybe_flush(now):
+    global _next_flush
+    if now < _next_flush or not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _next_flush = now + getattr(settings, 'METRICS_FLUSH_SECONDS', 5)
+        flush()
+    except OSError:
+        pass
+    finally:
+        _flush_lock.release()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """
+    Merge the snapshots of every live worker with the retired totals of
+    finished ones, retiring any snapshot whose worker has gone.
+    """
+    flush()
+    directory = metrics_dir()
+    merged = {'histograms': {}, 'statuses': {}, 'in_flight': 0, 'workers': 0}
+    with _retired_lock(directory):
+        for name in os.listdir(directory):
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            path = os.path.join(directory, name)
+            data = _read_json(path)
+            if data is None:
+                continue
+            if not _pid_alive(data['pid']):
+                _retire(directory, path, data)
+                continue
+            merged['workers'] += 1
+            merged['in_flight'] += data['in_flight']
+            _merge(merged, data)
+        retired = _read_json(os.path.join(directory, RETIRED))
+    if retired is not None:
+        _merge(merged, retired)
+    return merged
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_prometheus(merged):
+    lines = [
+        '# HELP agroplug_http_request_duration_seconds Request latency by view.',
+        '# TYPE agroplug_http_request_duration_seconds histogram',
+    ]
+    for view in sorted(merged['histograms']):
+        values = merged['histograms'][view]
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), values[:-1]):
+            cumulative += count
+            lines.append(
+                f'agroplug_http_request_duration_seconds_bucket{{view="{_label(view)}",le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'agroplug_http_request_duration_seconds_sum{{view="{_label(view)}"}} {values[-1]:.6f}')
+        lines.append(f'agroplug_http_request_duration_seconds_count{{view="{_label(view)}"}} {cumulative}')
+
+    lines += [
+        '# HELP agroplug_http_responses_total Responses by view and status code.',
+        '# TYPE agroplug_http_responses_total counter',
+    ]
+    for key in sorted(merged['statuses']):
+        view, status = key.rsplit('|', 1)
+        lines.append(
+            f'agroplug_http_responses_total{{view="{_label(view)}",status="{status}"}} {merged["statuses"][key]}'
+        )
+
+    lines += [
+        '# HELP agroplug_http_requests_in_flight Requests being handled right now.',
+        '# TYPE agroplug_http_requests_in_flight gauge',
+        f'agroplug_http_requests_in_flight {merged["in_flight"]}',
+        '# HELP agroplug_metrics_workers Worker processes reporting metrics.',
+        '# TYPE agroplug_metrics_workers gauge',
+        f'agroplug_metrics_workers {merged["workers"]}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _thread_metrics()
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            match = request.resolver_match
+            observe(metrics, match.view_name if match else UNMATCHED, status, elapsed)
+            maybe_flush(time.monotonic())
@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import routers
+
+PIN_COOKIE = 'pin_primary'
+
+
+class ReadYourWritesMiddleware:
+    """
+    Send this request's catalogue reads to the read replica, unless the
+    browser wrote something in the last REPLICA_PIN_SECONDS (or the replica
+    file has not been created yet).
+    """
+
+    def __init__(self, get_response):
+        if not routers.replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.replica_path = str(settings.DATABASES[routers.REPLICA_ALIAS]['NAME'])
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+    def __call__(self, request):
+        pinned = bool(request.COOKIES.get(PIN_COOKIE))
+        tokens = routers.enable_replica_reads(not pinned and os.path.exists(self.replica_path))
+        try:
+            response = self.get_response(request)
+            wrote = routers.wrote_to_primary()
+        finally:
+            routers.reset_replica_reads(tokens)
+        if wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=100)),
+                ('base', models.CharField(max_length=255)),
+                ('last_suffix', models.IntegerField(default=-1)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'base'), name='unique_slug_sequence')],
+            },
+        ),
+    ]
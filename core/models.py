@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class SlugSequence(models.Model):
+    """
+    Last suffix handed out for a base slug, per model ("store.product",
+    "farmers.farmer", ...). See core.slugs.
+    """
+    scope = models.CharField(max_length=100)
+    base = models.CharField(max_length=255)
+    last_suffix = models.IntegerField(default=-1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'base'], name='unique_slug_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.base} ({self.last_suffix})"
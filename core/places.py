@@ -0,0 +1,54 @@
+"""
+Nigerian states (36 and the FCT) and their main towns.
+
+Used by the seeder to place synthetic sellers and by `farmers.weather` to
+decide which place names are worth geocoding.
+"""
+
+STATE_TOWNS = {
+    'Abia': ['Umuahia', 'Aba', 'Ohafia'],
+    'Adamawa': ['Yola', 'Mubi', 'Numan'],
+    'Akwa Ibom': ['Uyo', 'Eket', 'Ikot Ekpene'],
+    'Anambra': ['Awka', 'Onitsha', 'Nnewi'],
+    'Bauchi': ['Bauchi', 'Azare', 'Misau'],
+    'Bayelsa': ['Yenagoa', 'Brass'],
+    'Benue': ['Makurdi', 'Gboko', 'Otukpo'],
+    'Borno': ['Maiduguri', 'Biu', 'Bama'],
+    'Cross River': ['Calabar', 'Ikom', 'Ogoja'],
+    'Delta': ['Asaba', 'Warri', 'Agbor'],
+    'Ebonyi': ['Abakaliki', 'Afikpo'],
+    'Edo': ['Benin City', 'Auchi', 'Ekpoma'],
+    'Ekiti': ['Ado-Ekiti', 'Ikere', 'Ikole'],
+    'Enugu': ['Enugu', 'Nsukka', 'Awgu'],
+    'FCT': ['Abuja', 'Gwagwalada', 'Kuje'],
+    'Gombe': ['Gombe', 'Kaltungo'],
+    'Imo': ['Owerri', 'Orlu', 'Okigwe'],
+    'Jigawa': ['Dutse', 'Hadejia', 'Gumel'],
+    'Kaduna': ['Kaduna', 'Zaria', 'Kafanchan'],
+    'Kano': ['Kano', 'Wudil', 'Bichi'],
+    'Katsina': ['Katsina', 'Funtua', 'Daura'],
+    'Kebbi': ['Birnin Kebbi', 'Argungu', 'Yauri'],
+    'Kogi': ['Lokoja', 'Idah', 'Kabba'],
+    'Kwara': ['Ilorin', 'Offa', 'Jebba'],
+    'Lagos': ['Ikorodu', 'Epe', 'Badagry'],
+    'Nasarawa': ['Lafia', 'Keffi', 'Akwanga'],
+    'Niger': ['Minna', 'Bida', 'Kontagora'],
+    'Ogun': ['Abeokuta', 'Ijebu-Ode', 'Sagamu'],
+    'Ondo': ['Akure', 'Ondo', 'Owo'],
+    'Osun': ['Osogbo', 'Ife', 'Ilesa'],
+    'Oyo': ['Ibadan', 'Ogbomoso', 'Oyo', 'Iseyin'],
+    'Plateau': ['Jos', 'Pankshin', 'Shendam'],
+    'Rivers': ['Port Harcourt', 'Ahoada', 'Omoku'],
+    'Sokoto': ['Sokoto', 'Tambuwal', 'Wurno'],
+    'Taraba': ['Jalingo', 'Wukari', 'Takum'],
+    'Yobe': ['Damaturu', 'Potiskum', 'Gashua'],
+    'Zamfara': ['Gusau', 'Kaura Namoda', 'Talata Mafara'],
+}
+
+
+def place_names():
+    """Every state (with and without "State") and town name, as written."""
+    names = []
+    for state, towns in STATE_TOWNS.items():
+        names += [state, f'{state} State', *towns]
+    return names
@@ -0,0 +1,182 @@
+"""
+On-demand cProfile of live requests.
+
+A request is profiled when a logged-in staff user sends a valid signed
+PROFILING_HEADER (default `X-Profile`; mint one for them with
+`manage.py profile_report --token USERNAME`) or it is picked by
+PROFILING_SAMPLE_RATE. Everything below the middleware - the view and its
+template rendering - runs under cProfile and its queries are logged.
+Results land in PROFILING_DIR as a pstats dump plus a JSON sidecar with the
+URL name, timings and query log; `manage.py profile_report` merges them per
+endpoint.
+
+Query parameters are never stored, only their count and types, and
+PROFILING_DIR is private to the server's user (0700). Only the newest
+PROFILING_MAX_PROFILES profiles are kept; each process prunes at most once
+every PROFILING_PRUNE_SECONDS. The middleware stays off while SECRET_KEY is
+Django's insecure development key, with which anyone could sign a token.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'core.profiling'
+
+
+def insecure_secret_key():
+    return settings.SECRET_KEY.startswith('django-insecure-')
+
+
+def make_token(user):
+    """A header value that lets staff `user` profile their own requests."""
+    return signing.dumps({'user': user.pk}, salt=TOKEN_SALT)
+
+
+def valid_token(value, user):
+    if not (user.is_authenticated and user.is_active and user.is_staff):
+        return False
+    max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 60 * 60)
+    try:
+        payload = signing.loads(value, salt=TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return isinstance(payload, dict) and payload.get('user') == user.pk
+
+
+def safe_name(view_name):
+    return re.sub(r'[^\w.-]+', '_', view_name or 'unmatched')
+
+
+def describe_params(params, many=False):
+    """Parameter count and types only; the values may be personal data."""
+    if many:
+        return {'rows': len(params) if hasattr(params, '__len__') else None}
+    if params is None:
+        return {'count': 0, 'types': []}
+    values = params.values() if isinstance(params, dict) else params
+    return {'count': len(params), 'types': [type(value).__name__ for value in values]}
+
+
+def private_dir(path):
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # makedirs applies the umask and leaves existing directories alone.
+    os.chmod(path, 0o700)
+
+
+def prune(root, keep):
+    """Remove all but the newest `keep` profiles under `root`."""
+    sidecars = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith('.json'):
+                path = os.path.join(dirpath, filename)
+                try:
+                    sidecars.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+    sidecars.sort()
+    for _, path in sidecars[:max(len(sidecars) - keep, 0)]:
+        for stale in (path, path[:-len('.json')] + '.prof'):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': describe_params(params, many),
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        if insecure_secret_key():
+            logger.warning('Profiling stays off: SECRET_KEY is the insecure development key.')
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        self.header = getattr(settings, 'PROFILING_HEADER', 'X-Profile')
+        self.pruned_at = None
+
+    def should_profile(self, request):
+        token = request.headers.get(self.header)
+        if token:
+            return valid_token(token, request.user)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        query_log = QueryLog()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        profile_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        try:
+            self.save(profiler, query_log, profile_id, {
+                'id': profile_id,
+                'view': match.view_name if match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'started_at': time.time() - elapsed,
+                'queries': query_log.queries,
+            })
+        except OSError:
+            logger.warning('Could not store profile %s', profile_id, exc_info=True)
+        else:
+            response['X-Profile-Id'] = profile_id
+        return response
+
+    def save(self, profiler, query_log, profile_id, meta):
+        root = str(settings.PROFILING_DIR)
+        directory = os.path.join(root, safe_name(meta['view']))
+        private_dir(root)
+        private_dir(directory)
+        base = os.path.join(directory, profile_id)
+        profiler.dump_stats(f'{base}.prof')
+        with open(f'{base}.json', 'w', encoding='utf-8') as fp:
+            json.dump(meta, fp)
+        # Walking the directory costs more than the request as it fills up.
+        now = time.monotonic()
+        if self.pruned_at is None or now - self.pruned_at >= getattr(settings, 'PROFILING_PRUNE_SECONDS', 60):
+            self.pruned_at = now
+            prune(root, getattr(settings, 'PROFILING_MAX_PROFILES', 500))
@@ -0,0 +1,85 @@
+"""
+Read/write routing for an optional SQLite read replica.
+
+When settings.DATABASES has a `replica` alias (see SQLITE_REPLICA_PATH),
+reads of the catalogue apps go to that copy, which `manage.py
+refresh_read_replica` rebuilds from the primary with the SQLite backup API.
+Everything else (users, sessions, mail, writes) stays on `default`.
+
+Replica reads are opt-in per request: ReadYourWritesMiddleware turns them on,
+so management commands and shells always read the primary. A request that
+writes catalogue data switches back to the primary for the rest of the request, and the
+middleware pins that browser to the primary for REPLICA_PIN_SECONDS so it
+sees its own writes until the next refresh.
+"""
+import contextvars
+
+from django.conf import settings
+from django.db import transaction
+
+PRIMARY_ALIAS = 'default'
+REPLICA_ALIAS = 'replica'
+REPLICA_APPS = {'store', 'farmers', 'service_providers'}
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+_wrote = contextvars.ContextVar('wrote', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def enable_replica_reads(enabled=True):
+    """
+    Start tracking a request: allow replica reads if `enabled` and clear the
+    write flag. Returns tokens for reset_replica_reads().
+    """
+    return _use_replica.set(enabled), _wrote.set(False)
+
+
+def reset_replica_reads(tokens):
+    use_token, wrote_token = tokens
+    _use_replica.reset(use_token)
+    _wrote.reset(wrote_token)
+
+
+def read_from_primary():
+    """Send the rest of the current request's reads to the primary."""
+    _use_replica.set(False)
+
+
+def wrote_to_primary():
+    return _wrote.get()
+
+
+def note_write(sender, **kwargs):
+    """
+    post_save/post_delete receiver (connected in CoreConfig.ready): once this
+    request has changed replicated data, stop using the replica for it.
+    db_for_write() cannot tell, since Django also consults it for validation
+    queries that write nothing.
+    """
+    if sender._meta.app_label in REPLICA_APPS:
+        read_from_primary()
+        _wrote.set(True)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            model._meta.app_label in REPLICA_APPS
+            and _use_replica.get()
+            and not transaction.get_connection(PRIMARY_ALIAS).in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        return PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY_ALIAS
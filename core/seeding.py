@@ -0,0 +1,583 @@
+"""
+Deterministic synthetic marketplace data for load tests and benchmarks.
+
+`ScaleSeeder(scale).run()` creates users, profiles, farmers, service
+providers, categories, products, variants, images and a rolled-up sales
+history whose shape follows the live marketplace rather than uniform noise:
+
+* sellers are spread over the 36 states and the FCT, weighted towards the
+  big farming states;
+* category popularity and the number of listings per seller follow a Zipf
+  curve, so a few categories and farms dominate and the tail is long;
+* unit types, prices, stock levels and harvest/expiry dates fit the kind
+  of produce (yams by the tuber or 50kg bag, palm oil by the liter, ...).
+
+One unit of scale is 10,000 products (`PER_SCALE`); fractional scales are
+fine for small runs. Everything is drawn from `random.Random(seed)` (the
+sales from a second stream derived from it) and dated relative to `as_of`,
+so a seed and a date always produce the same rows. Rows go in with
+bulk_create() in batches, passwords share one precomputed hash and slugs
+come from the bulk allocator in `core.slugs`.
+"""
+import io
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.places import STATE_TOWNS
+from core.slugs import assign_slugs
+
+PER_SCALE = {
+    'farmers': 250,
+    'service_providers': 25,
+    'buyers': 1000,
+    'products': 10_000,
+}
+
+# state -> relative weight of sellers; towns come from core.places
+STATE_WEIGHTS = {
+    'Abia': 3,
+    'Adamawa': 3,
+    'Akwa Ibom': 2,
+    'Anambra': 3,
+    'Bauchi': 3,
+    'Bayelsa': 1,
+    'Benue': 6,
+    'Borno': 2,
+    'Cross River': 2,
+    'Delta': 3,
+    'Ebonyi': 3,
+    'Edo': 3,
+    'Ekiti': 2,
+    'Enugu': 3,
+    'FCT': 2,
+    'Gombe': 2,
+    'Imo': 3,
+    'Jigawa': 3,
+    'Kaduna': 6,
+    'Kano': 7,
+    'Katsina': 4,
+    'Kebbi': 4,
+    'Kogi': 3,
+    'Kwara': 3,
+    'Lagos': 3,
+    'Nasarawa': 3,
+    'Niger': 6,
+    'Ogun': 4,
+    'Ondo': 4,
+    'Osun': 3,
+    'Oyo': 6,
+    'Plateau': 5,
+    'Rivers': 2,
+    'Sokoto': 3,
+    'Taraba': 3,
+    'Yobe': 2,
+    'Zamfara': 3,
+}
+STATES = {state: (weight, STATE_TOWNS[state]) for state, weight in STATE_WEIGHTS.items()}
+
+FIRST_NAMES = [
+    'Chinedu', 'Ngozi', 'Emeka', 'Adaeze', 'Obinna', 'Chiamaka', 'Tunde', 'Folake', 'Segun', 'Yetunde',
+    'Bola', 'Kemi', 'Ibrahim', 'Aisha', 'Musa', 'Fatima', 'Abubakar', 'Zainab', 'Usman', 'Hauwa',
+    'Terna', 'Mnena', 'Efe', 'Oghenekaro', 'Eno', 'Ime', 'Osaze', 'Ivie', 'Danjuma', 'Ladi',
+]
+
+LAST_NAMES = [
+    'Okafor', 'Okonkwo', 'Eze', 'Nwosu', 'Adeyemi', 'Balogun', 'Ogunleye', 'Adebayo', 'Bello', 'Abdullahi',
+    'Mohammed', 'Sani', 'Yusuf', 'Garba', 'Aondona', 'Tersoo', 'Edet', 'Bassey', 'Okoro', 'Igwe',
+    'Oyelaran', 'Olawale', 'Danladi', 'Dogara', 'Ebere', 'Omoregie', 'Osagie', 'Akpan', 'Ikechukwu', 'Lawal',
+]
+
+FARM_SUFFIXES = ['Farms', 'Agro Ventures', 'Farm Estate', 'Agro Allied', 'Growers', 'Harvest Co-op', 'Family Farm']
+COMPANY_SUFFIXES = ['Agro Services', 'Logistics', 'Equipment Hire', 'Agro Inputs', 'Cold Storage', 'Mechanization']
+PHONE_PREFIXES = ['0803', '0806', '0813', '0816', '0703', '0706', '0805', '0807', '0815', '0905', '0809', '0817',
+                  '0818', '0909', '0802', '0808', '0812', '0701', '0902', '0810']
+
+# (category, items, unit types (most common first), shelf life in days or None, sold by service providers)
+CATALOGUE = [
+    ('Vegetables', ['Tomatoes', 'Pepper', 'Okra', 'Onions', 'Garden Egg', 'Cabbage', 'Carrots'],
+     ['kg', 'crate', 'bag_50kg', 'pack'], 10, False),
+    ('Tubers', ['Yam', 'Cassava', 'Cocoyam', 'Sweet Potato', 'Irish Potato'],
+     ['piece', 'bag_50kg', 'kg', 'ton'], 60, False),
+    ('Grains', ['Rice', 'Maize', 'Millet', 'Sorghum', 'Wheat', 'Acha'],
+     ['bag_50kg', 'bag_100kg', 'kg', 'ton'], 365, False),
+    ('Fruits', ['Plantain', 'Banana', 'Pineapple', 'Orange', 'Mango', 'Pawpaw', 'Watermelon'],
+     ['bunch', 'piece', 'crate', 'kg'], 14, False),
+    ('Legumes', ['Beans', 'Cowpea', 'Groundnut', 'Soybean', 'Bambara Nut'],
+     ['bag_50kg', 'kg', 'bag_100kg'], 300, False),
+    ('Processed Foods', ['Garri', 'Fufu', 'Elubo', 'Abacha', 'Ogi', 'Plantain Flour'],
+     ['bag_50kg', 'kg', 'pack'], 120, False),
+    ('Poultry', ['Broilers', 'Layers', 'Turkey', 'Eggs', 'Guinea Fowl'],
+     ['piece', 'crate'], 21, False),
+    ('Leafy Greens', ['Ugu', 'Waterleaf', 'Spinach', 'Bitterleaf', 'Scent Leaf'],
+     ['bunch', 'kg'], 5, False),
+    ('Palm Produce', ['Palm Oil', 'Palm Kernel', 'Palm Kernel Oil'],
+     ['liter', 'kg', 'bag_50kg'], 180, False),
+    ('Fish', ['Catfish', 'Tilapia', 'Smoked Fish', 'Stockfish', 'Crayfish'],
+     ['kg', 'piece'], 7, False),
+    ('Livestock', ['Goat', 'Ram', 'Cow', 'Pig', 'Rabbit'],
+     ['piece'], None, False),
+    ('Spices', ['Ginger', 'Garlic', 'Turmeric', 'Ehuru', 'Uziza', 'Dried Pepper'],
+     ['kg', 'pack', 'bag_50kg'], 180, False),
+    ('Nuts & Seeds', ['Cashew', 'Kola Nut', 'Tiger Nut', 'Egusi', 'Sesame'],
+     ['kg', 'bag_50kg'], 180, False),
+    ('Feeds', ['Poultry Feed', 'Fish Feed', 'Pig Feed', 'Cattle Lick'],
+     ['bag_50kg', 'kg'], 120, True),
+    ('Cash Crops', ['Cocoa Beans', 'Coffee', 'Cotton', 'Rubber', 'Shea Nut'],
+     ['bag_50kg', 'ton'], 365, False),
+    ('Seedlings', ['Cassava Stems', 'Plantain Suckers', 'Oil Palm Seedlings', 'Cocoa Seedlings', 'Yam Setts'],
+     ['bunch', 'piece', 'pack'], 30, True),
+    ('Dairy', ['Fresh Milk', 'Wara', 'Yoghurt', 'Fura'],
+     ['liter', 'pack'], 5, False),
+    ('Fertilizers', ['NPK 15-15-15', 'Urea', 'Organic Manure', 'Poultry Droppings'],
+     ['bag_50kg'], None, True),
+    ('Honey & Bee Products', ['Honey', 'Beeswax'],
+     ['liter', 'kg'], 365, False),
+    ('Farm Tools', ['Hoe', 'Cutlass', 'Wheelbarrow', 'Knapsack Sprayer', 'Rake', 'Water Pump'],
+     ['piece'], None, True),
+]
+
+# 'Organic' is reserved for certified listings.
+ADJECTIVES = ['Fresh', 'Premium', 'Local', 'Farm-Fresh', 'Grade A', 'Sun-Dried', 'Wholesale']
+
+# Naira per unit, drawn log-uniformly.
+PRICE_RANGES = {
+    'kg': (300, 6000),
+    'lb': (150, 3000),
+    'piece': (150, 350000),
+    'liter': (800, 6000),
+    'pack': (500, 8000),
+    'bag_50kg': (15000, 95000),
+    'bag_100kg': (40000, 170000),
+    'crate': (3000, 30000),
+    'bunch': (300, 7000),
+    'ton': (250000, 1500000),
+}
+
+# unit type -> [(variant name, price multiplier)]
+VARIANT_SIZES = {
+    'kg': [('1kg', 1), ('5kg', 5), ('10kg', 10), ('25kg', 25)],
+    'liter': [('1 liter', 1), ('5 liters', 5), ('25 liters', 25)],
+    'crate': [('Half crate', Decimal('0.5')), ('Full crate', 1)],
+    'bag_50kg': [('25kg bag', Decimal('0.5')), ('50kg bag', 1), ('100kg bag', 2)],
+    'pack': [('Small pack', 1), ('Family pack', 3)],
+}
+
+AVAILABILITY = [('in_stock', 80), ('out_of_stock', 10), ('pre_order', 7), ('discontinued', 3)]
+
+DESCRIPTIONS = [
+    'Harvested this season and sorted by hand.',
+    'Sourced directly from our farm with no middlemen.',
+    'Carefully packed for transport across the country.',
+    'Available for pickup or delivery within the state.',
+    'Bulk buyers and restaurants get a discount on large orders.',
+    'Grown without synthetic pesticides.',
+    'Stored in a clean, dry warehouse until dispatch.',
+    'Quality checked before every delivery.',
+]
+
+STORAGE_INSTRUCTIONS = [
+    'Keep in a cool, dry place away from direct sunlight.',
+    'Refrigerate after opening.',
+    'Store in a well-ventilated room off the floor.',
+    'Keep frozen until use.',
+]
+
+USAGE_INSTRUCTIONS = [
+    'Wash thoroughly before use.',
+    'Cook within a few days of delivery for the best taste.',
+    'Follow the label for mixing rates.',
+    'Suitable for both home use and resale.',
+]
+
+IMAGE_POOL_SIZE = 24
+IMAGE_COUNT_WEIGHTS = [45, 30, 15, 10]  # 1, 2, 3 or 4 photos per product
+VARIANT_SHARE = 0.2
+ORGANIC_SHARE = 0.15
+SERVICE_PROVIDER_SHARE = 0.05
+MEAN_SALES = 6  # sales per product since it was listed
+
+
+def zipf_weights(count, exponent=1.07):
+    """Cumulative Zipf weights for rng.choices(..., cum_weights=...)."""
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def scaled_counts(scale):
+    return {name: max(1, round(count * scale)) for name, count in PER_SCALE.items()}
+
+
+@contextmanager
+def manual_timestamps(*models):
+    """
+    Let bulk_create() keep the created_at/updated_at values we set instead of
+    stamping every row with now(), so the data has a realistic history.
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+# Column types whose Python values the database driver takes as they are.
+# Decimals qualify because the generator only builds whole-kobo amounts.
+PLAIN_TYPES = {
+    'AutoField', 'BigAutoField', 'BooleanField', 'CharField', 'DecimalField', 'EmailField', 'ForeignKey',
+    'IntegerField', 'PositiveIntegerField', 'SlugField', 'TextField',
+}
+
+
+def insert_instances(model, instances):
+    """
+    INSERT fully populated instances (primary keys included) with a single
+    executemany(). bulk_create() compiles every row's SQL and dominates the
+    run time at millions of rows; this only adapts the values that need it.
+    """
+    if not instances:
+        return
+    connection = connections[router.db_for_write(model)]
+    fields = model._meta.concrete_fields
+    prepare = [
+        None if field.get_internal_type() in PLAIN_TYPES else field.get_db_prep_save
+        for field in fields
+    ]
+    quote = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(quote(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    rows = []
+    for instance in instances:
+        row = []
+        for field, prep in zip(fields, prepare):
+            value = getattr(instance, field.attname)
+            row.append(value if prep is None else prep(value, connection))
+        rows.append(row)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def next_pk(model):
+    return (model._base_manager.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+def jpeg_bytes(rng, size=(640, 480)):
+    """A small two-tone JPEG standing in for a product photo."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', size, tuple(rng.randrange(60, 230) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.ellipse(
+        (width // 4, height // 5, width * 3 // 4, height * 4 // 5),
+        fill=tuple(rng.randrange(30, 256) for _ in range(3)),
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+class ScaleSeeder:
+    def __init__(self, scale=1, seed=42, as_of=None, prefix='seed', password='agroplug-seed',
+                 batch_size=5000, write_images=True, log=None):
+        self.scale = scale
+        self.counts = scaled_counts(scale)
+        self.rng = random.Random(seed)
+        # Sales history has its own stream so it leaves the products alone.
+        self.event_rng = random.Random(f'{seed}-events')
+        as_of = as_of or timezone.localdate()
+        self.as_of = as_of
+        self.now = timezone.make_aware(datetime.combine(as_of, dt_time(12)))
+        self.prefix = prefix
+        self.password = password
+        self.batch_size = batch_size
+        self.write_images = write_images
+        self.log = log or (lambda message: None)
+        self.state_names = list(STATES)
+        self.state_weights = list(accumulate(weight for weight, _ in STATES.values()))
+
+    # Helpers -----------------------------------------------------------------
+
+    def location(self):
+        state = self.rng.choices(self.state_names, cum_weights=self.state_weights)[0]
+        return self.rng.choice(STATES[state][1]), state
+
+    def phone(self):
+        return f'{self.rng.choice(PHONE_PREFIXES)}{self.rng.randrange(10 ** 7):07d}'
+
+    def past(self, max_days, skew=2):
+        """A moment in the `max_days` before as_of, skewed towards recent."""
+        return self.now - timedelta(seconds=int(max_days * 86400 * self.rng.random() ** skew))
+
+    def price(self, unit_type):
+        low, high = PRICE_RANGES.get(unit_type, (500, 50000))
+        value = math.exp(self.rng.uniform(math.log(low), math.log(high)))
+        return Decimal(max(50, int(round(value / 50)) * 50))
+
+    # Stages ------------------------------------------------------------------
+
+    def run(self):
+        started = time.monotonic()
+        self.password_hash = make_password(self.password)
+        self.categories = self.seed_categories()
+        self.image_names, self.derived_images = self.seed_image_files()
+        farmers = self.seed_sellers('farmer', self.counts['farmers'])
+        providers = self.seed_sellers('service_provider', self.counts['service_providers'])
+        self.seed_users('buyer', self.counts['buyers'])
+        products = self.seed_products(farmers, providers, self.counts['products'])
+        from store import analytics
+        analytics.roll_up(log=self.log)
+        summary = {
+            'farmers': len(farmers),
+            'service_providers': len(providers),
+            'buyers': self.counts['buyers'],
+            'categories': len(self.categories),
+            'seconds': round(time.monotonic() - started, 1),
+            # Zipf rank 1: the farm with the most listings.
+            'top_farmer_user_id': farmers[0].user_id,
+            **products,
+        }
+        return summary
+
+    def seed_categories(self):
+        from store.models import Category
+
+        categories = []
+        for name, items, unit_types, shelf_life, for_providers in CATALOGUE:
+            category, _ = Category.objects.get_or_create(
+                name=name, defaults={'description': f'{", ".join(items[:3])} and more.'}
+            )
+            categories.append((category, items, unit_types, shelf_life, for_providers))
+        self.log(f'{len(categories)} categories ready')
+        return categories
+
+    def seed_image_files(self):
+        """The pool of image names, and the set of those with derivatives built."""
+        names = [f'products/{self.prefix}-{n}.jpg' for n in range(IMAGE_POOL_SIZE)]
+        if not self.write_images:
+            return names, set()
+        from store import imaging
+
+        derived = set()
+        for n, name in enumerate(names):
+            if not default_storage.exists(name):
+                # Own generator, so existing files do not shift the data stream.
+                default_storage.save(name, ContentFile(jpeg_bytes(random.Random(n))))
+            try:
+                imaging.generate_derivatives(name)
+            except ValueError:
+                continue
+            derived.add(name)
+        self.log(f'{len(names)} placeholder images ready')
+        return names, derived
+
+    def seed_users(self, user_type, count):
+        """Create `count` users with profiles; returns [(user, town, state)]."""
+        from userauths.models import CustomUser, Profile
+
+        rng = self.rng
+        created = []
+        for start in range(0, count, self.batch_size):
+            users, profiles, places = [], [], []
+            for n in range(start, min(count, start + self.batch_size)):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                town, state = self.location()
+                username = f'{self.prefix}_{user_type}_{n}'
+                email = f'{first}.{last}.{user_type}{n}@{self.prefix}.example.com'.lower()
+                joined = self.past(730, skew=1.5)
+                phone = self.phone()
+                user = CustomUser(
+                    username=username, email=email, password=self.password_hash, first_name=first, last_name=last,
+                    phone_number=phone, email_verified=rng.random() < 0.95, date_joined=joined,
+                )
+                users.append(user)
+                profiles.append(Profile(
+                    user=user, first_name=first, last_name=last, email=email, phone_number=phone,
+                    state_of_origin=state if rng.random() < 0.7 else rng.choice(self.state_names),
+                    state_of_residence=state, nationality='Nigerian', user_type=user_type,
+                ))
+                places.append((town, state))
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(users)
+                assign_slugs(profiles, lambda profile: f'{profile.user.username}-profile')
+                Profile.objects.bulk_create(profiles)
+            created.extend((user, town, state) for user, (town, state) in zip(users, places))
+        self.log(f'{count} {user_type} user(s)')
+        return created
+
+    def seed_sellers(self, user_type, count):
+        from farmers.models import Farmer
+        from service_providers.models import Service_Provider
+
+        rng = self.rng
+        sellers = []
+        for user, town, state in self.seed_users(user_type, count):
+            joined = user.date_joined
+            if user_type == 'farmer':
+                sellers.append(Farmer(
+                    user=user, farm_name=f'{user.last_name} {rng.choice(FARM_SUFFIXES)}',
+                    farm_location=f'{town}, {state}', phone_number=user.phone_number, email=user.email,
+                    created_at=joined, updated_at=joined,
+                ))
+            else:
+                sellers.append(Service_Provider(
+                    user=user, company_name=f'{user.last_name} {rng.choice(COMPANY_SUFFIXES)}',
+                    company_address=f'{rng.randrange(1, 200)} Market Road, {town}, {state}',
+                    phone_number=user.phone_number, email=user.email, created_at=joined, updated_at=joined,
+                ))
+        model = type(sellers[0])
+        name_field = 'farm_name' if user_type == 'farmer' else 'company_name'
+        with manual_timestamps(model):
+            for start in range(0, len(sellers), self.batch_size):
+                batch = sellers[start:start + self.batch_size]
+                with transaction.atomic():
+                    assign_slugs(batch, lambda seller: getattr(seller, name_field))
+                    model.objects.bulk_create(batch)
+        return sellers
+
+    def seed_products(self, farmers, providers, count):
+        from store import counters, listings, search
+        from store.models import Product, ProductEvent, ProductImage, ProductVariant
+
+        rng = self.rng
+        produce = [entry for entry in self.categories if not entry[4]]
+        inputs = [entry for entry in self.categories if entry[4]]
+        produce_weights = zipf_weights(len(produce))
+        input_weights = zipf_weights(len(inputs))
+        farmer_weights = zipf_weights(len(farmers), exponent=0.9)
+        category_names = {entry[0].pk: entry[0].name for entry in self.categories}
+        statuses, status_weights = zip(*AVAILABILITY)
+        status_weights = list(accumulate(status_weights))
+        image_counts = list(accumulate(IMAGE_COUNT_WEIGHTS))
+
+        totals = {'products': 0, 'images': 0, 'variants': 0, 'sales': 0}
+        started = time.monotonic()
+        for start in range(0, count, self.batch_size):
+            products, images, variants = [], [], []
+            for n in range(start, min(count, start + self.batch_size)):
+                if providers and rng.random() < SERVICE_PROVIDER_SHARE:
+                    seller = rng.choice(providers)
+                    category, items, unit_types, shelf_life, _ = rng.choices(inputs, cum_weights=input_weights)[0]
+                    owner = {'service_provider_id': seller.user_id}
+                    location = seller.company_address.split(', ', 1)[1]
+                else:
+                    seller = rng.choices(farmers, cum_weights=farmer_weights)[0]
+                    category, items, unit_types, shelf_life, _ = rng.choices(produce, cum_weights=produce_weights)[0]
+                    owner = {'farm_id': seller.pk}
+                    location = seller.farm_location
+
+                item = rng.choice(items)
+                organic = not owner.get('service_provider_id') and rng.random() < ORGANIC_SHARE
+                adjective = 'Organic' if organic else (rng.choice(ADJECTIVES) if rng.random() < 0.5 else '')
+                name = f'{adjective} {item}'.strip()
+                # The first listed unit type is the usual one for the category.
+                unit_type = unit_types[0] if rng.random() < 0.6 else rng.choice(unit_types)
+                status = rng.choices(statuses, cum_weights=status_weights)[0]
+                created = self.past(365)
+                harvest = expiry = None
+                if shelf_life is not None:
+                    harvest = (created - timedelta(days=rng.randrange(0, 30))).date()
+                    expiry = harvest + timedelta(days=max(1, round(shelf_life * rng.uniform(0.7, 1.3))))
+                product = Product(
+                    category_id=category.pk, name=name, sku=f'{self.prefix}-{n:08d}'.upper(),
+                    description=f'{item} from {location}. ' + ' '.join(rng.sample(DESCRIPTIONS, 2)),
+                    price=self.price(unit_type), unit=Decimal(1), unit_type=unit_type,
+                    availability_status=status,
+                    stock_quantity=0 if status == 'out_of_stock' else min(10000, int(rng.paretovariate(1.2) * 5)),
+                    harvest_date=harvest, expiry_date=expiry, farm_location=location, organic_certified=organic,
+                    storage_instructions=rng.choice(STORAGE_INSTRUCTIONS) if rng.random() < 0.3 else None,
+                    usage_instructions=rng.choice(USAGE_INSTRUCTIONS) if rng.random() < 0.3 else None,
+                    created_at=created, updated_at=min(self.now, created + timedelta(days=30 * rng.random() ** 3)),
+                    **owner,
+                )
+                products.append(product)
+
+                photos = rng.choices(range(1, len(IMAGE_COUNT_WEIGHTS) + 1), cum_weights=image_counts)[0]
+                for order in range(photos):
+                    image = rng.choice(self.image_names)
+                    images.append(ProductImage(
+                        product=product, image=image, has_derivatives=image in self.derived_images,
+                        alt_text=name, is_primary=order == 0, order=order, created_at=created, updated_at=created,
+                    ))
+                sizes = VARIANT_SIZES.get(unit_type)
+                if sizes and rng.random() < VARIANT_SHARE:
+                    for k, (size, multiplier) in enumerate(sizes):
+                        variants.append(ProductVariant(
+                            product=product, name=f'{name} - {size}', sku=f'{product.sku}-{k}',
+                            price=product.price * multiplier, stock_quantity=product.stock_quantity // len(sizes),
+                            size=size, created_at=created, updated_at=created,
+                        ))
+
+            with transaction.atomic():
+                assign_slugs(products, lambda product: product.name)
+                # Number the rows up front so children can point at their
+                # product without reading ids back.
+                for model, rows in ((Product, products), (ProductImage, images), (ProductVariant, variants)):
+                    for pk, row in enumerate(rows, start=next_pk(model)):
+                        row.pk = pk
+                for row in images + variants:
+                    row.product_id = row.product.pk
+                insert_instances(Product, products)
+                insert_instances(ProductImage, images)
+                insert_instances(ProductVariant, variants)
+                events = self.product_events(products)
+                for pk, event in enumerate(events, start=next_pk(ProductEvent)):
+                    event.pk = pk
+                insert_instances(ProductEvent, events)
+                search.index_new_products(products, category_names)
+                listings.refresh_listings(Product.objects.filter(pk__range=(products[0].pk, products[-1].pk)))
+                counters.count_products(products)
+
+            totals['products'] += len(products)
+            totals['images'] += len(images)
+            totals['variants'] += len(variants)
+            totals['sales'] += sum(event.kind == ProductEvent.SALE for event in events)
+            elapsed = time.monotonic() - started
+            self.log(f'{totals["products"]:,}/{count:,} products '
+                     f'({totals["products"] / elapsed if elapsed else 0:,.0f}/s)')
+        return totals
+
+    def product_events(self, products):
+        """
+        The analytics log for freshly numbered products: a `created` event
+        when each was listed and the sales since, which took its stock down
+        to what it holds now.
+        """
+        from store.models import ProductEvent
+
+        rng = self.event_rng
+        events = []
+        for product in products:
+            owner = {'product_id': product.pk, 'farm_id': product.farm_id, 'category_id': product.category_id}
+            sales = []
+            if product.availability_status != 'pre_order':
+                for _ in range(int(rng.expovariate(1 / MEAN_SALES))):
+                    quantity = 1 + int(rng.expovariate(0.5))
+                    sales.append(ProductEvent(
+                        kind=ProductEvent.SALE, quantity=quantity, amount_kobo=int(product.price * 100) * quantity,
+                        occurred_at=product.created_at + (self.now - product.created_at) * rng.random(), **owner,
+                    ))
+            events.append(ProductEvent(
+                kind=ProductEvent.CREATED, quantity=product.stock_quantity + sum(sale.quantity for sale in sales),
+                occurred_at=product.created_at, **owner,
+            ))
+            events.extend(sales)
+        return events
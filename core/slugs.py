@@ -0,0 +1,128 @@
+"""
+Collision-free slug allocation shared by every model with a unique slug.
+
+Each (model, base slug) pair owns a row in SlugSequence. Allocating slugs
+bumps its counter with a single UPDATE ... RETURNING, so concurrent writers
+always get distinct suffixes and nobody has to probe with exists() or retry
+on IntegrityError. The first allocation of a base gets the bare slug
+("fresh-tomatoes"), later ones get "fresh-tomatoes--1", "fresh-tomatoes--2"...
+The double hyphen can never come out of slugify(), so a suffixed slug cannot
+clash with another name's bare slug.
+
+Requires a backend with UPDATE ... RETURNING (SQLite >= 3.35, PostgreSQL).
+"""
+from collections import Counter
+
+from django.db import connections, router, transaction
+from django.utils.text import slugify
+
+from .models import SlugSequence
+
+SEPARATOR = '--'
+# Room left at the end of a truncated base for SEPARATOR and the counter.
+SUFFIX_ROOM = 10
+CHUNK_SIZE = 300
+
+
+def _scope(model):
+    return model._meta.label_lower
+
+
+def _max_base_length(model, field):
+    return model._meta.get_field(field).max_length - SUFFIX_ROOM
+
+
+def _bump(connection, scope, counts):
+    """Reserve counts[base] suffixes for each base; return {base: last_suffix}."""
+    table = connection.ops.quote_name(SlugSequence._meta.db_table)
+    reserved = {}
+    bases = list(counts)
+    for start in range(0, len(bases), CHUNK_SIZE):
+        chunk = bases[start:start + CHUNK_SIZE]
+        cases = ' '.join('WHEN %s THEN %s' for _ in chunk)
+        placeholders = ', '.join('%s' for _ in chunk)
+        params = [value for base in chunk for value in (base, counts[base])]
+        params += [scope, *chunk]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET last_suffix = last_suffix + CASE base {cases} END "
+                f"WHERE scope = %s AND base IN ({placeholders}) "
+                f"RETURNING base, last_suffix",
+                params,
+            )
+            reserved.update(cursor.fetchall())
+    return reserved
+
+
+def _seed(model, field, scope, bases, using):
+    """
+    Create sequences for bases seen for the first time. A base whose bare
+    slug is already used by an existing row starts at 0 so the next
+    allocation is suffixed.
+    """
+    taken = set()
+    for start in range(0, len(bases), CHUNK_SIZE):
+        chunk = bases[start:start + CHUNK_SIZE]
+        taken.update(
+            model._base_manager.using(using)
+            .filter(**{f'{field}__in': chunk})
+            .values_list(field, flat=True)
+        )
+    SlugSequence.objects.using(using).bulk_create(
+        [SlugSequence(scope=scope, base=base, last_suffix=0 if base in taken else -1) for base in bases],
+        ignore_conflicts=True,
+    )
+
+
+def allocate_slugs(model, bases, field='slug'):
+    """
+    Return a unique `field` value for every entry of `bases` (already
+    slugified), in order. Repeated bases get consecutive suffixes.
+
+    Costs one UPDATE per chunk of distinct bases, plus a lookup and an
+    INSERT the first time a base is ever seen.
+    """
+    if not bases:
+        return []
+    limit = _max_base_length(model, field)
+    bases = [(base or model._meta.model_name)[:limit].strip('-') for base in bases]
+    counts = Counter(bases)
+    scope = _scope(model)
+    using = router.db_for_write(SlugSequence)
+    connection = connections[using]
+
+    with transaction.atomic(using=using):
+        reserved = _bump(connection, scope, counts)
+        missing = [base for base in counts if base not in reserved]
+        if missing:
+            _seed(model, field, scope, missing, using)
+            reserved.update(_bump(connection, scope, {base: counts[base] for base in missing}))
+
+    # Hand out each base's reserved range [last - count + 1, last] in order.
+    next_suffix = {base: reserved[base] - counts[base] + 1 for base in counts}
+    slugs = []
+    for base in bases:
+        suffix = next_suffix[base]
+        next_suffix[base] = suffix + 1
+        slugs.append(base if suffix == 0 else f'{base}{SEPARATOR}{suffix}')
+    return slugs
+
+
+def unique_slug(model, value, field='slug'):
+    """Allocate a single unique slug for `value` (slugified here)."""
+    return allocate_slugs(model, [slugify(value)], field)[0]
+
+
+def assign_slugs(instances, source, field='slug'):
+    """
+    Fill in missing slugs on unsaved instances before bulk_create(), e.g.
+    assign_slugs(products, lambda product: product.name).
+    """
+    pending = [instance for instance in instances if not getattr(instance, field)]
+    if not pending:
+        return instances
+    model = type(pending[0])
+    slugs = allocate_slugs(model, [slugify(source(instance)) for instance in pending], field)
+    for instance, slug in zip(pending, slugs):
+        setattr(instance, field, slug)
+    return instances
@@ -0,0 +1,54 @@
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from .instrumentation import budget_key, fingerprint, load_budgets
+
+TRANSACTION_CONTROL = ('SAVEPOINT ', 'RELEASE SAVEPOINT ', 'ROLLBACK TO SAVEPOINT ')
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin: request a URL and fail if its view runs more queries than
+    the budget committed in QUERY_BUDGETS_FILE.
+
+        class MarketplaceTests(QueryBudgetMixin, TestCase):
+            def test_home(self):
+                self.assertWithinQueryBudget('/')
+    """
+
+    def assertWithinQueryBudget(self, path, method='get', data=None, budget=None, **extra):
+        name = budget_key(resolve(path.split('?')[0]).view_name, method.upper())
+        if budget is None:
+            budget = load_budgets().get(name)
+        if budget is None:
+            self.fail(f'No query budget for "{name}"; add it to the budget file.')
+
+        contexts = [CaptureQueriesContext(connections[alias]) for alias in connections]
+        for context in contexts:
+            context.__enter__()
+        try:
+            response = getattr(self.client, method)(path, data, **extra)
+            if response.streaming:
+                # Streamed pages read their rows while the body is consumed.
+                response.streaming_content = [b''.join(response.streaming_content)]
+        finally:
+            for context in reversed(contexts):
+                context.__exit__(None, None, None)
+
+        # Savepoints stand in for BEGIN/COMMIT inside the test transaction,
+        # which are not counted outside it.
+        queries = [
+            query['sql'] for context in contexts for query in context.captured_queries
+            if not query['sql'].startswith(TRANSACTION_CONTROL)
+        ]
+        if len(queries) > budget:
+            counts = {}
+            for sql in queries:
+                key = fingerprint(sql)
+                counts[key] = counts.get(key, 0) + 1
+            repeated = '\n'.join(
+                f'  {count}x {sql[:200]}' for sql, count in sorted(counts.items(), key=lambda item: -item[1])[:5]
+            )
+            self.fail(f'{name} ran {len(queries)} queries, budget is {budget}. Most repeated:\n{repeated}')
+        return response
@@ -0,0 +1,446 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from farmers.models import Farmer, ForecastSnapshot, GeocodedLocation
+from farmers.weather import forecast_cell, weather_service
+from store.models import ProductImage, ProductVariant
+from userauths.models import CustomUser, Profile, UserToken
+from userauths.tokens import issue_token
+
+from store.models import Category, Product
+
+from . import db, metrics
+from .profiling import make_token
+from .instrumentation import load_budgets
+from .models import SlugSequence
+from .testing import QueryBudgetMixin
+from .slugs import SEPARATOR, SUFFIX_ROOM, allocate_slugs, assign_slugs, unique_slug
+
+
+class SlugAllocationTests(TestCase):
+    def test_first_slug_is_bare_and_repeats_are_numbered(self):
+        slugs = [unique_slug(Product, 'Fresh Tomatoes') for _ in range(3)]
+        self.assertEqual(slugs, ['fresh-tomatoes', 'fresh-tomatoes--1', 'fresh-tomatoes--2'])
+
+    def test_batch_numbers_repeats_in_order(self):
+        self.assertEqual(
+            allocate_slugs(Product, ['okra', 'okra', 'yam', 'okra']),
+            ['okra', 'okra--1', 'yam', 'okra--2'],
+        )
+        self.assertEqual(allocate_slugs(Product, ['okra', 'yam']), ['okra--3', 'yam--1'])
+
+    def test_sequences_are_per_model(self):
+        self.assertEqual(unique_slug(Product, 'Grains'), 'grains')
+        self.assertEqual(unique_slug(Category, 'Grains'), 'grains')
+
+    def test_existing_rows_are_not_reused(self):
+        # Saved before any sequence existed, e.g. loaded from a fixture.
+        Category.objects.create(name='Beans', slug='beans')
+        SlugSequence.objects.all().delete()
+        self.assertEqual(unique_slug(Category, 'Beans'), 'beans--1')
+
+    def test_suffixed_slugs_never_collide_with_bare_ones(self):
+        # "okra 2" slugifies to "okra-2", which is not a suffix form.
+        self.assertEqual(allocate_slugs(Product, ['okra', 'okra', 'okra-2']), ['okra', 'okra--1', 'okra-2'])
+
+    def test_long_names_leave_room_for_the_suffix(self):
+        limit = Product._meta.get_field('slug').max_length
+        slugs = [unique_slug(Product, 'x' * 500) for _ in range(2)]
+        self.assertEqual(len(slugs[0]), limit - SUFFIX_ROOM)
+        self.assertTrue(slugs[1].endswith(f'{SEPARATOR}1'))
+        self.assertLessEqual(len(slugs[1]), limit)
+
+    def test_empty_names_fall_back_to_the_model_name(self):
+        self.assertEqual(allocate_slugs(Product, ['', '']), ['product', 'product--1'])
+
+    def test_assign_slugs_fills_only_missing_ones(self):
+        products = [Product(name='Yam'), Product(name='Yam', slug='kept'), Product(name='Yam')]
+        assign_slugs(products, lambda product: product.name)
+        self.assertEqual([product.slug for product in products], ['yam', 'kept', 'yam--1'])
+
+    def test_saving_a_product_allocates_through_the_sequence(self):
+        first = Product.objects.create(name='Tubers', description='d', price=1)
+        second = Product.objects.create(name='Tubers', description='d', price=1)
+        self.assertEqual((first.slug, second.slug), ('tubers', 'tubers--1'))
+
+
+@override_settings(SQLITE_SERIALIZE_WRITES=True)
+class RunWriteTests(TransactionTestCase):
+    def locked_once(self, calls, result='done'):
+        def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return result
+        return fn
+
+    def test_lock_errors_are_retried(self):
+        calls = []
+        self.assertEqual(db.run_write(self.locked_once(calls), base_delay=0.001), 'done')
+        self.assertEqual(len(calls), 2)
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise OperationalError('no such table: nowhere')
+
+        with self.assertRaises(OperationalError):
+            db.run_write(fn)
+        self.assertEqual(len(calls), 1)
+
+    def test_retries_stop_at_the_timeout(self):
+        def fn():
+            raise OperationalError('database is locked')
+
+        started = time.monotonic()
+        with self.assertRaises(OperationalError):
+            db.run_write(fn, attempts=1000, base_delay=0.01, timeout=0.2)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_waiting_for_the_process_lock_is_bounded(self):
+        calls = []
+        with db._write_lock, self.assertRaises(OperationalError):
+            db.run_write(lambda: calls.append(1), timeout=0.1)
+        self.assertEqual(calls, [])
+
+    def test_commit_hooks_run_once_without_the_lock(self):
+        calls, hooks = [], []
+
+        def fn():
+            transaction.on_commit(lambda: hooks.append(db._write_lock.locked()))
+            return self.locked_once(calls)()
+
+        db.run_write(fn, base_delay=0.001)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(hooks, [False])
+        self.assertFalse(db._write_lock.locked())
+
+
+class EnableSqliteWalTests(TestCase):
+    def test_a_database_that_keeps_its_journal_mode_is_reported(self):
+        # The test database lives in memory, which has no write-ahead log.
+        with self.assertRaisesMessage(CommandError, 'kept journal_mode=memory'):
+            call_command('enable_sqlite_wal', stdout=io.StringIO())
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every view in core/query_budgets.json, against its committed budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('ada', 'ada@example.com', password='s3cret-pass', email_verified=True)
+        Profile.objects.create(user=cls.user, user_type='farmer', state_of_residence='Kano')
+        cls.farm = Farmer.objects.create(user=cls.user, farm_name='Ada Farms', farm_location='Kano', email='ada@example.com')
+        cls.category = Category.objects.create(name='Vegetables')
+        cls.products = []
+        for name in ('Okra', 'Ugu', 'Garden egg'):
+            product = Product.objects.create(
+                name=name, description=f'Fresh {name}', price='500.00', stock_quantity=4,
+                category=cls.category, farm=cls.farm,
+            )
+            ProductImage.objects.create(product=product, image=f'products/{product.slug}.jpg', is_primary=True)
+            ProductVariant.objects.create(product=product, name='Basket', sku=f'{product.slug}-basket', price='2000.00')
+            cls.products.append(product)
+        GeocodedLocation.objects.create(query='kano', name='Kano', latitude=12.0, longitude=8.52)
+        ForecastSnapshot.objects.create(
+            cell=forecast_cell(12.0, 8.52), latitude=12.0, longitude=8.52, fetched_at=timezone.now(),
+            payload={'current_weather': {'temperature': 30}, 'daily': {}},
+        )
+
+    def setUp(self):
+        weather_service.clear_memory_cache()
+        # The write views store uploads.
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def check(self, name, args=(), login=True, data=None, status=200, method='get'):
+        if login:
+            self.client.force_login(self.user)
+            # Steady state: the role snapshot is already in the session.
+            self.client.get(reverse('store:dashboard'))
+        response = self.assertWithinQueryBudget(reverse(name, args=args), method=method, data=data)
+        self.assertEqual(response.status_code, status, name)
+
+    def product_form(self, name):
+        return {
+            'name': name, 'category': self.category.pk, 'description': f'Fresh {name}', 'price': '750.00',
+            'unit_type': 'kg', 'availability_status': 'in_stock', 'stock_quantity': 12,
+            'harvest_date': '2025-01-10', 'expiry_date': '2025-02-10', 'farm_location': 'Kano',
+            'image': [SimpleUploadedFile(f'{n}.jpg', b'jpeg', content_type='image/jpeg') for n in range(2)],
+        }
+
+    def registration_form(self, email):
+        return {
+            'email': email, 'first_name': 'Bola', 'last_name': 'Ade', 'phone_number': '2347000000000',
+            'password1': 'Harvest-2025!', 'password2': 'Harvest-2025!',
+            'farm_name': 'Ade Farms', 'farm_location': 'Ogun',
+        }
+
+    def test_every_budgeted_view_is_covered(self):
+        covered = {
+            name for name in dir(self) if name.startswith('test_') and name != 'test_every_budgeted_view_is_covered'
+        }
+        for key in load_budgets():
+            self.assertIn('test_' + key.replace(':', '_').replace('-', '_').replace(' ', '_').lower(), covered)
+
+    def test_store_home(self):
+        self.check('store:home', login=False)
+
+    def test_store_category(self):
+        self.check('store:category', [self.category.slug], login=False)
+
+    def test_store_product_list_partial(self):
+        self.check('store:product_list_partial', login=False)
+
+    def test_store_search(self):
+        self.check('store:search', login=False, data={'q': 'okra'})
+
+    def test_store_product_detail(self):
+        self.check('store:product_detail', [self.products[0].slug])
+
+    def test_store_dashboard(self):
+        self.check('store:dashboard', status=302)
+
+    def test_store_buyer_dashboard(self):
+        self.check('store:buyer_dashboard')
+
+    def test_store_add_product(self):
+        self.check('store:add_product')
+
+    def test_store_add_product_post(self):
+        self.check('store:add_product', method='post', data=self.product_form('Tomatoes'), status=302)
+        self.assertEqual(Product.objects.get(name='Tomatoes').images.count(), 2)
+
+    def test_store_edit_product(self):
+        self.check('store:edit_product', [self.products[0].slug])
+
+    def test_store_edit_product_post(self):
+        product = self.products[0]
+        self.check('store:edit_product', [product.slug], method='post', data=self.product_form('Okra'), status=302)
+        self.assertEqual(product.images.count(), 3)
+
+    def test_store_delete_product(self):
+        self.check('store:delete_product', [self.products[0].slug], status=302)
+        self.assertFalse(Product.objects.filter(pk=self.products[0].pk).exists())
+
+    def test_store_view_products(self):
+        self.check('store:view_products')
+
+    def test_farmers_dashboard(self):
+        self.check('farmers:dashboard')
+
+    def test_farmers_settings(self):
+        self.check('farmers:settings')
+
+    def test_farmers_weather(self):
+        self.check('farmers:weather')
+
+    def test_api_products(self):
+        self.check('api:products', login=False)
+
+    def test_api_product(self):
+        self.check('api:product', [self.products[0].slug], login=False)
+
+    def test_api_categories(self):
+        self.check('api:categories', login=False)
+
+    def test_api_farmers(self):
+        self.check('api:farmers', login=False)
+
+    def test_api_sync(self):
+        self.check('api:sync')
+
+    def test_userauths_login(self):
+        self.check('userauths:login', login=False)
+
+    def test_userauths_logout(self):
+        self.check('userauths:logout', status=302)
+
+    def test_userauths_register(self):
+        self.check('userauths:register', login=False)
+
+    def test_userauths_register_post(self):
+        self.check('userauths:register', login=False, method='post',
+                   data=self.registration_form('bola@example.com'), status=302)
+        self.assertTrue(CustomUser.objects.filter(email='bola@example.com').exists())
+
+    def test_userauths_register_farmer(self):
+        self.check('userauths:register_farmer', login=False)
+
+    def test_userauths_register_farmer_post(self):
+        self.check('userauths:register_farmer', login=False, method='post',
+                   data=self.registration_form('ade@example.com'), status=302)
+        self.assertTrue(Farmer.objects.filter(user__email='ade@example.com').exists())
+
+    def test_userauths_resend_verification(self):
+        self.check('userauths:resend-verification', login=False)
+
+    def test_userauths_signup_success(self):
+        self.check('userauths:signup-success', login=False)
+
+    def test_userauths_signup_view(self):
+        self.check('userauths:signup_view', login=False)
+
+    def test_userauths_verify_email(self):
+        token = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        self.check('userauths:verify-email', [token.token], login=False, status=302)
+
+
+class MetricsCollectTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory
+
+    def write_worker(self, pid, status_count, in_flight=0, started_at=1.0):
+        histogram = [0] * (len(metrics.BUCKETS) + 2)
+        histogram[0], histogram[-1] = status_count, 0.001 * status_count
+        with open(os.path.join(self.directory, f'worker-{pid}.json'), 'w') as fp:
+            json.dump({
+                'pid': pid, 'started_at': started_at, 'written_at': time.time(),
+                'histograms': {'store:home': histogram}, 'statuses': {'store:home|200': status_count},
+                'in_flight': in_flight,
+            }, fp)
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        return process.pid
+
+    def test_dead_workers_keep_their_counts(self):
+        self.write_worker(self.dead_pid(), 7, in_flight=2)
+        first = metrics.collect()
+        self.assertEqual(first['statuses']['store:home|200'], 7)
+        self.assertEqual(first['histograms']['store:home'][0], 7)
+        self.assertEqual(first['in_flight'], metrics.snapshot()['in_flight'])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f'worker-{self.dead_pid()}.json')))
+
+        self.write_worker(self.dead_pid(), 3)
+        second = metrics.collect()
+        self.assertEqual(second['statuses']['store:home|200'], 10)
+        self.assertEqual(metrics.collect()['statuses'], second['statuses'])
+
+    def test_a_snapshot_is_folded_once(self):
+        pid = self.dead_pid()
+        self.write_worker(pid, 5)
+        with open(os.path.join(self.directory, f'worker-{pid}.json')) as fp:
+            data = json.load(fp)
+        metrics.collect()
+        # As if a collector died after saving the retired totals but before
+        # removing the snapshot.
+        self.write_worker(pid, 5)
+        with open(os.path.join(self.directory, f'worker-{pid}.json'), 'w') as fp:
+            json.dump(data, fp)
+        self.assertEqual(metrics.collect()['statuses']['store:home|200'], 5)
+
+    def test_live_workers_are_merged_without_retiring(self):
+        self.write_worker(os.getppid(), 4, in_flight=1, started_at=metrics._started_at + 1)
+        merged = metrics.collect()
+        self.assertEqual(merged['statuses']['store:home|200'], 4)
+        self.assertEqual(merged['workers'], 2)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, metrics.RETIRED)))
+
+
+@override_settings(PROFILING_ENABLED=True, SECRET_KEY='profiling-tests-' + 'k' * 40)
+class ProfilingStorageTests(TestCase):
+    def setUp(self):
+        parent = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, parent, ignore_errors=True)
+        self.directory = os.path.join(parent, 'profiles')
+        settings_override = override_settings(
+            PROFILING_DIR=self.directory, PROFILING_MAX_PROFILES=2, PROFILING_PRUNE_SECONDS=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = CustomUser.objects.create_user('grace', 'grace@example.com', is_staff=True, email_verified=True)
+        self.client.force_login(self.staff)
+
+    def profile(self, slug, user=None):
+        token = make_token(user or self.staff)
+        response = self.client.get(reverse('store:category', args=[slug]), headers={'X-Profile': token})
+        return response.get('X-Profile-Id')
+
+    def sidecars(self):
+        return sorted(
+            name for _, _, names in os.walk(self.directory) for name in names if name.endswith('.json')
+        )
+
+    def test_query_parameters_are_not_stored(self):
+        profile_id = self.profile('secret-cassava')
+        with open(os.path.join(self.directory, 'store_category', f'{profile_id}.json')) as fp:
+            meta = json.load(fp)
+        self.assertNotIn('secret-cassava', json.dumps(meta['queries']))
+        self.assertIn({'count': 1, 'types': ['str']}, [query['params'] for query in meta['queries']])
+
+    def test_directory_is_private_and_old_profiles_are_pruned(self):
+        for slug in ('yam', 'rice', 'maize'):
+            last = self.profile(slug)
+            time.sleep(0.01)
+        self.assertEqual(len(self.sidecars()), 2)
+        self.assertIn(f'{last}.json', self.sidecars())
+        for path in (self.directory, os.path.join(self.directory, 'store_category')):
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+
+    @override_settings(PROFILING_PRUNE_SECONDS=3600)
+    def test_pruning_is_rate_limited(self):
+        for slug in ('yam', 'rice', 'maize'):
+            self.profile(slug)
+        self.assertEqual(len(self.sidecars()), 3)
+
+    def test_tokens_only_work_for_the_staff_user_they_name(self):
+        other = CustomUser.objects.create_user('alan', 'alan@example.com', is_staff=True)
+        self.assertIsNone(self.profile('yam', user=other))
+        CustomUser.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.assertIsNone(self.profile('yam'))
+        self.client.logout()
+        self.assertIsNone(self.profile('yam'))
+        self.assertEqual(self.sidecars(), [])
+
+    @override_settings(SECRET_KEY='django-insecure-' + 'k' * 40)
+    def test_insecure_secret_key_keeps_profiling_off(self):
+        with self.assertLogs('core.profiling', 'WARNING'):
+            self.assertIsNone(self.profile('yam'))
+        with self.assertRaisesMessage(CommandError, 'insecure default'):
+            call_command('profile_report', token='grace', stdout=io.StringIO())
+
+    def test_report_mints_tokens_for_staff_only(self):
+        out = io.StringIO()
+        call_command('profile_report', token='grace', stdout=out)
+        self.assertTrue(out.getvalue().startswith('X-Profile: '))
+        CustomUser.objects.create_user('alan', 'alan@example.com')
+        with self.assertRaisesMessage(CommandError, 'No staff user "alan"'):
+            call_command('profile_report', token='alan', stdout=io.StringIO())
+
+
+class BenchmarkScratchPathTests(TestCase):
+    def test_refuses_the_live_database(self):
+        with self.assertRaisesMessage(CommandError, "is the 'default' database"):
+            call_command('benchmark_pages', db=str(settings.DATABASES['default']['NAME']))
+
+    def test_refuses_existing_files(self):
+        with tempfile.NamedTemporaryFile(suffix='.sqlite3') as existing:
+            with self.assertRaisesMessage(CommandError, 'already exists'):
+                call_command('benchmark_pages', db=existing.name)
+            self.assertTrue(os.path.exists(existing.name))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from . import metrics
+
+
+def _may_read_metrics(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for staff users or a METRICS_TOKEN bearer."""
+    if not _may_read_metrics(request):
+        return HttpResponseForbidden('Forbidden')
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        return HttpResponse('# metrics disabled\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+    return HttpResponse(
+        metrics.render_prometheus(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,125 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from farmers.models import Farmer, ForecastSnapshot
+from farmers.weather import (
+    LocationNotFound, WeatherService, WeatherUnavailable, forecast_cell, normalize_city,
+)
+from userauths.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Geocode every registered farm location and keep their forecasts warm'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Maximum upstream requests in flight'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Seconds between refresh rounds; 0 runs a single round and exits'
+        )
+        parser.add_argument(
+            '--refresh-after',
+            type=int,
+            default=None,
+            help='Only refresh forecasts older than this many seconds '
+                 '(default: 80%% of WEATHER_FORECAST_TTL)'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        ttl = getattr(settings, 'WEATHER_FORECAST_TTL', 30 * 60)
+        refresh_after = options['refresh_after']
+        if refresh_after is None:
+            refresh_after = int(ttl * 0.8)
+
+        self.service = WeatherService()
+        while True:
+            self.run_round(options['concurrency'], refresh_after)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def locations(self):
+        names = set()
+        names.update(Farmer.objects.values_list('farm_location', flat=True).distinct())
+        names.update(Profile.objects.values_list('state_of_residence', flat=True).distinct())
+        return sorted({normalize_city(name) for name in names if name and name.strip()})
+
+    def _in_thread(self, fn, *args):
+        try:
+            return fn(*args)
+        finally:
+            connection.close()
+
+    def run_round(self, concurrency, refresh_after):
+        started = time.monotonic()
+        locations = self.locations()
+
+        # Geocodes are cached, so only new locations cost a request.
+        cells = {}
+        unknown = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {pool.submit(self._in_thread, self.service.geocode, name): name for name in locations}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    _, latitude, longitude = future.result()
+                except LocationNotFound:
+                    unknown.append((name, 'no geocoding match'))
+                    continue
+                except WeatherUnavailable as exc:
+                    unknown.append((name, str(exc)))
+                    continue
+                cells.setdefault(forecast_cell(latitude, longitude), (latitude, longitude, []))[2].append(name)
+
+        now = time.time()
+        fetched = dict(
+            (cell, fetched_at.timestamp())
+            for cell, fetched_at in ForecastSnapshot.objects.filter(cell__in=list(cells)).values_list('cell', 'fetched_at')
+        )
+        due = [cell for cell in cells if now - fetched.get(cell, 0) >= refresh_after]
+
+        refreshed, failed = 0, []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {
+                pool.submit(self._in_thread, self.service.refresh, cells[cell][0], cells[cell][1]): cell
+                for cell in due
+            }
+            for future in as_completed(futures):
+                cell = futures[future]
+                try:
+                    _, fetched_at = future.result()
+                except WeatherUnavailable as exc:
+                    failed.append((cell, str(exc)))
+                    continue
+                fetched[cell] = fetched_at
+                refreshed += 1
+
+        elapsed = time.monotonic() - started
+        now = time.time()
+        self.stdout.write(
+            f'[{datetime.now(dt_timezone.utc):%Y-%m-%d %H:%M:%S}Z] {len(locations)} location(s) in '
+            f'{len(cells)} forecast cell(s): refreshed {refreshed}, {len(cells) - len(due)} still fresh, '
+            f'{len(failed)} failed, {len(unknown)} not geocoded in {elapsed:.2f}s'
+        )
+        for cell, (_, _, names) in sorted(cells.items(), key=lambda item: -(now - fetched.get(item[0], 0))):
+            age = now - fetched[cell] if cell in fetched else None
+            freshness = f'{age / 60:6.1f} min old' if age is not None else '   no data'
+            self.stdout.write(f'  {freshness}  {cell:<14} {", ".join(names)}')
+        for cell, error in failed:
+            self.stdout.write(self.style.ERROR(f'  ✗ {cell}: {error}'))
+        for name, error in unknown:
+            self.stdout.write(self.style.WARNING(f'  ? {name}: {error}'))
@@ -1,5 +1,6 @@
 from django.db import models
-import random
+
+from core.slugs import unique_slug
 
 # Create your models here.
 class Farmer(models.Model):
@@ -17,12 +18,30 @@ class Farmer(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = self.farm_name.lower().replace(' ', '-')  # Simple slug generation
-            if Farmer.objects.filter(slug=self.slug).exists():
-                self.slug += '-' + str(random.randint(1000, 9999))
+            self.slug = unique_slug(Farmer, self.farm_name)
         super().save(*args, **kwargs)
-        
 
 
-        
+class GeocodedLocation(models.Model):
+    """Persistent geocode cache for weather lookups (see farmers.weather)."""
+    query = models.CharField(max_length=200, unique=True)
+    name = models.CharField(max_length=200, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    found = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.query
 
+
+class ForecastSnapshot(models.Model):
+    """Last Open-Meteo forecast fetched for a rounded lat/lon cell."""
+    cell = models.CharField(max_length=40, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    payload = models.JSONField()
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.cell
@@ -1,3 +1,248 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from store import analytics
+from store.models import Product
+from userauths.models import CustomUser, Profile
+
+from .models import Farmer, GeocodedLocation
+from .weather import LocationNotFound, LRUCache, WeatherService, WeatherUnavailable
+
+GEOCODE_MATCH = {'results': [{'name': 'Kano', 'latitude': 12.0022, 'longitude': 8.5920}]}
+FORECAST = {
+    'current_weather': {'temperature': 30.0, 'windspeed': 12.0, 'weathercode': 1},
+    'daily': {'time': ['2026-10-18'], 'temperature_2m_max': [33.0], 'windspeed_10m_max': [14.0],
+              'precipitation_sum': [0.4]},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        with stub.lock:
+            stub.hits.append((url.path, parse_qs(url.query)))
+            queue = stub.responses[url.path]
+            status, body, delay = queue.pop(0) if len(queue) > 1 else queue[0]
+        time.sleep(delay)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode())
+        except OSError:
+            pass  # the client timed out and hung up
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubOpenMeteo:
+    """
+    Open-Meteo stand-in on a local port. `responses` maps a path to a queue of
+    (status, body, delay); the last entry repeats.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = []
+        self.responses = {
+            '/geocode': [(200, GEOCODE_MATCH, 0)],
+            '/forecast': [(200, FORECAST, 0)],
+        }
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def count(self, path):
+        return sum(1 for hit_path, _ in self.hits if hit_path == path)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubServerMixin:
+    def setUp(self):
+        super().setUp()
+        self.stub = StubOpenMeteo()
+        self.addCleanup(self.stub.stop)
+        self.now = time.time()
+
+    def service(self, **options):
+        options.setdefault('timeout', 2)
+        return WeatherService(
+            geocode_url=self.stub.url('/geocode'), forecast_url=self.stub.url('/forecast'),
+            clock=lambda: self.now, **options,
+        )
+
+
+class WeatherServiceTests(StubServerMixin, TestCase):
+    def test_unknown_places_never_reach_upstream(self):
+        service = self.service()
+        for city in ('Atlantis', 'x' * 500, '   '):
+            with self.assertRaises(LocationNotFound):
+                service.geocode(city)
+        self.assertEqual(self.stub.hits, [])
+        self.assertFalse(GeocodedLocation.objects.exists())
+
+    def test_state_and_town_names_are_normalised(self):
+        service = self.service()
+        self.assertEqual(service.geocode('  KANO   state ')[0], 'Kano')
+        self.assertEqual(self.stub.hits[0][1]['name'], ['kano state'])
+
+    def test_registered_farm_locations_are_accepted(self):
+        user = CustomUser.objects.create(username='ada', email='ada@example.com')
+        Farmer.objects.create(user=user, farm_name='Ada Farms', farm_location='Ezinifite', email='ada@example.com')
+        self.assertEqual(self.service().geocode('ezinifite')[0], 'Kano')
+
+    def test_a_503_is_retried_once(self):
+        self.stub.responses['/geocode'] = [(503, {}, 0), (200, GEOCODE_MATCH, 0)]
+        self.assertEqual(self.service().geocode('Kano')[0], 'Kano')
+        self.assertEqual(self.stub.count('/geocode'), 2)
+
+    def test_persistent_errors_give_up_after_the_retry(self):
+        self.stub.responses['/forecast'] = [(503, {}, 0)]
+        with self.assertRaises(WeatherUnavailable):
+            self.service().forecast(12.0, 8.59)
+        self.assertEqual(self.stub.count('/forecast'), 2)
+
+    def test_slow_upstream_times_out(self):
+        self.stub.responses['/forecast'] = [(200, FORECAST, 2)]
+        started = time.monotonic()
+        with self.assertRaises(WeatherUnavailable):
+            self.service(timeout=0.2).forecast(12.0, 8.59)
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_matches_are_cached_in_memory_and_in_the_database(self):
+        self.service().for_city('Kano')
+        service = self.service()
+        service.for_city('Kano')
+        service.for_city('kano')
+        self.assertEqual((self.stub.count('/geocode'), self.stub.count('/forecast')), (1, 1))
+
+    def test_failed_lookups_expire(self):
+        self.stub.responses['/geocode'] = [(200, {}, 0), (200, GEOCODE_MATCH, 0)]
+        service = self.service(failure_ttl=60)
+        for _ in range(2):
+            with self.assertRaises(LocationNotFound):
+                service.geocode('Kano')
+        with self.assertRaises(LocationNotFound):
+            self.service(failure_ttl=60).geocode('Kano')
+        self.assertEqual(self.stub.count('/geocode'), 1)
+
+        self.now += 61
+        self.assertEqual(service.geocode('Kano')[0], 'Kano')
+        self.assertEqual(self.stub.count('/geocode'), 2)
+        self.assertTrue(GeocodedLocation.objects.get(query='kano').found)
+
+    def test_stale_forecasts_are_served_while_refreshing(self):
+        service = self.service(ttl=60, max_stale=600)
+        service.forecast(12.0, 8.59)
+        self.now += 120
+        self.stub.responses['/forecast'] = [(503, {}, 0)]
+        with self.assertLogs('farmers.weather', 'WARNING'):
+            summary, _, stale = service.forecast(12.0, 8.59)
+            for thread in threading.enumerate():
+                if thread.name.startswith('weather-refresh-'):
+                    thread.join()
+        self.assertTrue(stale)
+        self.assertEqual(summary['today']['temp_f'], 86)
+        self.assertEqual(self.stub.count('/forecast'), 3)
+
+
+class LRUCacheTests(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('abia', 1)
+        cache.set('kano', 2)
+        cache.get('abia')
+        cache.set('lagos', 3)
+        self.assertEqual((cache.get('abia'), cache.get('kano'), cache.get('lagos')), (1, None, 3))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire_after_their_ttl(self):
+        now = [0]
+        cache = LRUCache(2, clock=lambda: now[0])
+        cache.set('kano', False, ttl=10)
+        cache.set('abia', 1)
+        now[0] = 10
+        self.assertIsNone(cache.get('kano'))
+        self.assertEqual(cache.get('abia'), 1)
+
+
+class SingleFlightTests(StubServerMixin, TransactionTestCase):
+    def test_concurrent_misses_share_one_request(self):
+        # Slow enough that every thread joins the flights in progress.
+        self.stub.responses['/geocode'] = [(200, GEOCODE_MATCH, 0.3)]
+        self.stub.responses['/forecast'] = [(200, FORECAST, 0.3)]
+        service = self.service()
+        barrier = threading.Barrier(8)
+        results, errors = [], []
+
+        def lookup():
+            barrier.wait()
+            try:
+                results.append(service.for_city('Kano')['location_name'])
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results, ['Kano'] * 8)
+        self.assertEqual((self.stub.count('/geocode'), self.stub.count('/forecast')), (1, 1))
+
+
+class DashboardTests(TestCase):
+    def farmer(self, username, farm=True):
+        user = CustomUser.objects.create_user(username, f'{username}@example.com', password='s3cret-pass',
+                                              email_verified=True)
+        Profile.objects.create(user=user, user_type='farmer', state_of_residence='Kano')
+        if farm:
+            Farmer.objects.create(user=user, farm_name=f'{username.title()} Farms', email=user.email)
+        return user
+
+    def sell(self, user, name, quantity):
+        product = Product.objects.create(
+            name=name, description=name, price='100.00', stock_quantity=20, farm=user.farmer_profile,
+        )
+        analytics.record_sale(product, quantity)
+        return product
+
+    def test_best_sellers_are_the_farmers_own(self):
+        ada, bola = self.farmer('ada'), self.farmer('bola')
+        yam = self.sell(ada, 'Yam', 2)
+        self.sell(bola, 'Rice', 9)
+        self.sell(bola, 'Beans', 8)
+        self.sell(bola, 'Millet', 7)
+        analytics.roll_up()
+
+        self.client.force_login(ada)
+        response = self.client.get(reverse('farmers:dashboard'))
+        self.assertEqual([listing.pk for listing in response.context['best_sellers']], [yam.pk])
+        self.assertEqual(response.context['best_sellers'][0].units_sold, 2)
+
+    def test_farmer_without_a_farm_gets_an_empty_dashboard(self):
+        self.client.force_login(self.farmer('chidi', farm=False))
+        response = self.client.get(reverse('farmers:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['best_sellers']), [])
+        self.assertContains(response, 'No sales yet.')
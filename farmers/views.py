@@ -1,11 +1,12 @@
 from django.shortcuts import render, redirect
 from userauths.decorators import email_verification_required
 from django.conf import settings
-import requests
-from datetime import datetime
 
+from store import analytics
+from store.models import FarmerStats, ProductEvent, ProductListing, Rollup
 from .models import Farmer
-from userauths.models import Profile
+from .weather import LocationNotFound, WeatherUnavailable, weather_service
+from userauths.roles import get_user_role
 # from .forms import FarmerRegisterForm
 
 # Create your views here.
@@ -13,16 +14,51 @@ from userauths.models import Profile
 
 @email_verification_required
 def dashboard(request):
-    if request.user.profile.user_type != "farmer":
+    if get_user_role(request) != "farmer":
         return redirect('store:home')
 
-    return render(request, 'farmers/dashboard.html')
+    # Loaded with the user by userauths.backends.ProfileBackend.
+    farmer = getattr(request.user, 'farmer_profile', None)
+    farmer_id = farmer.pk if farmer else None
+    if farmer_id is None:
+        # No farm yet, so nothing to count.
+        return render(request, 'farmers/dashboard.html', {
+            'best_sellers': [], 'low_stock': [], 'recent_sales': [],
+            'low_stock_threshold': settings.LOW_STOCK_THRESHOLD,
+        })
+    stats = FarmerStats.objects.filter(farmer_id=farmer_id).first()
+    # Sales figures come from the analytics rollups (store.analytics).
+    sales = analytics.totals(Rollup.FARMER, farmer_id, windows={'month': 30})
+    leaders = dict(analytics.leaders(
+        Rollup.PRODUCT, days=30, limit=3,
+        scope_ids=ProductListing.objects.filter(farm_id=farmer_id).values('pk'),
+    ))
+    recent_sales = list(
+        ProductEvent.objects.filter(farm_id=farmer_id, kind=ProductEvent.SALE).order_by('-occurred_at', '-id')[:5]
+    )
+    # One listings query serves both; events outlive their products, so a
+    # sold product may have no listing left.
+    cards = ProductListing.objects.in_bulk({*leaders, *(event.product_id for event in recent_sales)})
+    best_sellers = [cards[pk] for pk in leaders if pk in cards]
+    for listing in best_sellers:
+        listing.units_sold = leaders[listing.pk]
+    for event in recent_sales:
+        event.product_name = cards[event.product_id].name if event.product_id in cards else ''
+    low_stock = ProductListing.objects.filter(farm_id=farmer_id).order_by('stock_quantity', 'id')[:3]
+    return render(request, 'farmers/dashboard.html', {
+        'stats': stats,
+        'sales': sales,
+        'best_sellers': best_sellers,
+        'low_stock': low_stock,
+        'low_stock_threshold': settings.LOW_STOCK_THRESHOLD,
+        'recent_sales': recent_sales,
+    })
 
 
 @email_verification_required
 def profile_settings(request):
-    user = request.user
-    profile = Profile.objects.get(user=user)
+    # Loaded with the user by userauths.backends.ProfileBackend.
+    profile = request.user.profile
     return render(request, "farmers/settings.html", {'profile': profile})
 
 def farmer_edit_profile(request):
@@ -42,87 +78,16 @@ def weather_view(request):
     if not city:
         city = 'Umuahia'
 
-    # Open-Meteo does not require an API key. We'll attempt to geocode the city
-    # using Open-Meteo's geocoding API and then call the forecast endpoint.
-    context = {}
+    context = {'city': city}
     try:
-        geocode_url = 'https://geocoding-api.open-meteo.com/v1/search'
-        gresp = requests.get(geocode_url, params={'name': city, 'count': 1}, timeout=5)
-        gresp.raise_for_status()
-        gdata = gresp.json()
-        if gdata.get('results'):
-            loc = gdata['results'][0]
-            lat = loc['latitude']
-            lon = loc['longitude']
-
-            # Request forecast from Open-Meteo
-            f_url = 'https://api.open-meteo.com/v1/forecast'
-            params = {
-                'latitude': lat,
-                'longitude': lon,
-                'current_weather': True,
-                'daily': 'temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max',
-                'timezone': 'auto'
-            }
-            fresp = requests.get(f_url, params=params, timeout=5)
-            fresp.raise_for_status()
-            fdata = fresp.json()
-
-            def c_to_f(c):
-                return round((c * 9/5) + 32)
-
-            # current weather
-            cur = fdata.get('current_weather', {})
-            today = {
-                'temp_f': c_to_f(cur.get('temperature', 0)),
-                'humidity': None,
-                'wind': round(cur.get('windspeed', 0)),
-                'description': cur.get('weathercode', '')
-            }
-
-            # daily forecasts
-            daily = fdata.get('daily', {})
-            forecasts = []
-            dates = daily.get('time', [])
-            temps_max = daily.get('temperature_2m_max', [])
-            temps_min = daily.get('temperature_2m_min', [])
-            winds = daily.get('windspeed_10m_max', [])
-            precs = daily.get('precipitation_sum', [])
-
-            for i, d in enumerate(dates[:5]):
-                temp_c = temps_max[i] if i < len(temps_max) else None
-                forecasts.append({
-                    'date': d,
-                    'temp_f': c_to_f(temp_c) if temp_c is not None else None,
-                    'humidity': None,
-                    'wind': round(winds[i]) if i < len(winds) else None,
-                    'description': 'N/A',
-                })
-
-            # rainfall series for chart (use precipitation_sum values)
-            rainfall = [p for p in precs[:10]] if precs else []
-
-            context['today'] = today
-            context['forecasts'] = forecasts
-            context['rainfall'] = rainfall
-            context['city'] = city
-        else:
-            raise RuntimeError('Geocoding failed')
-    except Exception:
-        # fallback sample data
-        context['today'] = {'temp_f': 78, 'humidity': 45, 'wind': 5, 'description': 'Sunny'}
-        context['forecasts'] = [
-            {'date': 'Tomorrow', 'temp_f': 72, 'humidity': 65, 'wind': 8, 'description': 'Cloudy'},
-            {'date': 'Apr 27, 2025', 'temp_f': 68, 'humidity': 85, 'wind': 12, 'description': 'Rainy'},
-            {'date': 'Apr 28, 2025', 'temp_f': 70, 'humidity': 75, 'wind': 10, 'description': 'Cloudy'},
-            {'date': 'Apr 29, 2025', 'temp_f': 75, 'humidity': 50, 'wind': 7, 'description': 'Sunny'},
-            {'date': 'Apr 30, 2025', 'temp_f': 77, 'humidity': 55, 'wind': 6, 'description': 'Partly Cloudy'},
-        ]
-        context['rainfall'] = [0, 3, 12, 5, 0]
-        context['city'] = city
+        context.update(weather_service.for_city(city))
+    except LocationNotFound:
+        context['weather_error'] = f'We could not find "{city}". Try a nearby town or your state.'
+    except WeatherUnavailable:
+        context['weather_error'] = 'Weather data is temporarily unavailable. Please try again shortly.'
 
     # Additional analysis placeholders used in template
     context['impact'] = {'rainfall': 'Moderate impact expected.', 'humidity': 'Humidity may affect crop drying.'}
     context['irrigation'] = {'field': 'North Field', 'status': 'Optimal', 'soil_moisture': '48%'}
 
-    return render(request, 'farmers/weather.html', context)
\ No newline at end of file
+    return render(request, 'farmers/weather.html', context)
@@ -0,0 +1,404 @@
+"""
+Weather lookups for the farmer dashboard, backed by Open-Meteo.
+
+Only known places are looked up: Nigerian states and towns (`core.places`)
+and the locations farmers and users have registered. Anything else is
+rejected before it reaches the cache or Open-Meteo, so ?city= cannot be used
+to fill either with junk.
+
+Lookups go through two cache levels:
+
+* bounded in-process LRU caches (microsecond hits) holding geocodes and
+  summarised forecasts, and
+* the database (GeocodedLocation / ForecastSnapshot), shared by every worker
+  and warmed by the `prefetch_weather` command.
+
+Geocodes are kept until evicted; a failed geocode is retried after
+WEATHER_GEOCODE_FAILURE_TTL seconds, in memory and in the database.
+
+Forecasts are keyed by a lat/lon cell rounded to 0.01° (~1 km), are fresh for
+WEATHER_FORECAST_TTL seconds and may be served stale for up to
+WEATHER_FORECAST_MAX_STALE seconds while a background refresh runs. Concurrent
+misses for the same key share a single upstream request.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, connection
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.places import place_names
+from userauths.models import Profile
+
+from .models import Farmer, ForecastSnapshot, GeocodedLocation
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_URL = 'https://geocoding-api.open-meteo.com/v1/search'
+FORECAST_URL = 'https://api.open-meteo.com/v1/forecast'
+DAILY_FIELDS = 'temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max'
+# GeocodedLocation.query is 200 characters; nothing real comes close.
+MAX_CITY_LENGTH = 100
+
+
+class WeatherUnavailable(Exception):
+    pass
+
+
+class LocationNotFound(WeatherUnavailable):
+    pass
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one: the first caller
+    runs the function, the others wait for and share its result (or error).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as exc:
+            call['error'] = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+
+class LRUCache:
+    """
+    Thread-safe mapping holding at most `maxsize` entries, evicting the least
+    recently used. Entries may carry a time-to-live, measured with `clock`.
+    """
+
+    def __init__(self, maxsize, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def forecast_cell(latitude, longitude):
+    return f'{round(latitude, 2):.2f},{round(longitude, 2):.2f}'
+
+
+def normalize_city(city):
+    return ' '.join((city or '').split()).lower()
+
+
+KNOWN_PLACES = frozenset(normalize_city(name) for name in place_names())
+
+
+def c_to_f(c):
+    return round((c * 9/5) + 32)
+
+
+def summarize_forecast(fdata):
+    """Reduce an Open-Meteo forecast payload to what weather.html renders."""
+    cur = fdata.get('current_weather', {})
+    today = {
+        'temp_f': c_to_f(cur.get('temperature', 0)),
+        'humidity': None,
+        'wind': round(cur.get('windspeed', 0)),
+        'description': cur.get('weathercode', '')
+    }
+
+    daily = fdata.get('daily', {})
+    forecasts = []
+    dates = daily.get('time', [])
+    temps_max = daily.get('temperature_2m_max', [])
+    winds = daily.get('windspeed_10m_max', [])
+    precs = daily.get('precipitation_sum', [])
+
+    for i, d in enumerate(dates[:5]):
+        temp_c = temps_max[i] if i < len(temps_max) else None
+        forecasts.append({
+            'date': d,
+            'temp_f': c_to_f(temp_c) if temp_c is not None else None,
+            'humidity': None,
+            'wind': round(winds[i]) if i < len(winds) and winds[i] is not None else None,
+            'description': 'N/A',
+        })
+
+    rainfall = [p for p in precs[:10]] if precs else []
+    return {'today': today, 'forecasts': forecasts, 'rainfall': rainfall}
+
+
+class WeatherService:
+    def __init__(self, geocode_url=None, forecast_url=None, ttl=None, max_stale=None,
+                 timeout=None, cache_size=None, failure_ttl=None, clock=time.time):
+        self.geocode_url = geocode_url or getattr(settings, 'OPEN_METEO_GEOCODE_URL', GEOCODE_URL)
+        self.forecast_url = forecast_url or getattr(settings, 'OPEN_METEO_FORECAST_URL', FORECAST_URL)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'WEATHER_FORECAST_TTL', 30 * 60)
+        self.max_stale = max_stale if max_stale is not None else getattr(
+            settings, 'WEATHER_FORECAST_MAX_STALE', 6 * 60 * 60
+        )
+        self.timeout = timeout or getattr(settings, 'WEATHER_HTTP_TIMEOUT', 4)
+        self.failure_ttl = failure_ttl if failure_ttl is not None else getattr(
+            settings, 'WEATHER_GEOCODE_FAILURE_TTL', 24 * 60 * 60
+        )
+        self.places_ttl = getattr(settings, 'WEATHER_PLACES_TTL', 5 * 60)
+        self.clock = clock
+        cache_size = cache_size or getattr(settings, 'WEATHER_CACHE_SIZE', 1024)
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._geocodes = LRUCache(cache_size, clock)
+        self._forecasts = LRUCache(cache_size, clock)
+        self._places = LRUCache(1, clock)
+        self._flights = SingleFlight()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=32,
+                        max_retries=Retry(total=1, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _get_json(self, url, params):
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as exc:
+            raise WeatherUnavailable(str(exc)) from exc
+
+    # Places ----------------------------------------------------------------
+
+    def is_known_place(self, key):
+        """Whether a normalised city name is one we are willing to geocode."""
+        if not key or len(key) > MAX_CITY_LENGTH:
+            return False
+        if key in KNOWN_PLACES:
+            return True
+        return key in self._registered_places()
+
+    def _registered_places(self):
+        # Reloaded at most every places_ttl seconds, however many unknown
+        # names are thrown at us in between.
+        places = self._places.get('registered')
+        if places is None:
+            names = [
+                *Farmer.objects.order_by().values_list('farm_location', flat=True).distinct(),
+                *Profile.objects.exclude(state_of_residence=None).order_by()
+                .values_list('state_of_residence', flat=True).distinct(),
+            ]
+            places = frozenset(normalize_city(name) for name in names)
+            self._places.set('registered', places, ttl=self.places_ttl)
+        return places
+
+    # Geocoding -------------------------------------------------------------
+
+    def geocode(self, city):
+        """
+        Return (name, latitude, longitude) for a known place. Matches are
+        cached until evicted, misses for failure_ttl seconds.
+        """
+        key = normalize_city(city)
+        if not self.is_known_place(key):
+            raise LocationNotFound(city)
+        location = self._geocodes.get(key)
+        if location is None:
+            location = self._flights.do(('geocode', key), lambda: self._load_geocode(key))
+            self._geocodes.set(key, location, ttl=None if location else self.failure_ttl)
+        if location is False:
+            raise LocationNotFound(city)
+        return location
+
+    def _load_geocode(self, key):
+        cached = GeocodedLocation.objects.filter(query=key).first()
+        if cached is not None and not cached.found and (
+            self.clock() - cached.created_at.timestamp() >= self.failure_ttl
+        ):
+            cached.delete()
+            cached = None
+        if cached is None:
+            gdata = self._get_json(self.geocode_url, {'name': key, 'count': 1})
+            results = gdata.get('results') or []
+            if results:
+                loc = results[0]
+                cached = GeocodedLocation(
+                    query=key, name=loc.get('name', key),
+                    latitude=loc['latitude'], longitude=loc['longitude'],
+                )
+            else:
+                cached = GeocodedLocation(query=key, found=False)
+            try:
+                cached.save()
+            except IntegrityError:
+                cached = GeocodedLocation.objects.get(query=key)
+        if not cached.found:
+            return False
+        return cached.name, cached.latitude, cached.longitude
+
+    # Forecasts -------------------------------------------------------------
+
+    def forecast(self, latitude, longitude):
+        """
+        Summarised forecast for a location as (summary, fetched_at, stale).
+        Raises WeatherUnavailable only when there is nothing usable cached.
+        """
+        cell = forecast_cell(latitude, longitude)
+        now = self.clock()
+        entry = self._forecasts.get(cell)
+        if entry is not None and now - entry[1] < self.ttl:
+            return entry[0], entry[1], False
+
+        # Another worker or the prefetcher may have refreshed the shared copy.
+        snapshot = self._load_snapshot(cell)
+        if snapshot is not None and (entry is None or snapshot[1] > entry[1]):
+            entry = snapshot
+
+        if entry is not None:
+            summary, fetched_at = entry
+            age = now - fetched_at
+            if age < self.ttl:
+                return summary, fetched_at, False
+            if age < self.ttl + self.max_stale:
+                self._refresh_in_background(cell, latitude, longitude)
+                return summary, fetched_at, True
+
+        summary, fetched_at = self._flights.do(
+            ('forecast', cell), lambda: self._fresh_or_refresh(cell, latitude, longitude)
+        )
+        return summary, fetched_at, False
+
+    def _fresh_or_refresh(self, cell, latitude, longitude):
+        # A flight that finished just before we started may already have
+        # stored a fresh copy.
+        entry = self._forecasts.get(cell)
+        if entry is not None and self.clock() - entry[1] < self.ttl:
+            return entry
+        return self.refresh(latitude, longitude)
+
+    def refresh(self, latitude, longitude):
+        """Fetch a forecast upstream and store it in both cache levels."""
+        cell = forecast_cell(latitude, longitude)
+        lat, lon = (float(part) for part in cell.split(','))
+        fdata = self._get_json(self.forecast_url, {
+            'latitude': lat,
+            'longitude': lon,
+            'current_weather': True,
+            'daily': DAILY_FIELDS,
+            'timezone': 'auto',
+        })
+        fetched_at = self.clock()
+        ForecastSnapshot.objects.update_or_create(
+            cell=cell,
+            defaults={
+                'latitude': lat,
+                'longitude': lon,
+                'payload': fdata,
+                'fetched_at': datetime.fromtimestamp(fetched_at, tz=dt_timezone.utc),
+            },
+        )
+        entry = (summarize_forecast(fdata), fetched_at)
+        self._forecasts.set(cell, entry)
+        return entry
+
+    def _load_snapshot(self, cell):
+        snapshot = ForecastSnapshot.objects.filter(cell=cell).only('payload', 'fetched_at').first()
+        if snapshot is None:
+            return None
+        entry = (summarize_forecast(snapshot.payload), snapshot.fetched_at.timestamp())
+        current = self._forecasts.get(cell)
+        if current is None or current[1] < entry[1]:
+            self._forecasts.set(cell, entry)
+        return entry
+
+    def _refresh_in_background(self, cell, latitude, longitude):
+        key = ('forecast', cell)
+        if self._flights.in_flight(key):
+            return
+
+        def run():
+            try:
+                self._flights.do(key, lambda: self.refresh(latitude, longitude))
+            except WeatherUnavailable:
+                logger.warning('Background weather refresh failed for %s', cell, exc_info=True)
+            finally:
+                connection.close()
+
+        threading.Thread(target=run, name=f'weather-refresh-{cell}', daemon=True).start()
+
+    def for_city(self, city):
+        """Geocode + forecast in one call, as used by weather_view."""
+        name, latitude, longitude = self.geocode(city)
+        summary, fetched_at, stale = self.forecast(latitude, longitude)
+        return {
+            **summary,
+            'location_name': name,
+            'fetched_at': datetime.fromtimestamp(fetched_at, tz=dt_timezone.utc),
+            'stale': stale,
+        }
+
+    def clear_memory_cache(self):
+        self._geocodes.clear()
+        self._forecasts.clear()
+        self._places.clear()
+
+
+weather_service = WeatherService()
@@ -1,8 +1,7 @@
 from django.db import models
-from django.utils.text import slugify
+from core.slugs import unique_slug
 from userauths.models import CustomUser as User
 from farmers.models import Farmer
-import random
 
 class Service_Provider(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='service_provider_profile')
@@ -20,7 +19,5 @@ class Service_Provider(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.company_name)
-            if Service_Provider.objects.filter(slug=self.slug).exists():
-                self.slug += '-' + str(random.randint(1000, 9999))
+            self.slug = unique_slug(Service_Provider, self.company_name)
         super().save(*args, **kwargs)
\ No newline at end of file
@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
+from store import search
 from store.models import (
     Product,
     Category,
@@ -7,7 +9,14 @@ from store.models import (
 # Register your models here.
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug']
-    search_fields = ["name", "slug", "service_provider", "category", "farm_location"]
+    search_fields = ["name", "slug", "farm_location"]
+
+    def get_search_results(self, request, queryset, search_term):
+        # Answer admin searches from the FTS index instead of LIKE scans.
+        if not search_term or not search.build_match_query(search_term) or not search.is_enabled():
+            return super().get_search_results(request, queryset, search_term)
+        sql, params = search.match_subquery(search_term)
+        return queryset.filter(pk__in=RawSQL(sql, params)), False
 
 admin.site.register(Product, ProductAdmin)
 
@@ -0,0 +1,348 @@
+"""
+Time-bucketed analytics over the ProductEvent log.
+
+Writers only append events: the Product signal handlers log listings,
+edits and delistings, and `record_sale` logs sales. `roll_up()` folds the
+events after a stored cursor into Rollup rows, hourly and daily, for the
+platform, each farmer and each category, plus daily rows per product. Each
+batch is one write transaction that upserts the summed deltas and moves the
+cursor, so every event is counted exactly once. SQLite has a single writer,
+so event ids are handed out in commit order and a cursor on the id never
+skips an event that committed late.
+
+Dashboards read the rollups through `totals`, `series` and `leaders`.
+Hourly rows are only kept for ANALYTICS_HOURLY_DAYS; daily rows are kept
+forever. `rebuild()` recomputes a date range from the log, for backfills
+and corrections.
+"""
+import zoneinfo
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.db import run_write
+from . import counters, listings
+from .models import Product, ProductEvent, Rollup, RollupCursor
+
+CURSOR_NAME = 'product_events'
+
+METRICS = ('listed', 'delisted', 'updates', 'stock_in', 'stock_out', 'sales', 'units_sold', 'revenue_kobo')
+
+EVENT_FIELDS = ('id', 'kind', 'product_id', 'farm_id', 'category_id', 'quantity', 'amount_kobo', 'occurred_at')
+
+KEY_COLUMNS = ('scope', 'scope_id', 'period', 'bucket')
+
+UPSERT_SQL = f"""
+INSERT INTO {Rollup._meta.db_table} ({', '.join(KEY_COLUMNS + METRICS)})
+VALUES ({', '.join(['%s'] * (len(KEY_COLUMNS) + len(METRICS)))})
+ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET
+{', '.join(f'{metric} = {metric} + excluded.{metric}' for metric in METRICS)}
+"""
+
+
+class OutOfStock(ValueError):
+    pass
+
+
+def bucket_start(moment, period):
+    """Start of the hour or day holding `moment`, in ANALYTICS_TIME_ZONE."""
+    local = moment.astimezone(zoneinfo.ZoneInfo(settings.ANALYTICS_TIME_ZONE))
+    if period == Rollup.DAY:
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def hourly_cutoff(now=None):
+    return bucket_start((now or timezone.now()) - timedelta(days=settings.ANALYTICS_HOURLY_DAYS), Rollup.HOUR)
+
+
+# Writing events ------------------------------------------------------------
+
+def log_event(kind, product, quantity=0, amount_kobo=0, occurred_at=None):
+    return ProductEvent.objects.create(
+        kind=kind,
+        product_id=product.pk,
+        farm_id=product.farm_id,
+        category_id=product.category_id,
+        quantity=quantity,
+        amount_kobo=amount_kobo,
+        occurred_at=occurred_at or timezone.now(),
+    )
+
+
+def log_new_products(products):
+    """Log `created` events for bulk-created products (bulk_create skips post_save)."""
+    ProductEvent.objects.bulk_create([
+        ProductEvent(
+            kind=ProductEvent.CREATED, product_id=product.pk, farm_id=product.farm_id,
+            category_id=product.category_id, quantity=product.stock_quantity,
+            occurred_at=product.created_at or timezone.now(),
+        )
+        for product in products
+    ])
+
+
+def record_sale(product, quantity, unit_price=None, occurred_at=None):
+    """
+    Take `quantity` units of `product` out of stock and log the sale at
+    `unit_price` (the listed price by default). Raises OutOfStock, leaving
+    everything untouched, when fewer units are left. Call it inside the
+    checkout's write transaction.
+    """
+    if quantity < 1:
+        raise ValueError('quantity must be at least 1')
+    unit_price = product.price if unit_price is None else unit_price
+    before = counters.load_snapshot(product.pk)
+    # A queryset update keeps concurrent sales from overselling; it skips
+    # the save signals, so the derived tables are refreshed here instead.
+    updated = Product.objects.filter(pk=product.pk, stock_quantity__gte=quantity).update(
+        stock_quantity=F('stock_quantity') - quantity, updated_at=timezone.now()
+    )
+    if not updated:
+        raise OutOfStock(f'Fewer than {quantity} unit(s) of "{product}" left.')
+    counters.apply([(before, -1), (counters.load_snapshot(product.pk), 1)])
+    listings.refresh_listing(product.pk)
+    return log_event(
+        ProductEvent.SALE, product, quantity=quantity,
+        amount_kobo=counters.to_kobo(unit_price) * quantity, occurred_at=occurred_at,
+    )
+
+
+def units_sold(product_id):
+    """Units of a product sold: its daily rollups plus sales not rolled up yet."""
+    rolled = Rollup.objects.filter(scope=Rollup.PRODUCT, scope_id=product_id, period=Rollup.DAY).aggregate(
+        units=Coalesce(Sum('units_sold'), 0)
+    )['units']
+    cursor = RollupCursor.objects.filter(name=CURSOR_NAME).values_list('last_event_id', flat=True).first() or 0
+    pending = ProductEvent.objects.filter(product_id=product_id, kind=ProductEvent.SALE, id__gt=cursor).aggregate(
+        units=Coalesce(Sum('quantity'), 0)
+    )['units']
+    return rolled + pending
+
+
+# Rolling up ----------------------------------------------------------------
+
+def event_deltas(event):
+    quantity = event['quantity']
+    if event['kind'] == ProductEvent.SALE:
+        return {'sales': 1, 'units_sold': quantity, 'revenue_kobo': event['amount_kobo']}
+    deltas = {
+        ProductEvent.CREATED: {'listed': 1},
+        ProductEvent.UPDATED: {'updates': 1},
+        ProductEvent.DELETED: {'delisted': 1},
+    }[event['kind']].copy()
+    if quantity > 0:
+        deltas['stock_in'] = quantity
+    elif quantity < 0:
+        deltas['stock_out'] = -quantity
+    return deltas
+
+
+def event_keys(event, hourly_since):
+    """The (scope, scope_id, period, bucket) rows an event counts towards."""
+    moment = event['occurred_at']
+    day = bucket_start(moment, Rollup.DAY)
+    hour = bucket_start(moment, Rollup.HOUR) if moment >= hourly_since else None
+    scopes = [(Rollup.PLATFORM, 0)]
+    if event['farm_id']:
+        scopes.append((Rollup.FARMER, event['farm_id']))
+    if event['category_id']:
+        scopes.append((Rollup.CATEGORY, event['category_id']))
+    for scope, scope_id in scopes:
+        yield scope, scope_id, Rollup.DAY, day
+        if hour is not None:
+            yield scope, scope_id, Rollup.HOUR, hour
+    yield Rollup.PRODUCT, event['product_id'], Rollup.DAY, day
+
+
+def aggregate(events, hourly_since):
+    totals = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    for event in events:
+        deltas = event_deltas(event)
+        for key in event_keys(event, hourly_since):
+            row = totals[key]
+            for metric, delta in deltas.items():
+                row[metric] += delta
+    return totals
+
+
+def upsert(totals):
+    """Add `totals` ({key: {metric: delta}}) onto the rollup rows."""
+    if not totals:
+        return
+    bucket_field = Rollup._meta.get_field('bucket')
+    params = [
+        [scope, scope_id, period, bucket_field.get_db_prep_value(bucket, connection),
+         *(row[metric] for metric in METRICS)]
+        for (scope, scope_id, period, bucket), row in totals.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(UPSERT_SQL, params)
+
+
+def _roll_up_batch(batch_size):
+    cursor, _ = RollupCursor.objects.get_or_create(name=CURSOR_NAME)
+    events = list(
+        ProductEvent.objects.filter(id__gt=cursor.last_event_id).order_by('id').values(*EVENT_FIELDS)[:batch_size]
+    )
+    if not events:
+        return 0
+    upsert(aggregate(events, hourly_cutoff()))
+    cursor.last_event_id = events[-1]['id']
+    cursor.save(update_fields=['last_event_id', 'updated_at'])
+    return len(events)
+
+
+def roll_up(batch_size=None, log=None):
+    """Fold every event after the cursor into the rollups; returns how many."""
+    batch_size = batch_size or settings.ANALYTICS_BATCH_SIZE
+    total = 0
+    while True:
+        processed = run_write(lambda: _roll_up_batch(batch_size))
+        if not processed:
+            return total
+        total += processed
+        if log:
+            log(f'{total:,} event(s) rolled up')
+
+
+def prune_hourly(now=None):
+    """Delete hourly rows older than ANALYTICS_HOURLY_DAYS."""
+    deleted, _ = Rollup.objects.filter(period=Rollup.HOUR, bucket__lt=hourly_cutoff(now)).delete()
+    return deleted
+
+
+def _rebuild_range(start, end, batch_size):
+    cursor, _ = RollupCursor.objects.get_or_create(name=CURSOR_NAME)
+    Rollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+    # Events past the cursor are left to roll_up(), which adds them on top.
+    events = (
+        ProductEvent.objects.filter(occurred_at__gte=start, occurred_at__lt=end, id__lte=cursor.last_event_id)
+        .order_by('id')
+        .values(*EVENT_FIELDS)
+    )
+    totals = aggregate(events.iterator(chunk_size=batch_size), hourly_cutoff())
+    upsert(totals)
+    return len(totals)
+
+
+def rebuild(since, until, chunk_days=7, batch_size=None, log=None):
+    """
+    Recompute the rollups for the days from `since` up to (not including)
+    `until` from the event log, `chunk_days` days per write transaction.
+    Returns the number of rows written.
+    """
+    batch_size = batch_size or settings.ANALYTICS_BATCH_SIZE
+    zone = zoneinfo.ZoneInfo(settings.ANALYTICS_TIME_ZONE)
+    start = datetime.combine(since, time(), zone)
+    end_of_range = datetime.combine(until, time(), zone)
+    written = 0
+    while start < end_of_range:
+        end = min(start + timedelta(days=chunk_days), end_of_range)
+        written += run_write(lambda: _rebuild_range(start, end, batch_size))
+        if log:
+            log(f'{start:%Y-%m-%d} to {end:%Y-%m-%d}: {written:,} row(s)')
+        start = end
+    return written
+
+
+def record_listing_history(batch_size=None, log=None):
+    """
+    Log a `created` event, stamped with the product's created_at, for every
+    product listed before the event log existed. Returns how many.
+    """
+    batch_size = batch_size or settings.ANALYTICS_BATCH_SIZE
+    logged = ProductEvent.objects.filter(kind=ProductEvent.CREATED).values('product_id')
+    last_pk, total = 0, 0
+    while True:
+        products = list(
+            Product.objects.filter(pk__gt=last_pk).exclude(pk__in=logged).order_by('pk')
+            .values('pk', 'farm_id', 'category_id', 'stock_quantity', 'created_at')[:batch_size]
+        )
+        if not products:
+            return total
+        run_write(lambda: ProductEvent.objects.bulk_create([
+            ProductEvent(
+                kind=ProductEvent.CREATED, product_id=product['pk'], farm_id=product['farm_id'],
+                category_id=product['category_id'], quantity=product['stock_quantity'],
+                occurred_at=product['created_at'],
+            )
+            for product in products
+        ]))
+        total += len(products)
+        last_pk = products[-1]['pk']
+        if log:
+            log(f'{total:,} listing(s) recorded')
+
+
+# Reading rollups -----------------------------------------------------------
+
+def _metric_sums(prefix, condition=None):
+    return {f'{prefix}{metric}': Coalesce(Sum(metric, filter=condition), 0) for metric in METRICS}
+
+
+def totals(scope, scope_id=0, windows=None, now=None):
+    """
+    Summed daily metrics for one scope: all time under 'all', and under each
+    name in `windows` ({name: days}) the last that many days including today.
+    Each also carries `revenue` in naira.
+    """
+    today = bucket_start(now or timezone.now(), Rollup.DAY)
+    sums = _metric_sums('all__')
+    for name, days in (windows or {}).items():
+        sums.update(_metric_sums(f'{name}__', Q(bucket__gte=today - timedelta(days=days - 1))))
+    row = Rollup.objects.filter(scope=scope, scope_id=scope_id, period=Rollup.DAY).aggregate(**sums)
+    result = defaultdict(dict)
+    for key, value in row.items():
+        name, metric = key.split('__')
+        result[name][metric] = value
+    for sums in result.values():
+        sums['revenue'] = Decimal(sums['revenue_kobo']) / 100
+    return dict(result)
+
+
+def series(scope, scope_id=0, period=Rollup.DAY, count=30, now=None):
+    """
+    The last `count` buckets (oldest first, the current one last) with
+    every metric and `revenue` in naira, empty buckets included.
+    """
+    step = timedelta(days=1) if period == Rollup.DAY else timedelta(hours=1)
+    current = bucket_start(now or timezone.now(), period)
+    buckets = [current - step * n for n in range(count - 1, -1, -1)]
+    rows = {
+        row['bucket']: row
+        for row in Rollup.objects.filter(
+            scope=scope, scope_id=scope_id, period=period, bucket__gte=buckets[0]
+        ).values('bucket', *METRICS)
+    }
+    points = []
+    for bucket in buckets:
+        point = {'bucket': bucket, **{metric: rows.get(bucket, {}).get(metric, 0) for metric in METRICS}}
+        point['revenue'] = Decimal(point['revenue_kobo']) / 100
+        points.append(point)
+    return points
+
+
+def leaders(scope, metric='units_sold', days=30, limit=5, now=None, scope_ids=None):
+    """
+    [(scope_id, total)] for the top `limit` of a scope over the last `days`
+    days, among `scope_ids` (ids or a single-column queryset) if given.
+    """
+    since = bucket_start(now or timezone.now(), Rollup.DAY) - timedelta(days=days - 1)
+    rollups = Rollup.objects.filter(scope=scope, period=Rollup.DAY, bucket__gte=since)
+    if scope_ids is not None:
+        rollups = rollups.filter(scope_id__in=scope_ids)
+    return list(
+        rollups
+        .values('scope_id')
+        .annotate(total=Sum(metric))
+        .filter(total__gt=0)
+        .order_by('-total', 'scope_id')
+        .values_list('scope_id', 'total')[:limit]
+    )
@@ -0,0 +1,355 @@
+"""
+Read-only JSON catalogue API for the field agents' mobile app.
+
+    GET /api/v1/products/?category=<slug>&farmer=<slug>&status=in_stock&organic=1
+    GET /api/v1/products/<slug>/
+    GET /api/v1/categories/
+    GET /api/v1/farmers/
+
+Every endpoint takes `?fields=a,b,c` to pick from the resource's FIELDS;
+lists default to a compact subset. Product and farmer lists are keyset
+paginated in (-created_at, id) order like the marketplace: pass `limit`
+(at most MAX_LIMIT) and feed the returned `next` back as `cursor`.
+
+Rows are read with .values().iterator(), only the columns asked for and no
+model instances, STREAM_CHUNK at a time while the response streams out as
+JSON through gzip or brotli, so a page is never held in memory whole.
+Product lists that ask only for card fields read the narrow ProductListing
+table instead of Product. The view picks the database alias, so replica
+routing still applies, but the row queries run after it returns: query
+instrumentation and request metrics do not see them.
+"""
+import json
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from core.compression import compress_response
+from farmers.models import Farmer
+from . import imaging
+from .conditional import marketplace_cache
+from .models import AVAILABILITY_STATUS_CHOICES, Category, Product, ProductImage, ProductListing
+from .pagination import InvalidCursor, make_cursor, seek
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+STREAM_CHUNK = 50
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Resource:
+    """
+    `fields` maps each public name to the .values() lookup that reads it.
+    `transforms` post-process a field's value (e.g. file name -> URL); they
+    are called with the request, the value and the row's .values() dict,
+    which also holds any lookups listed for the field in `requires`.
+    Names in `annotations` are aggregated only when asked for, and names in
+    `computed` are filled in per page by `add_computed(request, rows, names)`.
+    """
+
+    def __init__(
+        self, queryset, fields, list_fields, transforms=None, requires=None, annotations=None, computed=(),
+        add_computed=None,
+    ):
+        self.queryset = queryset
+        self.fields = fields
+        self.list_fields = list_fields
+        self.transforms = transforms or {}
+        self.requires = requires or {}
+        self.annotations = annotations or {}
+        self.computed = list(computed)
+        self.add_computed = add_computed
+
+    @property
+    def names(self):
+        return [*self.fields, *self.annotations, *self.computed]
+
+    def parse_fields(self, request, default):
+        raw = request.GET.get('fields')
+        if not raw:
+            return list(default)
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.names]
+        if unknown:
+            raise ApiError(f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(self.names)}.')
+        return names
+
+    def rows(self, request, queryset, names, limit=None, page=None):
+        """
+        Generate the requested columns (plus the keyset columns) as
+        {public name: value} dicts, reading STREAM_CHUNK rows at a time. With
+        a `limit`, one extra row is read to see whether there is a next page,
+        and page['next'] holds its cursor once the rows are exhausted.
+        """
+        annotations = {name: self.annotations[name] for name in names if name in self.annotations}
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        lookups = {self.fields[name] for name in names if name in self.fields}
+        lookups.update(lookup for name in names for lookup in self.requires.get(name, ()))
+        lookups |= set(annotations) | {'id', 'created_at'}
+        if limit is not None:
+            queryset = queryset[:limit + 1]
+        # Route now: the rows are read after the view (and the request's
+        # replica routing) has returned.
+        values = queryset.values(*lookups).using(queryset.db)
+
+        def generate():
+            chunk, last = [], None
+            for index, value in enumerate(values.iterator(chunk_size=STREAM_CHUNK)):
+                if limit is not None and index == limit:
+                    page['next'] = make_cursor(last['created_at'], last['id'])
+                    break
+                chunk.append(value)
+                last = value
+                if len(chunk) == STREAM_CHUNK:
+                    yield from self.build(request, chunk, names, annotations)
+                    chunk = []
+            yield from self.build(request, chunk, names, annotations)
+
+        return generate()
+
+    def build(self, request, values, names, annotations):
+        rows = []
+        for value in values:
+            row = {}
+            for name in names:
+                if name in self.fields:
+                    row[name] = value[self.fields[name]]
+                    if name in self.transforms:
+                        row[name] = self.transforms[name](request, row[name], value)
+                elif name in annotations:
+                    row[name] = value[name]
+            row['_id'] = value['id']
+            rows.append(row)
+        if rows and self.add_computed and any(name in self.computed for name in names):
+            self.add_computed(request, rows, names)
+        for row in rows:
+            del row['_id']
+        return rows
+
+
+def media_url(request, name, rendition=None, derivatives=False):
+    """
+    Absolute URL of a stored image, or of its `rendition` when the row says
+    its derivatives have been built.
+    """
+    if not name:
+        return None
+    if rendition and derivatives:
+        name = imaging.derivative_name(name, rendition, 'jpeg')
+    return request.build_absolute_uri(default_storage.url(name))
+
+
+def add_product_images(request, rows, names):
+    """One query for the page's images; the primary one becomes the thumbnail."""
+    images = {}
+    for product_id, name, derivatives in (
+        ProductImage.objects.filter(product_id__in=[row['_id'] for row in rows])
+        .order_by('product_id', '-is_primary', 'order', 'id')
+        .values_list('product_id', 'image', 'has_derivatives')
+    ):
+        images.setdefault(product_id, []).append((name, derivatives))
+    for row in rows:
+        images_for_row = images.get(row['_id'], [])
+        if 'thumbnail' in names:
+            first = images_for_row[0] if images_for_row else (None, False)
+            row['thumbnail'] = media_url(request, first[0], 'thumb', first[1])
+        if 'images' in names:
+            row['images'] = [media_url(request, name) for name, _ in images_for_row]
+
+
+def add_category_icons(request, rows, names):
+    icons = {
+        pk: (icon, derivatives)
+        for pk, icon, derivatives in Category.objects.filter(pk__in=[row['_id'] for row in rows])
+        .values_list('pk', 'icon', 'icon_has_derivatives')
+    }
+    for row in rows:
+        icon, derivatives = icons.get(row['_id'], (None, False))
+        row['icon'] = media_url(request, icon, 'thumb', derivatives)
+
+
+PRODUCTS = Resource(
+    Product.objects.all(),
+    fields={
+        'id': 'id',
+        'slug': 'slug',
+        'name': 'name',
+        'description': 'description',
+        'price': 'price',
+        'unit': 'unit',
+        'unit_type': 'unit_type',
+        'availability_status': 'availability_status',
+        'stock_quantity': 'stock_quantity',
+        'harvest_date': 'harvest_date',
+        'expiry_date': 'expiry_date',
+        'farm_location': 'farm_location',
+        'organic_certified': 'organic_certified',
+        'category': 'category__slug',
+        'farmer': 'farm__slug',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    },
+    list_fields=['id', 'slug', 'name', 'price', 'unit_type', 'availability_status', 'category', 'thumbnail'],
+    computed=['thumbnail', 'images'],
+    add_computed=add_product_images,
+)
+
+# The card fields of PRODUCTS, served from the ProductListing read model.
+LISTINGS = Resource(
+    ProductListing.objects.all(),
+    fields={
+        'id': 'id',
+        'slug': 'slug',
+        'name': 'name',
+        'price': 'price',
+        'unit': 'unit',
+        'unit_type': 'unit_type',
+        'availability_status': 'availability_status',
+        'stock_quantity': 'stock_quantity',
+        'organic_certified': 'organic_certified',
+        'category': 'category_slug',
+        'farmer': 'farm_slug',
+        'created_at': 'created_at',
+        'thumbnail': 'thumbnail',
+    },
+    list_fields=PRODUCTS.list_fields,
+    transforms={
+        'thumbnail': lambda request, name, values: media_url(
+            request, name, 'thumb', values['thumbnail_has_derivatives']
+        ),
+    },
+    requires={'thumbnail': ['thumbnail_has_derivatives']},
+)
+
+CATEGORIES = Resource(
+    Category.objects.filter(is_active=True),
+    fields={'id': 'id', 'slug': 'slug', 'name': 'name', 'description': 'description'},
+    list_fields=['id', 'slug', 'name'],
+    annotations={'product_count': Coalesce('stats__product_count', 0)},
+    computed=['icon'],
+    add_computed=add_category_icons,
+)
+
+FARMERS = Resource(
+    Farmer.objects.all(),
+    fields={
+        'id': 'id',
+        'slug': 'slug',
+        'name': 'farm_name',
+        'location': 'farm_location',
+        'created_at': 'created_at',
+    },
+    list_fields=['id', 'slug', 'name', 'location'],
+    annotations={'product_count': Coalesce('stats__product_count', 0)},
+)
+
+
+def stream_json(rows, extra):
+    """
+    StreamingHttpResponse writing {"results": [...], **extra} a chunk of rows
+    at a time. `extra` is read once the rows are exhausted, so the row
+    generator may still fill it in.
+    """
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    def generate():
+        yield '{"results":['
+        chunk, separator = [], ''
+        for row in rows:
+            chunk.append(encoder.encode(row))
+            if len(chunk) == STREAM_CHUNK:
+                yield separator + ','.join(chunk)
+                chunk, separator = [], ','
+        if chunk:
+            yield separator + ','.join(chunk)
+        yield ']'
+        for key, value in extra.items():
+            yield f',{json.dumps(key)}:{encoder.encode(value)}'
+        yield '}'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
+
+
+def api_view(view):
+    """GET only, JSON errors, cache headers for anonymous clients, compressed."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'error': str(exc)}, status=exc.status)
+
+    return require_GET(compress_response(marketplace_cache(wrapped)))
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be an integer.')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def keyset_page(request, resource, queryset, names=None):
+    if names is None:
+        names = resource.parse_fields(request, resource.list_fields)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            queryset = seek(queryset, cursor)
+        except InvalidCursor:
+            raise ApiError('Invalid cursor.')
+    else:
+        queryset = queryset.order_by('-created_at', 'id')
+    page = {'next': None}
+    return stream_json(resource.rows(request, queryset, names, parse_limit(request), page), page)
+
+
+@api_view
+def products(request):
+    names = PRODUCTS.parse_fields(request, PRODUCTS.list_fields)
+    resource = LISTINGS if set(names) <= set(LISTINGS.names) else PRODUCTS
+    # Both tables carry category_id and farm_id, so the filters are shared.
+    queryset = resource.queryset
+    if request.GET.get('category'):
+        queryset = queryset.filter(category_id__in=Category.objects.filter(slug=request.GET['category']).values('pk'))
+    if request.GET.get('farmer'):
+        queryset = queryset.filter(farm_id__in=Farmer.objects.filter(slug=request.GET['farmer']).values('pk'))
+    status = request.GET.get('status')
+    if status:
+        if status not in dict(AVAILABILITY_STATUS_CHOICES):
+            raise ApiError(f'Unknown status "{status}".')
+        queryset = queryset.filter(availability_status=status)
+    if request.GET.get('organic') in ('0', '1'):
+        queryset = queryset.filter(organic_certified=request.GET['organic'] == '1')
+    return keyset_page(request, resource, queryset, names)
+
+
+@api_view
+def product(request, slug):
+    names = PRODUCTS.parse_fields(request, [*PRODUCTS.fields, 'thumbnail', 'images'])
+    rows = list(PRODUCTS.rows(request, PRODUCTS.queryset.filter(slug=slug), names))
+    if not rows:
+        raise ApiError('Product not found.', status=404)
+    return JsonResponse(rows[0])
+
+
+@api_view
+def categories(request):
+    names = CATEGORIES.parse_fields(request, CATEGORIES.list_fields)
+    return stream_json(CATEGORIES.rows(request, CATEGORIES.queryset.order_by('name'), names), {'next': None})
+
+
+@api_view
+def farmers(request):
+    return keyset_page(request, FARMERS, FARMERS.queryset)
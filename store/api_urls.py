@@ -0,0 +1,12 @@
+from django.urls import path
+from . import api, sync
+
+app_name = 'api'
+
+urlpatterns = [
+    path('products/', api.products, name='products'),
+    path('products/<slug:slug>/', api.product, name='product'),
+    path('categories/', api.categories, name='categories'),
+    path('farmers/', api.farmers, name='farmers'),
+    path('sync/', sync.sync, name='sync'),
+]
@@ -0,0 +1,164 @@
+"""
+Materialized counters: CategoryStats and FarmerStats.
+
+Every product contributes to its category's and its farmer's counters. A
+write turns into signed contributions — +1 for a new product, -1 for a
+deleted one, -1 for the old state and +1 for the new on an edit — which are
+netted per counter row and applied as `F()` increments, so concurrent
+writers never overwrite each other and an edit that touches no counted
+column writes nothing. The increments run in the caller's transaction
+(write views and the admin save inside one), so they commit or roll back
+with the product.
+
+Rows are created on a counter's first product. `reconcile()` recomputes
+everything from store_product for the `reconcile_counters` command.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Count, F, Q, Sum
+from django.db.models.functions import Cast, Round
+
+from .models import CategoryStats, FarmerStats, Product
+
+# The product columns the counters depend on.
+COUNTED_FIELDS = ('category_id', 'farm_id', 'availability_status', 'stock_quantity', 'price')
+
+CATEGORY_COUNTERS = ('product_count', 'in_stock_count')
+FARMER_COUNTERS = ('product_count', 'in_stock_count', 'total_stock', 'stock_value_kobo')
+
+
+def snapshot(product):
+    """The counted columns of a Product instance."""
+    return {field: getattr(product, field) for field in COUNTED_FIELDS}
+
+
+def load_snapshot(product_id):
+    """The counted columns as currently stored, or None."""
+    return Product.objects.filter(pk=product_id).values(*COUNTED_FIELDS).first()
+
+
+def to_kobo(price):
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+def apply(changes):
+    """
+    Apply `changes`, an iterable of (snapshot, sign) pairs, as one F()
+    update per affected counter row.
+    """
+    categories = defaultdict(lambda: dict.fromkeys(CATEGORY_COUNTERS, 0))
+    farmers = defaultdict(lambda: dict.fromkeys(FARMER_COUNTERS, 0))
+    for row, sign in changes:
+        in_stock = sign if row['availability_status'] == 'in_stock' else 0
+        if row['category_id']:
+            deltas = categories[row['category_id']]
+            deltas['product_count'] += sign
+            deltas['in_stock_count'] += in_stock
+        if row['farm_id']:
+            stock = row['stock_quantity'] or 0
+            deltas = farmers[row['farm_id']]
+            deltas['product_count'] += sign
+            deltas['in_stock_count'] += in_stock
+            deltas['total_stock'] += sign * stock
+            deltas['stock_value_kobo'] += sign * stock * to_kobo(row['price'])
+
+    for pk, deltas in categories.items():
+        _bump(CategoryStats, pk, deltas)
+    for pk, deltas in farmers.items():
+        _bump(FarmerStats, pk, deltas)
+
+
+def _bump(model, pk, deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(pk=pk).update(**increments):
+        return
+    # No row yet. Only a counter gaining a product starts one: a missing row
+    # during a cascade delete means the owner itself is going away.
+    if deltas.get('product_count', 0) <= 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**{model._meta.pk.attname: pk}, **deltas)
+    except IntegrityError:
+        # Another writer created it first.
+        model.objects.filter(pk=pk).update(**increments)
+
+
+def count_products(products, sign=1):
+    """Count (or with sign=-1, uncount) bulk-inserted Product instances."""
+    apply((snapshot(product), sign) for product in products)
+
+
+def record_save(before, product):
+    """After a save: `before` is the stored snapshot, None for a new product."""
+    changes = [(snapshot(product), 1)]
+    if before is not None:
+        changes.append((before, -1))
+    apply(changes)
+
+
+def record_delete(product):
+    apply([(snapshot(product), -1)])
+
+
+def category_totals():
+    return {
+        row.pop('category_id'): row
+        for row in Product.objects.filter(category__isnull=False).order_by()
+        .values('category_id')
+        .annotate(
+            product_count=Count('id'),
+            in_stock_count=Count('id', filter=Q(availability_status='in_stock')),
+        )
+    }
+
+
+def farmer_totals():
+    return {
+        row.pop('farm_id'): row
+        for row in Product.objects.filter(farm__isnull=False).order_by()
+        .values('farm_id')
+        .annotate(
+            product_count=Count('id'),
+            in_stock_count=Count('id', filter=Q(availability_status='in_stock')),
+            total_stock=Sum('stock_quantity', default=0),
+            stock_value_kobo=Cast(
+                Sum(Round(F('price') * 100) * F('stock_quantity'), default=0), BigIntegerField()
+            ),
+        )
+    }
+
+
+def reconcile(dry_run=False):
+    """
+    Recompute every counter from store_product and, unless `dry_run`,
+    overwrite the rows that drifted. Returns {model: [(pk, stored, actual)]}
+    for the drifted rows; `stored` is None for a missing row.
+    """
+    drift = {}
+    for model, counters, actual in (
+        (CategoryStats, CATEGORY_COUNTERS, category_totals()),
+        (FarmerStats, FARMER_COUNTERS, farmer_totals()),
+    ):
+        zero = dict.fromkeys(counters, 0)
+        stored = {row.pop('pk'): row for row in model.objects.values('pk', *counters)}
+        rows = []
+        for pk in sorted(stored.keys() | actual.keys()):
+            expected = {field: int(value) for field, value in actual.get(pk, zero).items()}
+            if stored.get(pk) != expected:
+                rows.append((pk, stored.get(pk), expected))
+        drift[model] = rows
+        if dry_run or not rows:
+            continue
+        model.objects.bulk_create(
+            [model(**{model._meta.pk.attname: pk}, **expected) for pk, _, expected in rows],
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=[*counters, 'updated_at'],
+        )
+    return drift
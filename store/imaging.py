@@ -0,0 +1,122 @@
+"""
+Fixed-size image renditions for product photos, category icons and profile
+pictures.
+
+Every upload gets a small `thumb` and a `card` rendition in both WebP and
+JPEG, stored next to the media tree under `derivatives/`:
+
+    products/banana1.jpeg -> derivatives/products/banana1.card.webp
+
+Names are derived from the original path alone, so templates can build the
+`srcset` from the stored name. Whether the renditions exist is recorded on
+the row (ProductImage.has_derivatives and friends) when they are built, so
+rendering never checks the storage.
+"""
+import io
+import os
+from pathlib import PurePosixPath
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+DERIVATIVES_DIR = 'derivatives'
+
+# name -> (width, height); images are cropped to fill the box.
+RENDITIONS = {
+    'thumb': (160, 160),
+    'card': (480, 400),
+}
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 78, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True},
+}
+
+
+def derivative_name(name, rendition, fmt):
+    path = PurePosixPath(name)
+    return str(PurePosixPath(DERIVATIVES_DIR) / path.parent / f'{path.stem}.{rendition}.{fmt}')
+
+
+def render_derivatives(fp):
+    """
+    Decode the image in `fp` once and return {(rendition, fmt): bytes} for
+    every rendition/format pair. Raises ValueError if `fp` is not an image.
+    """
+    try:
+        with Image.open(fp) as original:
+            # Let the JPEG decoder downscale large phone photos while decoding.
+            largest = max(RENDITIONS.values())
+            original.draft('RGB', (largest[0] * 2, largest[1] * 2))
+            source = ImageOps.exif_transpose(original)
+            if source.mode in ('RGBA', 'LA', 'P'):
+                converted = source.convert('RGBA')
+                source = Image.new('RGB', converted.size, (255, 255, 255))
+                source.paste(converted, mask=converted.getchannel('A'))
+            elif source.mode != 'RGB':
+                source = source.convert('RGB')
+
+            rendered = {}
+            for rendition, size in RENDITIONS.items():
+                fitted = ImageOps.fit(source, size, Image.Resampling.LANCZOS)
+                for fmt, options in FORMATS.items():
+                    buffer = io.BytesIO()
+                    fitted.save(buffer, **options)
+                    rendered[(rendition, fmt)] = buffer.getvalue()
+            return rendered
+    except (UnidentifiedImageError, OSError) as exc:
+        raise ValueError(f'Cannot build derivatives: {exc}') from exc
+
+
+def has_derivatives(name, storage=default_storage):
+    return storage.exists(derivative_name(name, 'card', 'jpeg'))
+
+
+def generate_derivatives(name, storage=default_storage, force=False):
+    """
+    Build the renditions for a stored file. Returns the derivative names
+    written, or an empty list if they already existed (unless `force`).
+    """
+    if not name or (not force and has_derivatives(name, storage)):
+        return []
+    with storage.open(name, 'rb') as fp:
+        rendered = render_derivatives(fp)
+
+    written = []
+    for (rendition, fmt), data in rendered.items():
+        target = derivative_name(name, rendition, fmt)
+        if storage.exists(target):
+            storage.delete(target)
+        written.append(storage.save(target, ContentFile(data)))
+    return written
+
+
+def delete_derivatives(name, storage=default_storage):
+    """Remove the renditions of `name`, e.g. after the original was replaced or deleted."""
+    if not name:
+        return
+    for rendition in RENDITIONS:
+        for fmt in FORMATS:
+            target = derivative_name(name, rendition, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+
+
+def generate_derivatives_for_path(media_root, relative_name, force=False):
+    """
+    Filesystem-only variant used by the backfill command's worker processes,
+    which do not need storage or ORM access.
+    """
+    if not force and os.path.exists(os.path.join(media_root, derivative_name(relative_name, 'card', 'jpeg'))):
+        return relative_name, 0
+    with open(os.path.join(media_root, relative_name), 'rb') as fp:
+        rendered = render_derivatives(fp)
+    for (rendition, fmt), data in rendered.items():
+        target = os.path.join(media_root, derivative_name(relative_name, rendition, fmt))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.tmp'
+        with open(tmp, 'wb') as out:
+            out.write(data)
+        os.replace(tmp, target)
+    return relative_name, len(rendered)
@@ -0,0 +1,67 @@
+"""
+The ProductListing read model: one narrow row per product with exactly what
+a product card shows.
+
+Rows are (re)built in SQL straight from `store_product` and its joins, so a
+refresh is two statements however many products it covers: delete the old
+rows, insert the new ones from a SELECT. The signal handlers in
+`store.signals` refresh the products touched by a save or delete; bulk
+loaders that skip signals call `refresh_listings` themselves.
+"""
+from django.db import connection, transaction
+
+from .models import Product, ProductListing
+
+TABLE = ProductListing._meta.db_table
+
+COLUMNS = (
+    'id', 'name', 'slug', 'price', 'unit', 'unit_type', 'stock_quantity', 'availability_status',
+    'organic_certified', 'thumbnail', 'thumbnail_has_derivatives', 'category_id', 'category_slug', 'farm_id', 'farm_slug',
+    'farm_name', 'location', 'created_at',
+)
+
+# The thumbnail is the primary image, else the first in display order; the
+# location is the product's own, else its farm's.
+SELECT_SQL = f"""
+SELECT p.id, p.name, p.slug, p.price, p.unit, p.unit_type, p.stock_quantity, p.availability_status,
+       p.organic_certified, COALESCE(i.image, ''), COALESCE(i.has_derivatives, 0),
+       p.category_id, COALESCE(c.slug, ''), p.farm_id, COALESCE(f.slug, ''), COALESCE(f.farm_name, ''),
+       COALESCE(NULLIF(p.farm_location, ''), f.farm_location, ''),
+       p.created_at
+FROM store_product p
+LEFT JOIN store_productimage i ON i.id = (
+    SELECT t.id FROM store_productimage t
+    WHERE t.product_id = p.id
+    ORDER BY t.is_primary DESC, t."order", t.id
+    LIMIT 1
+)
+LEFT JOIN store_category c ON c.id = p.category_id
+LEFT JOIN farmers_farmer f ON f.id = p.farm_id
+"""
+
+INSERT_SQL = f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) {SELECT_SQL}"
+
+
+def refresh_listings(products):
+    """Rebuild the listings of every product in the Product queryset `products`."""
+    subquery, params = products.order_by().values('pk').query.sql_with_params()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE id IN ({subquery})", params)
+        cursor.execute(f"{INSERT_SQL} WHERE p.id IN ({subquery})", params)
+
+
+def refresh_listing(product_id):
+    refresh_listings(Product.objects.filter(pk=product_id))
+
+
+def remove_listing(product_id):
+    ProductListing.objects.filter(pk=product_id).delete()
+
+
+def rebuild_listings():
+    """Repopulate the whole table in one transaction; returns the row count."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(INSERT_SQL)
+        cursor.execute(f"SELECT count(*) FROM {TABLE}")
+        return cursor.fetchone()[0]
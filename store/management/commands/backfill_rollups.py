@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from store import analytics
+from store.models import ProductEvent, Rollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Backfill the analytics rollups: optionally log listing events for products that predate the '
+        'event log, catch up with the log, then recompute a date range a few days per transaction'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--record-listings',
+            action='store_true',
+            help='First log a "created" event for every product that has none'
+        )
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='First day to recompute, YYYY-MM-DD (defaults to the oldest event)'
+        )
+        parser.add_argument(
+            '--until',
+            type=date.fromisoformat,
+            help='Day to stop before, YYYY-MM-DD (defaults to tomorrow)'
+        )
+        parser.add_argument('--chunk-days', type=int, default=7, help='Days recomputed per transaction')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ANALYTICS_BATCH_SIZE,
+            help='Rows written or events read per batch'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--chunk-days and --batch-size must be at least 1')
+
+        if options['record_listings']:
+            recorded = analytics.record_listing_history(options['batch_size'], log=self.stdout.write)
+            self.stdout.write(f'Logged {recorded} listing event(s).')
+
+        processed = analytics.roll_up(options['batch_size'], log=self.stdout.write)
+        self.stdout.write(f'Rolled up {processed} new event(s).')
+
+        since = options['since']
+        if since is None:
+            oldest = ProductEvent.objects.aggregate(oldest=Min('occurred_at'))['oldest']
+            if oldest is None:
+                self.stdout.write(self.style.SUCCESS('No events to backfill.'))
+                return
+            since = analytics.bucket_start(oldest, Rollup.DAY).date()
+        until = options['until'] or analytics.bucket_start(timezone.now(), Rollup.DAY).date() + timedelta(days=1)
+        if since >= until:
+            raise CommandError('--since must be before --until')
+
+        written = analytics.rebuild(
+            since, until, chunk_days=options['chunk_days'], batch_size=options['batch_size'], log=self.stdout.write
+        )
+        pruned = analytics.prune_hourly()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {written} rollup row(s) from {since} to {until}; pruned {pruned} expired hourly row(s).'
+        ))
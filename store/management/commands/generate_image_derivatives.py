@@ -0,0 +1,96 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import run_write
+from store import imaging
+from store.models import Category, ProductImage
+from store.signals import record_derivatives
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+FLAG_BATCH = 500
+
+
+def _render(media_root, name, force):
+    try:
+        return imaging.generate_derivatives_for_path(media_root, name, force) + (None,)
+    except (ValueError, OSError) as exc:
+        return name, 0, str(exc)
+
+
+class Command(BaseCommand):
+    help = 'Backfill thumb/card WebP and JPEG derivatives for uploaded images using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            dest='dirs',
+            action='append',
+            help='Media sub-directory to scan (repeatable). Defaults to products and categories.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate derivatives that already exist'
+        )
+
+    def iter_sources(self, media_root, dirs):
+        for directory in dirs:
+            root = os.path.join(media_root, directory)
+            if not os.path.isdir(root):
+                self.stdout.write(self.style.WARNING(f'Skipping missing directory {root}'))
+                continue
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                        yield os.path.relpath(os.path.join(dirpath, filename), media_root).replace(os.sep, '/')
+
+    def handle(self, *args, **options):
+        media_root = str(settings.MEDIA_ROOT)
+        dirs = options['dirs'] or ['products', 'categories']
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        names = list(self.iter_sources(media_root, dirs))
+        self.stdout.write(f'Found {len(names)} image(s) in {", ".join(dirs)}.')
+
+        started = time.monotonic()
+        built = skipped = failed = 0
+        ready = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [pool.submit(_render, media_root, name, options['force']) for name in names]
+            for future in as_completed(futures):
+                name, written, error = future.result()
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'  ✗ {name}: {error}'))
+                elif written:
+                    built += 1
+                    ready.append(name)
+                    self.stdout.write(f'  ✓ {name}')
+                else:
+                    skipped += 1
+                    ready.append(name)
+
+        flagged = 0
+        for start in range(0, len(ready), FLAG_BATCH):
+            flagged += run_write(lambda: self.record_derivatives(ready[start:start + FLAG_BATCH]))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {built}, skipped {skipped} up-to-date, {failed} failed in {elapsed:.1f}s '
+            f'with {options["workers"]} worker(s); marked {flagged} row(s) as having derivatives.'
+        ))
+
+    def record_derivatives(self, names):
+        """Set the derivative flags of the rows using `names` (pages read the flags, not the storage)."""
+        return record_derivatives(ProductImage, names) + record_derivatives(Category, names)
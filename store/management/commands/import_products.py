@@ -0,0 +1,203 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from core.slugs import assign_slugs
+from farmers.models import Farmer
+from store import analytics, counters, listings, search
+from store.forms import AddProductForm
+from store.models import Category, Product, ProductImage
+
+# Columns validated with the AddProductForm field definitions.
+FORM_FIELDS = [
+    'name', 'description', 'price', 'unit', 'unit_type', 'availability_status',
+    'stock_quantity', 'harvest_date', 'expiry_date', 'farm_location',
+    'organic_certified', 'storage_instructions', 'usage_instructions',
+]
+
+def read_rows(path, fmt):
+    """Yield (line_number, row dict) without loading the whole file."""
+    with open(path, newline='', encoding='utf-8-sig') as fp:
+        if fmt == 'csv':
+            reader = csv.DictReader(fp)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(fp, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield line_number, {'__error__': f'invalid JSON: {exc}'}
+                    continue
+                yield line_number, row if isinstance(row, dict) else {'__error__': 'expected a JSON object'}
+
+
+class Command(BaseCommand):
+    help = 'Stream products from a CSV or JSONL file into the store in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format (defaults to the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows validated and inserted per transaction'
+        )
+        parser.add_argument(
+            '--farmer',
+            help='Slug or email of the farmer to use for rows without a "farmer" column'
+        )
+        parser.add_argument(
+            '--errors',
+            help='Write rejected rows and their errors to this JSONL file'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate every row without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        self.form_fields = AddProductForm().fields
+        self.categories = {}
+        self.category_names = {}
+        for pk, name, slug in Category.objects.filter(is_active=True).values_list('id', 'name', 'slug'):
+            self.categories[name.lower()] = pk
+            self.categories[slug] = pk
+            self.category_names[pk] = name
+        self.farmers = {}
+        for pk, slug, email in Farmer.objects.values_list('id', 'slug', 'email'):
+            self.farmers[slug] = pk
+            self.farmers[email.lower()] = pk
+
+        self.default_farmer = None
+        if options['farmer']:
+            self.default_farmer = self.farmers.get(options['farmer'].strip().lower())
+            if self.default_farmer is None:
+                raise CommandError(f'Unknown farmer "{options["farmer"]}"')
+
+        error_file = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else None
+
+        imported = rejected = 0
+        started = time.monotonic()
+        rows = read_rows(path, fmt)
+        try:
+            for batch_number, batch in enumerate(iter(lambda: list(islice(rows, batch_size)), []), start=1):
+                created, errors = self.import_batch(batch, options['dry_run'])
+                imported += created
+                rejected += len(batch) - created
+                self.report_batch(batch_number, len(batch), created, errors, error_file)
+        finally:
+            if error_file:
+                error_file.close()
+
+        elapsed = time.monotonic() - started
+        rate = (imported + rejected) / elapsed * 60 if elapsed else 0
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {imported} product(s), rejected {rejected} row(s) in {elapsed:.1f}s ({rate:,.0f} rows/min).'
+        ))
+        if imported and not options['dry_run']:
+            self.stdout.write('Run "manage.py generate_image_derivatives" to build image renditions.')
+
+    def clean_row(self, row):
+        if '__error__' in row:
+            raise ValidationError({'row': [row['__error__']]})
+
+        errors = {}
+        cleaned = {}
+        for name in FORM_FIELDS:
+            value = row.get(name)
+            if isinstance(value, str):
+                value = value.strip()
+            try:
+                cleaned[name] = self.form_fields[name].clean(value)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+
+        category = str(row.get('category') or '').strip()
+        category_id = self.categories.get(category) or self.categories.get(category.lower())
+        if category_id is None:
+            errors['category'] = [f'Unknown or inactive category "{category}".']
+
+        farmer = str(row.get('farmer') or '').strip().lower()
+        farm_id = self.farmers.get(farmer) if farmer else self.default_farmer
+        if farm_id is None:
+            errors['farmer'] = [f'Unknown farmer "{farmer}".' if farmer else 'No farmer given.']
+
+        if errors:
+            raise ValidationError(errors)
+
+        product = Product(category_id=category_id, farm_id=farm_id, **cleaned)
+        # Model-level checks the ModelForm would run (max_length, choices, ...).
+        product.clean_fields(exclude=['slug', 'sku', 'image', 'farm', 'service_provider', 'category'])
+
+        images = row.get('images') or []
+        if isinstance(images, str):
+            images = [name.strip() for name in images.split('|') if name.strip()]
+        return product, images
+
+    def import_batch(self, batch, dry_run):
+        valid = []
+        errors = []
+        for line_number, row in batch:
+            try:
+                valid.append(self.clean_row(row))
+            except ValidationError as exc:
+                errors.append({'line': line_number, 'errors': exc.message_dict})
+
+        if dry_run or not valid:
+            return len(valid), errors
+
+        products = [product for product, _ in valid]
+        try:
+            with transaction.atomic():
+                assign_slugs(products, lambda product: product.name)
+                Product.objects.bulk_create(products)
+                ProductImage.objects.bulk_create([
+                    ProductImage(product=product, image=image, order=order, is_primary=order == 0)
+                    for product, images in valid
+                    for order, image in enumerate(images)
+                ])
+                search.index_new_products(products, self.category_names)
+                listings.refresh_listings(Product.objects.filter(pk__in=[product.pk for product in products]))
+                counters.count_products(products)
+                analytics.log_new_products(products)
+        except IntegrityError as exc:
+            errors.append({'line': batch[0][0], 'errors': {'batch': [f'Batch rolled back: {exc}']}})
+            return 0, errors
+        return len(products), errors
+
+    def report_batch(self, batch_number, size, created, errors, error_file):
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(f'Batch {batch_number}: {created}/{size} row(s) ok, {size - created} rejected'))
+        for error in errors[:10]:
+            details = '; '.join(f'{field}: {", ".join(messages)}' for field, messages in error['errors'].items())
+            self.stdout.write(f'  line {error["line"]}: {details}')
+        if len(errors) > 10:
+            self.stdout.write(f'  ... and {len(errors) - 10} more')
+        if error_file:
+            for error in errors:
+                error_file.write(json.dumps(error) + '\n')
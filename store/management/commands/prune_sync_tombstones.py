@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from store.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete sync tombstones older than the longest a client may stay offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.SYNC_TOMBSTONE_DAYS,
+            help='Keep tombstones this many days; older sync tokens trigger a full resync anyway'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        if options['days'] < settings.SYNC_TOMBSTONE_DAYS:
+            # Clients still holding a younger token would never hear of these deletions.
+            raise CommandError(f'--days must be at least SYNC_TOMBSTONE_DAYS ({settings.SYNC_TOMBSTONE_DAYS}).')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        expired = Tombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=options['days']))
+        deleted = 0
+        while True:
+            pks = list(expired.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            with transaction.atomic():
+                count, _ = Tombstone.objects.filter(pk__in=pks).delete()
+            deleted += count
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstone(s).'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store import listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ProductListing read model from store_product'
+
+    def handle(self, *args, **options):
+        count = listings.rebuild_listings()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} product listing(s).'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the FTS5 product search index from store_product'
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError('Product search requires the SQLite database backend.')
+
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} product(s).'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from core.db import run_write
+from store import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute category and farmer counters from store_product, report drift and fix it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift')
+
+    def handle(self, *args, **options):
+        # One write transaction, so no product write lands between the
+        # recount and the overwrite.
+        drift = run_write(lambda: counters.reconcile(dry_run=options['dry_run']))
+
+        total = 0
+        for model, rows in drift.items():
+            total += len(rows)
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {len(rows)} row(s) drifted')
+            for pk, stored, actual in rows[:20]:
+                changes = ', '.join(
+                    f'{field} {stored.get(field) if stored else "-"} -> {value}'
+                    for field, value in actual.items()
+                    if not stored or stored.get(field) != value
+                )
+                self.stdout.write(f'  {pk}: {changes}')
+
+        if options['dry_run']:
+            self.stdout.write(f'Dry run: {total} counter row(s) would be corrected.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Corrected {total} counter row(s).'))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store import analytics
+
+
+class Command(BaseCommand):
+    help = 'Fold new product events into the hourly/daily analytics rollups (run it every few minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ANALYTICS_BATCH_SIZE,
+            help='Events rolled up per transaction'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        processed = analytics.roll_up(options['batch_size'], log=self.stdout.write)
+        pruned = analytics.prune_hourly()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {processed} event(s); pruned {pruned} expired hourly row(s).'
+        ))
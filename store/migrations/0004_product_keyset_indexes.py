@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmers', '0002_initial'),
+        ('store', '0003_product_unit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['availability_status', '-created_at', 'id'], name='store_produ_availab_a642ee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'availability_status', '-created_at', 'id'], name='store_produ_categor_7ab5b6_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# The index as it stood at this migration; store.search maintains it from here
+# on (and `rebuild_search_index` repopulates it).
+CREATE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5(
+    name,
+    description,
+    farm_location,
+    category_name,
+    category_id UNINDEXED,
+    unit_type UNINDEXED,
+    organic_certified UNINDEXED,
+    availability_status UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+FILL_SQL = """
+INSERT INTO store_product_fts (
+    rowid, name, description, farm_location, category_name,
+    category_id, unit_type, organic_certified, availability_status
+)
+SELECT p.id, p.name, p.description, COALESCE(p.farm_location, ''), COALESCE(c.name, ''),
+       p.category_id, COALESCE(p.unit_type, ''), p.organic_certified, p.availability_status
+FROM store_product p
+LEFT JOIN store_category c ON c.id = p.category_id
+"""
+
+DROP_SQL = "DROP TABLE IF EXISTS store_product_fts"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL([CREATE_SQL, FILL_SQL], reverse_sql=DROP_SQL),
+    ]
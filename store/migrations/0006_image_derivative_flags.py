@@ -0,0 +1,43 @@
+# Generated by Django 5.2.9 on 2026-10-18 20:15
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from store import imaging
+
+
+def record_existing_derivatives(apps, schema_editor):
+    # One storage check per distinct file, now, instead of one per render.
+    for model_name, field, flag in (
+        ('ProductImage', 'image', 'has_derivatives'),
+        ('Category', 'icon', 'icon_has_derivatives'),
+    ):
+        model = apps.get_model('store', model_name)
+        names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).order_by()
+        built = [
+            name for name in names.values_list(field, flat=True).distinct()
+            if imaging.has_derivatives(name, default_storage)
+        ]
+        for start in range(0, len(built), 500):
+            model.objects.filter(**{f'{field}__in': built[start:start + 500]}).update(**{flag: True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_product_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='icon_has_derivatives',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='has_derivatives',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(record_existing_derivatives, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_catalogue_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('image', 'Product image'), ('variant', 'Product variant')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('product_id', models.BigIntegerField()),
+                ('farm_id', models.BigIntegerField(blank=True, null=True)),
+                ('service_provider_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['farm_id', 'deleted_at'], name='store_tombs_farm_id_d9a0c8_idx'), models.Index(fields=['service_provider_id', 'deleted_at'], name='store_tombs_service_ace1bc_idx'), models.Index(fields=['product_id', 'deleted_at'], name='store_tombs_product_4c16db_idx')],
+            },
+        ),
+    ]
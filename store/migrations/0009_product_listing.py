@@ -0,0 +1,68 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+# The listing SQL as of this migration; store.listings may grow columns
+# that later migrations add.
+FILL_SQL = """
+INSERT INTO store_productlisting (
+    id, name, slug, price, unit, unit_type, stock_quantity, availability_status, organic_certified,
+    thumbnail, thumbnail_has_derivatives, category_id, category_slug, farm_id, farm_slug, farm_name, location,
+    created_at
+)
+SELECT p.id, p.name, p.slug, p.price, p.unit, p.unit_type, p.stock_quantity, p.availability_status,
+       p.organic_certified, COALESCE(i.image, ''), COALESCE(i.has_derivatives, 0),
+       p.category_id, COALESCE(c.slug, ''), p.farm_id, COALESCE(f.slug, ''), COALESCE(f.farm_name, ''),
+       COALESCE(NULLIF(p.farm_location, ''), f.farm_location, ''),
+       p.created_at
+FROM store_product p
+LEFT JOIN store_productimage i ON i.id = (
+    SELECT t.id FROM store_productimage t
+    WHERE t.product_id = p.id
+    ORDER BY t.is_primary DESC, t."order", t.id
+    LIMIT 1
+)
+LEFT JOIN store_category c ON c.id = p.category_id
+LEFT JOIN farmers_farmer f ON f.id = p.farm_id
+"""
+
+
+def fill_listings(apps, schema_editor):
+    schema_editor.execute(FILL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(db_index=False, max_length=200)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('unit', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('unit_type', models.CharField(blank=True, max_length=50, null=True)),
+                ('stock_quantity', models.IntegerField(default=0)),
+                ('availability_status', models.CharField(choices=[('in_stock', 'In Stock'), ('out_of_stock', 'Out of Stock'), ('pre_order', 'Pre-order'), ('discontinued', 'Discontinued')], max_length=50)),
+                ('organic_certified', models.BooleanField(default=False)),
+                ('thumbnail', models.ImageField(blank=True, upload_to='products/')),
+                ('thumbnail_has_derivatives', models.BooleanField(default=False)),
+                ('category_id', models.BigIntegerField(blank=True, null=True)),
+                ('category_slug', models.SlugField(blank=True, db_index=False, max_length=100)),
+                ('farm_id', models.BigIntegerField(blank=True, null=True)),
+                ('farm_slug', models.SlugField(blank=True, db_index=False)),
+                ('farm_name', models.CharField(blank=True, max_length=100)),
+                ('location', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['availability_status', '-created_at', 'id'], name='store_produ_availab_bbc1f7_idx'), models.Index(fields=['category_id', 'availability_status', '-created_at', 'id'], name='store_produ_categor_d14add_idx'), models.Index(fields=['farm_id', '-created_at', 'id'], name='store_produ_farm_id_9185c6_idx'), models.Index(fields=['-created_at', 'id'], name='store_produ_created_7484fe_idx')],
+            },
+        ),
+        migrations.RunPython(fill_listings, migrations.RunPython.noop),
+    ]
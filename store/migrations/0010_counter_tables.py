@@ -0,0 +1,48 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from store import counters
+
+
+def fill_counters(apps, schema_editor):
+    counters.reconcile()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farmers', '0003_weather_cache'),
+        ('store', '0009_product_listing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='store.category')),
+                ('product_count', models.IntegerField(default=0)),
+                ('in_stock_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Category stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='FarmerStats',
+            fields=[
+                ('farmer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='farmers.farmer')),
+                ('product_count', models.IntegerField(default=0)),
+                ('in_stock_count', models.IntegerField(default=0)),
+                ('total_stock', models.BigIntegerField(default=0)),
+                ('stock_value_kobo', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Farmer stats',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
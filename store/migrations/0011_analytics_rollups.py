@@ -0,0 +1,61 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_counter_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Listed'), ('updated', 'Updated'), ('deleted', 'Delisted'), ('sale', 'Sale')], max_length=10)),
+                ('product_id', models.BigIntegerField()),
+                ('farm_id', models.BigIntegerField(blank=True, null=True)),
+                ('category_id', models.BigIntegerField(blank=True, null=True)),
+                ('quantity', models.IntegerField(default=0)),
+                ('amount_kobo', models.BigIntegerField(default=0)),
+                ('occurred_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product_id', 'kind', 'id'], name='store_produ_product_127978_idx'), models.Index(fields=['farm_id', 'kind', '-occurred_at'], name='store_produ_farm_id_f1dd0d_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Rollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('scope', models.CharField(choices=[('platform', 'Platform'), ('farmer', 'Farmer'), ('category', 'Category'), ('product', 'Product')], max_length=10)),
+                ('scope_id', models.BigIntegerField(default=0)),
+                ('listed', models.IntegerField(default=0)),
+                ('delisted', models.IntegerField(default=0)),
+                ('updates', models.IntegerField(default=0)),
+                ('stock_in', models.BigIntegerField(default=0)),
+                ('stock_out', models.BigIntegerField(default=0)),
+                ('sales', models.IntegerField(default=0)),
+                ('units_sold', models.BigIntegerField(default=0)),
+                ('revenue_kobo', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'period', 'bucket'], name='store_rollu_scope_3a40b9_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'scope_id', 'period', 'bucket'), name='store_rollup_bucket')],
+            },
+        ),
+    ]
@@ -1,5 +1,9 @@
+from decimal import Decimal
+
 from django.db import models    
+from django.utils import timezone
 from django.utils.text import slugify
+from core.slugs import unique_slug
 from userauths.models import CustomUser as User
 from farmers.models import Farmer
 import uuid
@@ -27,8 +31,11 @@ class Category(models.Model):
     slug = models.SlugField(max_length=100, unique=True, blank=True)
     description = models.TextField(blank=True)
     icon = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Set once store.signals has built the icon's thumb/card renditions.
+    icon_has_derivatives = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = 'Categories'
@@ -45,6 +52,12 @@ class Category(models.Model):
 
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_images(self):
+        """Load every product's images in one extra query, for listings."""
+        return self.prefetch_related('images')
+
+
 class Product(models.Model):
     CONDITION_CHOICES = [
         ('new', 'New'),
@@ -83,6 +96,8 @@ class Product(models.Model):
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
@@ -90,11 +105,15 @@ class Product(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['sku']),
             models.Index(fields=['-created_at']),
+            # Keyset pagination seeks on (-created_at, id) for the marketplace
+            # and per-category browse pages.
+            models.Index(fields=['availability_status', '-created_at', 'id']),
+            models.Index(fields=['category', 'availability_status', '-created_at', 'id']),
         ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_slug(Product, self.name)
         super().save(*args, **kwargs)
     
     @property
@@ -111,23 +130,44 @@ class Product(models.Model):
         return self.name
     
     def product_images(self):
-        return ProductImage.objects.filter(product=self).order_by('order')
+        """
+        Images in display order. Served from a `with_images()` prefetch when
+        there is one, otherwise loaded once and kept on the instance.
+        """
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            return list(self.images.all())
+        if '_image_list' not in self.__dict__:
+            self._image_list = list(self.images.all())
+        return self._image_list
 
     def primary_image(self):
-        primary = ProductImage.objects.filter(product=self, is_primary=True).first()
-        if primary:
-            return primary
-        return ProductImage.objects.filter(product=self).order_by('order').first()
+        if '_primary_image' not in self.__dict__:
+            images = self.product_images()
+            self._primary_image = next(
+                (image for image in images if image.is_primary), images[0] if images else None
+            )
+        return self._primary_image
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_image_list', None)
+        self.__dict__.pop('_primary_image', None)
+        super().refresh_from_db(*args, **kwargs)
+
     def count_sold(self):
-        # Placeholder method; actual implementation would depend on Order models
-        return 0
+        """Units sold, from the daily rollups plus sales not rolled up yet."""
+        from .analytics import units_sold
+        return units_sold(self.pk)
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
+    # Set once store.signals has built the thumb/card renditions, so pages
+    # never ask the storage whether they exist.
+    has_derivatives = models.BooleanField(default=False)
     alt_text = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['order', '-is_primary']
@@ -152,7 +192,222 @@ class ProductVariant(models.Model):
     
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.product.name} - {self.name}"
 
+
+class Tombstone(models.Model):
+    """
+    A deleted product, image or variant, kept for SYNC_TOMBSTONE_DAYS so
+    offline clients syncing with a token (store.sync) learn about it.
+    Product rows carry the owner; image and variant rows are found through
+    their product, which still exists (deleting a product records only the
+    product).
+    """
+    PRODUCT = 'product'
+    IMAGE = 'image'
+    VARIANT = 'variant'
+    KIND_CHOICES = [
+        (PRODUCT, 'Product'),
+        (IMAGE, 'Product image'),
+        (VARIANT, 'Product variant'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    product_id = models.BigIntegerField()
+    farm_id = models.BigIntegerField(blank=True, null=True)
+    service_provider_id = models.BigIntegerField(blank=True, null=True)
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm_id', 'deleted_at']),
+            models.Index(fields=['service_provider_id', 'deleted_at']),
+            models.Index(fields=['product_id', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class ProductListing(models.Model):
+    """
+    Card-sized copy of a Product: just what the marketplace cards, search
+    results and the API product list show, with the thumbnail, category and
+    farm already resolved, so listings read this one narrow table and never
+    touch the description/instructions columns. `id` is the product's id.
+    Maintained by the signal handlers in store.signals (see store.listings);
+    `rebuild_product_listings` repopulates it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=200, db_index=False)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    unit_type = models.CharField(max_length=50, blank=True, null=True)
+    stock_quantity = models.IntegerField(default=0)
+    availability_status = models.CharField(max_length=50, choices=AVAILABILITY_STATUS_CHOICES)
+    organic_certified = models.BooleanField(default=False)
+    thumbnail = models.ImageField(upload_to='products/', blank=True)
+    thumbnail_has_derivatives = models.BooleanField(default=False)
+    category_id = models.BigIntegerField(blank=True, null=True)
+    category_slug = models.SlugField(max_length=100, blank=True, db_index=False)
+    farm_id = models.BigIntegerField(blank=True, null=True)
+    farm_slug = models.SlugField(blank=True, db_index=False)
+    farm_name = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The same keyset seeks as Product's marketplace indexes.
+            models.Index(fields=['availability_status', '-created_at', 'id']),
+            models.Index(fields=['category_id', 'availability_status', '-created_at', 'id']),
+            models.Index(fields=['farm_id', '-created_at', 'id']),
+            models.Index(fields=['-created_at', 'id']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class CategoryStats(models.Model):
+    """
+    Product counts per category, kept current with F() increments by
+    store.counters instead of COUNT(*) over store_product on every render.
+    `reconcile_counters` recomputes them and reports drift.
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    product_count = models.IntegerField(default=0)
+    in_stock_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Category stats'
+
+    def __str__(self):
+        return f"{self.category_id}: {self.product_count} product(s)"
+
+
+class FarmerStats(models.Model):
+    """
+    Listing totals per farmer, maintained like CategoryStats. Stock value is
+    kept in kobo so the running sum stays exact.
+    """
+    farmer = models.OneToOneField(Farmer, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    product_count = models.IntegerField(default=0)
+    in_stock_count = models.IntegerField(default=0)
+    total_stock = models.BigIntegerField(default=0)
+    stock_value_kobo = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Farmer stats'
+
+    @property
+    def stock_value(self):
+        """Stock value in naira."""
+        return Decimal(self.stock_value_kobo) / 100
+
+    def __str__(self):
+        return f"{self.farmer_id}: {self.product_count} product(s)"
+
+
+class ProductEvent(models.Model):
+    """
+    Append-only log of what happened to products, folded into Rollup rows
+    by store.analytics. `quantity` is the signed change in stock for
+    listing events and the units sold for a sale; ids are kept rather than
+    foreign keys so the history outlives deleted products.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    SALE = 'sale'
+    KIND_CHOICES = [
+        (CREATED, 'Listed'),
+        (UPDATED, 'Updated'),
+        (DELETED, 'Delisted'),
+        (SALE, 'Sale'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    product_id = models.BigIntegerField()
+    farm_id = models.BigIntegerField(blank=True, null=True)
+    category_id = models.BigIntegerField(blank=True, null=True)
+    quantity = models.IntegerField(default=0)
+    amount_kobo = models.BigIntegerField(default=0)
+    occurred_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product_id', 'kind', 'id']),
+            models.Index(fields=['farm_id', 'kind', '-occurred_at']),
+        ]
+
+    @property
+    def amount(self):
+        return Decimal(self.amount_kobo) / 100
+
+    def __str__(self):
+        return f"{self.kind} product {self.product_id} at {self.occurred_at:%Y-%m-%d %H:%M}"
+
+
+class Rollup(models.Model):
+    """
+    ProductEvent totals per hour or day, platform-wide, per farmer, per
+    category and (daily only) per product. Dashboards read these instead of
+    scanning the event log or store_product.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    PLATFORM = 'platform'
+    FARMER = 'farmer'
+    CATEGORY = 'category'
+    PRODUCT = 'product'
+    SCOPE_CHOICES = [(PLATFORM, 'Platform'), (FARMER, 'Farmer'), (CATEGORY, 'Category'), (PRODUCT, 'Product')]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    # 0 for the platform scope.
+    scope_id = models.BigIntegerField(default=0)
+
+    listed = models.IntegerField(default=0)
+    delisted = models.IntegerField(default=0)
+    updates = models.IntegerField(default=0)
+    stock_in = models.BigIntegerField(default=0)
+    stock_out = models.BigIntegerField(default=0)
+    sales = models.IntegerField(default=0)
+    units_sold = models.BigIntegerField(default=0)
+    revenue_kobo = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'scope_id', 'period', 'bucket'], name='store_rollup_bucket'),
+        ]
+        indexes = [
+            # Leaderboards: every farmer's/category's buckets in a date range.
+            models.Index(fields=['scope', 'period', 'bucket']),
+        ]
+
+    @property
+    def revenue(self):
+        return Decimal(self.revenue_kobo) / 100
+
+    def __str__(self):
+        return f"{self.scope} {self.scope_id} {self.period} {self.bucket:%Y-%m-%d %H:%M}"
+
+
+class RollupCursor(models.Model):
+    """The last ProductEvent id folded into the rollups."""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
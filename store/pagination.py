@@ -0,0 +1,80 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def make_cursor(created_at, pk):
+    """
+    Build an opaque cursor pointing just after the row (created_at, pk) in
+    (-created_at, id) order.
+    """
+    payload = json.dumps([created_at.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def encode_cursor(obj):
+    return make_cursor(obj.created_at, obj.pk)
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def seek(queryset, cursor):
+    """
+    Order `queryset` by (-created_at, id) and skip to just after `cursor`.
+    Raises InvalidCursor for a cursor we did not issue.
+    """
+    created_at, pk = decode_cursor(cursor)
+    return queryset.order_by('-created_at', 'id').filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, id__gt=pk)
+    )
+
+
+def paginate_keyset(queryset, cursor=None, page_size=24):
+    """
+    Slice `queryset` with a seek on (-created_at, id) instead of OFFSET, so
+    every page costs the same no matter how deep the buyer has scrolled.
+    An unreadable cursor restarts from the first page.
+    """
+    queryset = queryset.order_by('-created_at', 'id')
+    if cursor:
+        try:
+            queryset = seek(queryset, cursor)
+        except InvalidCursor:
+            pass
+
+    # Fetch one extra row to learn whether another page exists.
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1])
+    return KeysetPage(items, next_cursor)
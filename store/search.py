@@ -0,0 +1,245 @@
+"""
+Full-text product search on top of an SQLite FTS5 table.
+
+`store_product_fts` holds one row per product (rowid == product id) with the
+searchable text plus the facet columns stored UNINDEXED, so ranking, facet
+counts and filtering are all answered from the FTS table alone and never
+scan `store_product`. Rows are kept in sync by the signal handlers in
+`store.signals`.
+"""
+import re
+
+from django.db import connection, transaction
+
+FTS_TABLE = 'store_product_fts'
+
+# bm25() weights, in column order: name, description, farm_location, category_name.
+BM25_WEIGHTS = (10.0, 1.0, 3.0, 5.0)
+
+FACET_FIELDS = ('category_id', 'unit_type', 'organic_certified', 'availability_status')
+
+CREATE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name,
+    description,
+    farm_location,
+    category_name,
+    category_id UNINDEXED,
+    unit_type UNINDEXED,
+    organic_certified UNINDEXED,
+    availability_status UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+REBUILD_SQL = f"""
+INSERT INTO {FTS_TABLE} (
+    rowid, name, description, farm_location, category_name,
+    category_id, unit_type, organic_certified, availability_status
+)
+SELECT p.id, p.name, p.description, COALESCE(p.farm_location, ''), COALESCE(c.name, ''),
+       p.category_id, COALESCE(p.unit_type, ''), p.organic_certified, p.availability_status
+FROM store_product p
+LEFT JOIN store_category c ON c.id = p.category_id
+"""
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Turn free text from a buyer into a safe FTS5 MATCH expression: every word
+    must appear, and the last one may be a prefix ("tom" finds "tomatoes").
+    Returns '' when there is nothing searchable.
+    """
+    tokens = TOKEN_RE.findall(text or '')
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens[:-1]]
+    terms.append(f'"{tokens[-1]}"*')
+    return ' '.join(terms)
+
+
+INSERT_SQL = f"""
+INSERT INTO {FTS_TABLE} (
+    rowid, name, description, farm_location, category_name,
+    category_id, unit_type, organic_certified, availability_status
+) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def _index_row(product, category_name):
+    return [
+        product.pk,
+        product.name,
+        product.description,
+        product.farm_location or '',
+        category_name,
+        product.category_id,
+        product.unit_type or '',
+        int(product.organic_certified),
+        product.availability_status,
+    ]
+
+
+def index_product(product):
+    if not is_enabled():
+        return
+    category_name = product.category.name if product.category_id else ''
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+        cursor.execute(INSERT_SQL, _index_row(product, category_name))
+
+
+def index_new_products(products, category_names):
+    """
+    Index freshly bulk-created products (bulk_create skips post_save).
+    `category_names` maps category id -> name so no per-row lookups happen.
+    """
+    if not is_enabled() or not products:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            INSERT_SQL,
+            [_index_row(product, category_names.get(product.category_id, '')) for product in products],
+        )
+
+
+def remove_product(product_id):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+
+def rename_category(category):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {FTS_TABLE} SET category_name = %s WHERE category_id = %s",
+            [category.name, category.pk],
+        )
+
+
+def clear_category(category_id):
+    """The category is gone and its products have none (on_delete=SET_NULL)."""
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {FTS_TABLE} SET category_name = '', category_id = NULL WHERE category_id = %s",
+            [category_id],
+        )
+
+
+def rebuild_index():
+    """
+    Repopulate the FTS table from `store_product` in one pass. Runs in one
+    transaction, so searches never see a half-empty index.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_SQL)
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(REBUILD_SQL)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def match_subquery(text):
+    """
+    SQL + params selecting the ids of products matching `text`, for use as a
+    `pk__in=RawSQL(...)` filter (the admin search uses this).
+    """
+    return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [build_match_query(text)]
+
+
+class SearchResults:
+    def __init__(self, query, ids, total, facets):
+        self.query = query
+        self.ids = ids
+        self.total = total
+        self.facets = facets
+
+
+def _filter_clause(filters):
+    clauses, params = [], []
+    for field in FACET_FIELDS:
+        value = filters.get(field)
+        if value in (None, ''):
+            continue
+        # FTS5 columns have no type affinity, so compare like with like.
+        if field == 'category_id':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                continue
+        elif field == 'organic_certified':
+            value = 1 if value in (True, 1, '1', 'true', 'True') else 0
+        clauses.append(f"{field} = %s")
+        params.append(value)
+    return ''.join(f" AND {clause}" for clause in clauses), params
+
+
+def search(text, filters=None, limit=24, offset=0):
+    """
+    Rank products matching `text` with BM25 and count facets.
+
+    `filters` may narrow the hits on any of FACET_FIELDS. Facet counts are
+    computed over the text match alone, so buyers still see the other
+    categories/units they could switch to after picking one.
+    """
+    match = build_match_query(text)
+    if not match or not is_enabled():
+        return SearchResults(text, [], 0, {field: [] for field in FACET_FIELDS})
+
+    where, filter_params = _filter_clause(filters or {})
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT rowid FROM {FTS_TABLE}
+            WHERE {FTS_TABLE} MATCH %s{where}
+            ORDER BY bm25({FTS_TABLE}, {weights}), rowid DESC
+            LIMIT %s OFFSET %s
+            """,
+            [match, *filter_params, limit, offset],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(
+            f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{where}",
+            [match, *filter_params],
+        )
+        total = cursor.fetchone()[0]
+
+        facet_selects = ' UNION ALL '.join(
+            f"SELECT '{field}', {field}, count(*) FROM hits GROUP BY {field}"
+            for field in FACET_FIELDS
+        )
+        cursor.execute(
+            f"""
+            WITH hits AS MATERIALIZED (
+                SELECT {', '.join(FACET_FIELDS)} FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH %s
+            )
+            {facet_selects}
+            """,
+            [match],
+        )
+        facets = {field: [] for field in FACET_FIELDS}
+        for field, value, count in cursor.fetchall():
+            if value in (None, ''):
+                continue
+            facets[field].append((value, count))
+
+    for values in facets.values():
+        values.sort(key=lambda item: -item[1])
+    return SearchResults(text, ids, total, facets)
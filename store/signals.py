@@ -0,0 +1,244 @@
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.db import run_write
+from farmers.models import Farmer
+from userauths.models import Profile
+from . import analytics, counters, imaging, listings, search
+from .models import Category, Product, ProductEvent, ProductImage, ProductVariant, Tombstone
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_listing(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    listings.refresh_listing(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_listing(sender, instance, **kwargs):
+    listings.remove_listing(instance.pk)
+
+
+@receiver(pre_save, sender=Product)
+def remember_counted_state(sender, instance, raw=False, **kwargs):
+    # Read the stored row rather than trusting the instance, which may have
+    # been loaded before another writer changed it.
+    instance._counted_before = None if raw or instance._state.adding else counters.load_snapshot(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def record_product_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Counters and the analytics event log both work from the stored state.
+    before = instance.__dict__.pop('_counted_before', None)
+    counters.record_save(before, instance)
+    if before is None:
+        analytics.log_event(ProductEvent.CREATED, instance, quantity=instance.stock_quantity)
+    else:
+        analytics.log_event(
+            ProductEvent.UPDATED, instance, quantity=instance.stock_quantity - before['stock_quantity']
+        )
+
+
+@receiver(post_delete, sender=Product)
+def record_product_delete(sender, instance, **kwargs):
+    counters.record_delete(instance)
+    analytics.log_event(ProductEvent.DELETED, instance, quantity=-instance.stock_quantity)
+
+
+# Products whose deletion is in progress in this thread: the deletion
+# collector sends every pre_delete before any row goes, then deletes images
+# and variants ahead of their product.
+_deleting = threading.local()
+
+
+def _deleting_products():
+    if not hasattr(_deleting, 'products'):
+        _deleting.products = set()
+    return _deleting.products
+
+
+@receiver(pre_delete, sender=Product)
+def note_product_deletion(sender, instance, **kwargs):
+    _deleting_products().add(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def product_tombstone(sender, instance, **kwargs):
+    _deleting_products().discard(instance.pk)
+    Tombstone.objects.create(
+        kind=Tombstone.PRODUCT, object_id=instance.pk, product_id=instance.pk,
+        farm_id=instance.farm_id, service_provider_id=instance.service_provider_id,
+    )
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=ProductVariant)
+def child_tombstone(sender, instance, **kwargs):
+    # Clients drop a deleted product's images and variants with it.
+    if instance.product_id in _deleting_products():
+        return
+    kind = Tombstone.IMAGE if sender is ProductImage else Tombstone.VARIANT
+    Tombstone.objects.create(kind=kind, object_id=instance.pk, product_id=instance.product_id)
+
+
+@receiver(post_delete, sender=ProductImage)
+def refresh_listing_thumbnail(sender, instance, **kwargs):
+    if instance.product_id in _deleting_products():
+        return
+    listings.refresh_listing(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_listings(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    listings.refresh_listings(Product.objects.filter(category=instance))
+
+
+@receiver(pre_delete, sender=Category)
+def note_category_products(sender, instance, **kwargs):
+    # The collector nulls Product.category with a queryset update, which
+    # sends no signals; remember whose listings to refresh afterwards.
+    instance._product_ids = list(Product.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def refresh_uncategorised_listings(sender, instance, **kwargs):
+    product_ids = getattr(instance, '_product_ids', None)
+    if product_ids:
+        listings.refresh_listings(Product.objects.filter(pk__in=product_ids))
+    search.clear_category(instance.pk)
+
+
+@receiver(post_save, sender=Farmer)
+def refresh_farm_listings(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    listings.refresh_listings(Product.objects.filter(farm=instance))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_name(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    search.rename_category(instance)
+
+
+# The image field of each model with renditions, and the flag recording that
+# they have been built (profiles have no flag: nothing renders them yet).
+DERIVED_IMAGES = {
+    ProductImage: ('image', 'has_derivatives'),
+    Category: ('icon', 'icon_has_derivatives'),
+    Profile: ('image', None),
+}
+
+
+def _build_derivatives(instance):
+    field, flag = DERIVED_IMAGES[type(instance)]
+    field_file = getattr(instance, field)
+    if not field_file or (flag and getattr(instance, flag)):
+        return
+    model, pk, name, storage = type(instance), instance.pk, field_file.name, field_file.storage
+
+    def build():
+        # Pillow work happens after the commit, outside any retried write.
+        try:
+            imaging.generate_derivatives(name, storage)
+        except ValueError:
+            logger.warning('Skipping image derivatives for %s', name, exc_info=True)
+            return
+        if flag:
+            run_write(lambda: record_derivatives(model, [name], pk=pk))
+
+    transaction.on_commit(build, robust=True)
+
+
+def record_derivatives(model, names, **filters):
+    """
+    Flag the `model` rows whose image is one of `names` as having renditions
+    and refresh the listings that copy the flag; returns how many changed.
+    Used after uploads and by `generate_image_derivatives`.
+    """
+    field, flag = DERIVED_IMAGES[model]
+    # Rows whose image was replaced while the renditions were built no
+    # longer match `names`.
+    rows = model.objects.filter(**{f'{field}__in': names, flag: False}, **filters)
+    product_ids = list(rows.values_list('product_id', flat=True)) if model is ProductImage else []
+    # updated_at moves too: the markup changes and conditional GETs and
+    # delta sync must see it.
+    updated = rows.update(**{flag: True, 'updated_at': timezone.now()})
+    if product_ids:
+        listings.refresh_listings(Product.objects.filter(pk__in=product_ids))
+    return updated
+
+
+def _discard_derivatives(model, name, storage):
+    field, _ = DERIVED_IMAGES[model]
+
+    def discard():
+        # Bulk loaders may point several rows at one file.
+        if not model.objects.filter(**{field: name}).exists():
+            imaging.delete_derivatives(name, storage)
+
+    # Only once the row change has committed; a rollback keeps the old file.
+    transaction.on_commit(discard, robust=True)
+
+
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Profile)
+def remember_stored_image(sender, instance, raw=False, **kwargs):
+    field, flag = DERIVED_IMAGES[sender]
+    instance._replaced_image = None
+    if raw or instance._state.adding:
+        return
+    stored = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    if stored and stored != getattr(instance, field).name:
+        instance._replaced_image = stored
+        if flag:
+            setattr(instance, flag, False)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Profile)
+def image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    replaced = instance.__dict__.pop('_replaced_image', None)
+    if replaced:
+        _discard_derivatives(sender, replaced, getattr(instance, DERIVED_IMAGES[sender][0]).storage)
+    if sender is ProductImage:
+        listings.refresh_listing(instance.product_id)
+    _build_derivatives(instance)
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Profile)
+def delete_image_derivatives(sender, instance, **kwargs):
+    field_file = getattr(instance, DERIVED_IMAGES[sender][0])
+    if field_file:
+        _discard_derivatives(sender, field_file.name, field_file.storage)
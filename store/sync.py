@@ -0,0 +1,185 @@
+"""
+Delta sync for offline-first seller clients.
+
+    GET /api/v1/sync/                the seller's whole catalogue
+    GET /api/v1/sync/?token=<next>   only what changed since the last cycle
+
+A sync cycle reads everything the logged-in farmer or service provider owns
+that changed up to a watermark fixed on the cycle's first page: products,
+then images, then variants, then deletions (from Tombstone). A page holds
+at most SYNC_PAGE_SIZE changes; while `more` is true, call again with
+`next` straight away. Once it is false, keep `next` for the following
+cycle. That cycle re-reads SYNC_OVERLAP_SECONDS behind the old watermark so
+rows committed late are not missed; clients upsert by id, so repeats are
+harmless.
+
+Sync always reads the primary: the watermark comes from the clock, so a
+lagging replica would hide rows changed before it and they would never be
+sent.
+
+Tokens are signed and bound to the user. A token older than
+SYNC_TOMBSTONE_DAYS may have missed deletions, so it restarts with a full
+sync and the response says "reset": true.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import routers
+from farmers.models import Farmer
+from .api import PRODUCTS, ApiError, api_view, media_url
+from .models import Product, ProductImage, ProductVariant, Tombstone
+
+SALT = 'store.sync'
+
+
+def owned_products(user):
+    return Product.objects.filter(Q(farm__user=user) | Q(service_provider=user))
+
+
+def owned_tombstones(user):
+    farms = Farmer.objects.filter(user=user).values('pk')
+    products = owned_products(user).values('pk')
+    return Tombstone.objects.filter(
+        Q(kind=Tombstone.PRODUCT) & (Q(farm_id__in=farms) | Q(service_provider_id=user.pk))
+        | ~Q(kind=Tombstone.PRODUCT) & Q(product_id__in=products)
+    )
+
+
+class Stream:
+    """
+    One kind of change: `fields` maps public names to .values() lookups,
+    `transforms` post-process a public value (e.g. file name -> URL).
+    """
+
+    def __init__(self, name, queryset, fields, time_field='updated_at', transforms=None, incremental_only=False):
+        self.name = name
+        self.queryset = queryset
+        self.fields = fields
+        self.time_field = time_field
+        self.transforms = transforms or {}
+        self.incremental_only = incremental_only
+
+    def read(self, request, since, watermark, cursor, limit):
+        """Up to `limit` rows after `cursor`, plus the cursor to resume from if more remain."""
+        time_field = self.time_field
+        queryset = self.queryset(request.user).filter(**{f'{time_field}__lte': watermark})
+        if since is not None:
+            queryset = queryset.filter(**{f'{time_field}__gt': since})
+        if cursor:
+            moment, pk = parse_datetime(cursor[0]), cursor[1]
+            queryset = queryset.filter(Q(**{f'{time_field}__gt': moment}) | Q(**{time_field: moment, 'id__gt': pk}))
+        lookups = set(self.fields.values()) | {'id', time_field}
+        values = list(queryset.order_by(time_field, 'id').values(*lookups)[:limit + 1])
+        more = len(values) > limit
+        values = values[:limit]
+
+        rows = []
+        for value in values:
+            row = {name: value[lookup] for name, lookup in self.fields.items()}
+            for name, transform in self.transforms.items():
+                row[name] = transform(request, row[name])
+            rows.append(row)
+        last = [values[-1][time_field].isoformat(), values[-1]['id']] if more else None
+        return rows, last
+
+
+STREAMS = [
+    Stream('products', owned_products, PRODUCTS.fields),
+    Stream(
+        'images',
+        lambda user: ProductImage.objects.filter(Q(product__farm__user=user) | Q(product__service_provider=user)),
+        {
+            'id': 'id', 'product': 'product_id', 'image': 'image', 'alt_text': 'alt_text',
+            'is_primary': 'is_primary', 'order': 'order', 'updated_at': 'updated_at',
+        },
+        transforms={'image': media_url},
+    ),
+    Stream(
+        'variants',
+        lambda user: ProductVariant.objects.filter(Q(product__farm__user=user) | Q(product__service_provider=user)),
+        {
+            'id': 'id', 'product': 'product_id', 'name': 'name', 'sku': 'sku', 'price': 'price',
+            'stock_quantity': 'stock_quantity', 'size': 'size', 'color': 'color', 'material': 'material',
+            'is_active': 'is_active', 'updated_at': 'updated_at',
+        },
+    ),
+    Stream(
+        'deleted',
+        owned_tombstones,
+        {'kind': 'kind', 'id': 'object_id', 'deleted_at': 'deleted_at'},
+        time_field='deleted_at',
+        incremental_only=True,
+    ),
+]
+
+
+def make_token(user, since, watermark=None, stream=0, cursor=None):
+    return signing.dumps({
+        'u': user.pk,
+        's': since.isoformat() if since else None,
+        'w': watermark.isoformat() if watermark else None,
+        'k': stream,
+        'c': cursor,
+    }, salt=SALT, compress=True)
+
+
+def read_token(request):
+    token = request.GET.get('token')
+    if not token:
+        return None, None, 0, None
+    try:
+        state = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise ApiError('Invalid sync token.')
+    if state.get('u') != request.user.pk:
+        raise ApiError('This sync token belongs to another account.')
+    since = parse_datetime(state['s']) if state.get('s') else None
+    watermark = parse_datetime(state['w']) if state.get('w') else None
+    return since, watermark, state.get('k', 0), state.get('c')
+
+
+@api_view
+def sync(request):
+    routers.read_from_primary()
+    if not request.user.is_authenticated:
+        raise ApiError('Log in to sync.', status=401)
+    since, watermark, stream, cursor = read_token(request)
+
+    now = timezone.now()
+    reset = since is not None and since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    if reset:
+        since, watermark, stream, cursor = None, None, 0, None
+    if watermark is None:
+        # First page of a cycle.
+        watermark = now
+    read_since = since - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS) if since else None
+
+    changes = {entry.name: [] for entry in STREAMS}
+    remaining = settings.SYNC_PAGE_SIZE
+    while stream < len(STREAMS) and remaining > 0:
+        entry = STREAMS[stream]
+        if since is None and entry.incremental_only:
+            stream, cursor = stream + 1, None
+            continue
+        rows, cursor = entry.read(request, read_since, watermark, cursor, remaining)
+        changes[entry.name].extend(rows)
+        remaining -= len(rows)
+        if cursor:
+            break
+        stream += 1
+
+    more = stream < len(STREAMS)
+    if more:
+        next_token = make_token(request.user, since, watermark, stream, cursor)
+    else:
+        next_token = make_token(request.user, watermark)
+    return JsonResponse(
+        {'changes': changes, 'next': next_token, 'more': more, 'reset': reset},
+        json_dumps_params={'separators': (',', ':')},
+    )
@@ -0,0 +1,48 @@
+from django import template
+from django.utils.html import format_html
+
+from store import imaging
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_img(field_file, sizes='12rem', alt='', css_class='', derivatives=False):
+    """
+    Render an <img> for an ImageField/FileField value, served from the
+    thumb/card derivatives with a WebP <source> when `derivatives` says
+    they have been built:
+
+        {% responsive_img image.image derivatives=image.has_derivatives sizes="12rem" alt=product.name %}
+
+    Falls back to the original upload until then.
+    """
+    if not field_file:
+        return format_html('<img src="" alt="{}" class="{}" loading="lazy" />', alt, css_class)
+
+    name = field_file.name
+    storage = field_file.storage
+    if not derivatives:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" />', field_file.url, alt, css_class
+        )
+
+    def srcset(fmt):
+        return ', '.join(
+            f'{storage.url(imaging.derivative_name(name, rendition, fmt))} {width}w'
+            for rendition, (width, _) in imaging.RENDITIONS.items()
+        )
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}" />'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async" />'
+        '</picture>',
+        srcset('webp'),
+        sizes,
+        storage.url(imaging.derivative_name(name, 'card', 'jpeg')),
+        srcset('jpeg'),
+        sizes,
+        alt,
+        css_class,
+    )
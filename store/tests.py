@@ -1,3 +1,652 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from farmers.models import Farmer
+from userauths.models import CustomUser
+
+from . import analytics, api, counters, imaging, search, sync
+from .conditional import _product_state, product_etag, product_last_modified
+from .listings import rebuild_listings
+from .models import (
+    Category, CategoryStats, FarmerStats, Product, ProductEvent, ProductImage, ProductListing, ProductVariant,
+    Rollup, RollupCursor, Tombstone,
+)
+from .pagination import decode_cursor, encode_cursor, make_cursor, paginate_keyset
+
+
+def make_product(name, **fields):
+    fields.setdefault('description', f'Fresh {name}')
+    fields.setdefault('price', '100.00')
+    fields.setdefault('stock_quantity', 10)
+    return Product.objects.create(name=name, **fields)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # Seven products, three sharing one timestamp, so the id tiebreak
+        # is exercised.
+        now = timezone.now()
+        self.products = [make_product(f'Yam {n}') for n in range(7)]
+        stamps = [now, now, now, now - timedelta(hours=1), now - timedelta(hours=2),
+                  now - timedelta(hours=3), now - timedelta(hours=4)]
+        for product, stamp in zip(self.products, stamps):
+            Product.objects.filter(pk=product.pk).update(created_at=stamp)
+        self.expected = [product.pk for product in self.products]
+
+    def walk(self, page_size):
+        pages, cursor = [], None
+        while True:
+            page = paginate_keyset(Product.objects.all(), cursor, page_size)
+            pages.append([product.pk for product in page])
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for page_size in (1, 2, 3, 7):
+            with self.subTest(page_size=page_size):
+                pages = self.walk(page_size)
+                self.assertEqual([pk for page in pages for pk in page], self.expected)
+                self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+
+    def test_last_page_has_no_cursor(self):
+        page = paginate_keyset(Product.objects.all(), None, 7)
+        self.assertEqual(len(page), 7)
+        self.assertIsNone(page.next_cursor)
+
+    def test_rows_added_at_the_top_do_not_shift_later_pages(self):
+        first = paginate_keyset(Product.objects.all(), None, 3)
+        make_product('Newer yam')
+        second = paginate_keyset(Product.objects.all(), first.next_cursor, 3)
+        self.assertEqual([product.pk for product in second], self.expected[3:6])
+
+    def test_cursor_round_trip(self):
+        product = Product.objects.get(pk=self.expected[0])
+        self.assertEqual(decode_cursor(encode_cursor(product)), (product.created_at, product.pk))
+
+    def test_unreadable_cursor_restarts_from_the_first_page(self):
+        page = paginate_keyset(Product.objects.all(), 'not-a-cursor', 3)
+        self.assertEqual([product.pk for product in page], self.expected[:3])
+
+
+class MarketplaceBrowseTests(TestCase):
+    def setUp(self):
+        self.vegetables = Category.objects.create(name='Vegetables')
+        self.grains = Category.objects.create(name='Grains')
+        self.okra = make_product('Okra', category=self.vegetables)
+        self.rice = make_product('Rice', category=self.grains)
+        self.sold_out = make_product('Ugu', category=self.vegetables, availability_status='out_of_stock')
+
+    def test_home_lists_in_stock_products(self):
+        response = self.client.get(reverse('store:home'))
+        self.assertEqual({product.pk for product in response.context['products']}, {self.okra.pk, self.rice.pk})
+
+    def test_category_page_lists_only_its_category(self):
+        response = self.client.get(reverse('store:category', args=[self.vegetables.slug]))
+        self.assertEqual([product.pk for product in response.context['products']], [self.okra.pk])
+        self.assertEqual(response.context['current_category'], self.vegetables)
+
+    def test_inactive_category_is_not_found(self):
+        Category.objects.filter(pk=self.grains.pk).update(is_active=False)
+        response = self.client.get(reverse('store:category', args=[self.grains.slug]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_partial_continues_from_the_cursor(self):
+        cursor = make_cursor(self.okra.created_at, self.okra.pk)
+        Product.objects.filter(pk=self.rice.pk).update(created_at=self.okra.created_at - timedelta(days=1))
+        # Listing rows copy created_at; a queryset update skips the signals.
+        rebuild_listings()
+        response = self.client.get(reverse('store:product_list_partial'), {'cursor': cursor})
+        self.assertEqual([product.pk for product in response.context['products']], [self.rice.pk])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.vegetables = Category.objects.create(name='Vegetables')
+        self.fruits = Category.objects.create(name='Fruits')
+        self.tomatoes = make_product('Roma tomatoes', category=self.vegetables, unit_type='kg')
+        self.paste = make_product(
+            'Pepper mix', description='Blended with ripe tomatoes', category=self.vegetables, unit_type='pack'
+        )
+        self.mango = make_product('Tommy mango', category=self.fruits, unit_type='kg', organic_certified=True)
+        self.yam = make_product('Yam tubers', category=self.vegetables, unit_type='piece')
+
+    def test_name_match_outranks_description_match(self):
+        results = search.search('tomatoes')
+        self.assertEqual(results.ids, [self.tomatoes.pk, self.paste.pk])
+        self.assertEqual(results.total, 2)
+
+    def test_last_word_matches_as_a_prefix(self):
+        self.assertEqual(set(search.search('tom').ids), {self.tomatoes.pk, self.paste.pk, self.mango.pk})
+        self.assertEqual(search.search('roma tom').ids, [self.tomatoes.pk])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(search.build_match_query('tomatoes" OR *'), '"tomatoes" "OR"*')
+        self.assertEqual(search.search('"*').ids, [])
+
+    def test_facets_count_the_match_and_ignore_filters(self):
+        results = search.search('tom', {'category_id': self.fruits.pk})
+        self.assertEqual(results.ids, [self.mango.pk])
+        self.assertEqual(
+            dict(results.facets['category_id']), {self.vegetables.pk: 2, self.fruits.pk: 1}
+        )
+        self.assertEqual(dict(results.facets['unit_type']), {'kg': 2, 'pack': 1})
+        self.assertEqual(dict(results.facets['organic_certified']), {0: 2, 1: 1})
+
+    def test_filters_combine(self):
+        results = search.search('tom', {'category_id': str(self.vegetables.pk), 'unit_type': 'kg'})
+        self.assertEqual(results.ids, [self.tomatoes.pk])
+        self.assertEqual(search.search('tom', {'organic_certified': '1'}).ids, [self.mango.pk])
+
+    def test_index_follows_edits_deletes_and_category_renames(self):
+        self.yam.name = 'Water yam'
+        self.yam.save()
+        self.assertEqual(search.search('water').ids, [self.yam.pk])
+
+        self.fruits.name = 'Orchard'
+        self.fruits.save()
+        self.assertEqual(search.search('orchard').ids, [self.mango.pk])
+
+        self.tomatoes.delete()
+        self.assertEqual(search.search('roma').ids, [])
+
+    def test_rebuild_matches_incremental_index(self):
+        before = search.search('tom').ids
+        self.assertEqual(search.rebuild_index(), 4)
+        self.assertEqual(search.search('tom').ids, before)
+
+    def test_failed_rebuild_keeps_the_old_index(self):
+        with mock.patch.object(search, 'REBUILD_SQL', 'INSERT INTO no_such_table VALUES (1)'):
+            with self.assertRaises(OperationalError):
+                search.rebuild_index()
+        self.assertEqual(search.search('tomatoes').ids, [self.tomatoes.pk, self.paste.pk])
+
+    def test_search_page(self):
+        response = self.client.get(reverse('store:search'), {'q': 'tomatoes'})
+        self.assertEqual([product.pk for product in response.context['products']], [self.tomatoes.pk, self.paste.pk])
+        self.assertEqual(response.context['total'], 2)
+        labels = [facet['label'] for facet in response.context['facets']['category_id']]
+        self.assertEqual(labels, ['Vegetables'])
+
+
+def jpeg_upload(name='photo.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (40, 160, 60)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = make_product('Plantain')
+
+    def upload(self, name='photo.jpg'):
+        # Renditions are built once the row has committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            return ProductImage.objects.create(product=self.product, image=jpeg_upload(name))
+
+    def derivatives_exist(self, name):
+        return all(
+            default_storage.exists(imaging.derivative_name(name, rendition, fmt))
+            for rendition in imaging.RENDITIONS for fmt in imaging.FORMATS
+        )
+
+    def test_upload_builds_derivatives_and_records_them(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            image = ProductImage.objects.create(product=self.product, image=jpeg_upload())
+        self.assertFalse(self.derivatives_exist(image.image.name))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.derivatives_exist(image.image.name))
+        image.refresh_from_db()
+        self.assertTrue(image.has_derivatives)
+        self.assertTrue(ProductListing.objects.get(pk=self.product.pk).thumbnail_has_derivatives)
+
+    def test_backfill_records_derivatives_like_an_upload(self):
+        with self.captureOnCommitCallbacks():
+            image = ProductImage.objects.create(product=self.product, image=jpeg_upload())
+        earlier = timezone.now() - timedelta(days=1)
+        for model in (Product, ProductImage):
+            model.objects.update(updated_at=earlier)
+
+        call_command('generate_image_derivatives', workers=1, stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertTrue(image.has_derivatives)
+        self.assertGreater(image.updated_at, earlier)
+        self.assertTrue(ProductListing.objects.get(pk=self.product.pk).thumbnail_has_derivatives)
+        # The product page's Last-Modified follows the image.
+        request = RequestFactory().get('/')
+        self.assertGreater(product_last_modified(request, self.product.slug), earlier)
+
+    def test_tag_trusts_the_flag_instead_of_the_storage(self):
+        image = self.upload()
+        template = Template('{% load store_images %}{% responsive_img listing.thumbnail derivatives=listing.thumbnail_has_derivatives %}')
+        listing = ProductListing.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            html = template.render(Context({'listing': listing}))
+        self.assertIn('image/webp', html)
+        self.assertIn(imaging.derivative_name(image.image.name, 'card', 'jpeg'), html)
+
+        listing.thumbnail_has_derivatives = False
+        html = template.render(Context({'listing': listing}))
+        self.assertNotIn('<picture>', html)
+        self.assertIn(image.image.url, html)
+
+    def test_deleting_an_image_removes_its_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=jpeg_upload())
+            name = image.image.name
+            image.delete()
+        self.assertFalse(any(
+            default_storage.exists(imaging.derivative_name(name, rendition, fmt))
+            for rendition in imaging.RENDITIONS for fmt in imaging.FORMATS
+        ))
+
+    def test_replacing_an_image_rebuilds_and_drops_the_old_derivatives(self):
+        image = self.upload('old.jpg')
+        old_name = image.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            image.image = jpeg_upload('new.jpg')
+            image.save()
+        image.refresh_from_db()
+        self.assertTrue(image.has_derivatives)
+        self.assertTrue(self.derivatives_exist(image.image.name))
+        self.assertFalse(default_storage.exists(imaging.derivative_name(old_name, 'card', 'jpeg')))
+
+    def test_shared_files_keep_their_derivatives(self):
+        first = self.upload()
+        second = ProductImage.objects.create(product=self.product, image=first.image.name, has_derivatives=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertTrue(self.derivatives_exist(first.image.name))
+
+
+class ProductValidatorTests(TestCase):
+    def setUp(self):
+        self.product = make_product('Ofada rice')
+        self.earlier = timezone.now() - timedelta(days=1)
+        for n in range(2):
+            ProductImage.objects.create(product=self.product, image=f'products/rice-{n}.jpg')
+            ProductVariant.objects.create(product=self.product, name=f'{n + 1} kg', sku=f'rice-{n}', price='900.00')
+        for model in (Product, ProductImage, ProductVariant):
+            model.objects.update(updated_at=self.earlier)
+
+    def validators(self):
+        # A fresh request each time: the state is memoised per request.
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return product_etag(request, self.product.slug), product_last_modified(request, self.product.slug)
+
+    def test_counts_are_not_multiplied_by_the_joins(self):
+        request = RequestFactory().get('/')
+        self.assertEqual(_product_state(request, self.product.slug)[3:5], (2, 2))
+
+    def test_variant_edits_and_deletes_change_the_validators(self):
+        etag, last_modified = self.validators()
+        variant = self.product.variants.first()
+        variant.price = '950.00'
+        variant.save()
+        edited_etag, edited_last_modified = self.validators()
+        self.assertNotEqual(edited_etag, etag)
+        self.assertGreater(edited_last_modified, last_modified)
+
+        variant.delete()
+        self.assertNotEqual(self.validators()[0], edited_etag)
+
+    def test_image_updates_change_the_validators(self):
+        etag, last_modified = self.validators()
+        ProductImage.objects.filter(pk=self.product.images.first().pk).update(updated_at=timezone.now())
+        changed_etag, changed_last_modified = self.validators()
+        self.assertNotEqual(changed_etag, etag)
+        self.assertGreater(changed_last_modified, last_modified)
+
+
+class ApiStreamingTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.products = [make_product(f'Cassava {n}') for n in range(api.STREAM_CHUNK + 10)]
+        for n, product in enumerate(self.products):
+            Product.objects.filter(pk=product.pk).update(created_at=now - timedelta(minutes=n))
+        rebuild_listings()
+
+    def get(self, params):
+        response = self.client.get(reverse('api:products'), params)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_pages_stream_every_product_once(self):
+        seen, params = [], {'limit': api.STREAM_CHUNK - 5, 'fields': 'id,name'}
+        while True:
+            page = self.get(params)
+            seen += [row['id'] for row in page['results']]
+            if page['next'] is None:
+                break
+            params['cursor'] = page['next']
+        self.assertEqual(seen, [product.pk for product in self.products])
+
+    def test_rows_are_read_while_the_body_streams(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api:products'), {'limit': 200, 'fields': 'id'})
+            self.assertEqual(len(queries), 0)
+            body = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(body['results']), len(self.products))
+        self.assertIsNone(body['next'])
+        self.assertEqual(len(queries), 1)
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='ada', email='ada@example.com')
+        self.farm = Farmer.objects.create(user=self.user, farm_name='Ada Farms', email='ada@example.com')
+        other = CustomUser.objects.create(username='bola', email='bola@example.com')
+        other_farm = Farmer.objects.create(user=other, farm_name='Bola Farms', email='bola@example.com')
+        self.yam, self.rice = make_product('Yam', farm=self.farm), make_product('Rice', farm=self.farm)
+        self.variant = ProductVariant.objects.create(product=self.yam, name='Tuber', sku='yam-tuber', price='900.00')
+        self.image = ProductImage.objects.create(product=self.yam, image='products/yam.jpg')
+        make_product('Beans', farm=other_farm)
+        # Older than the overlap window, so unchanged rows are not re-sent.
+        earlier = timezone.now() - timedelta(hours=1)
+        for model in (Product, ProductImage, ProductVariant):
+            model.objects.update(updated_at=earlier)
+        self.client.force_login(self.user)
+
+    def cycle(self, token=None):
+        """Follow `next` until the cycle ends; return the merged changes and the last page."""
+        merged = {stream.name: [] for stream in sync.STREAMS}
+        while True:
+            page = self.client.get(reverse('api:sync'), {'token': token} if token else {}).json()
+            for name, rows in page['changes'].items():
+                merged[name] += [row['id'] for row in rows]
+            token = page['next']
+            if not page['more']:
+                return merged, page
+
+    def test_first_cycle_sends_the_whole_catalogue(self):
+        changes, page = self.cycle()
+        self.assertEqual(sorted(changes['products']), sorted([self.yam.pk, self.rice.pk]))
+        self.assertEqual((changes['images'], changes['variants'], changes['deleted']),
+                         ([self.image.pk], [self.variant.pk], []))
+        self.assertFalse(page['reset'])
+
+    @override_settings(SYNC_PAGE_SIZE=1)
+    def test_small_pages_cover_every_change_once(self):
+        changes, _ = self.cycle()
+        self.assertEqual(sorted(changes['products']), sorted([self.yam.pk, self.rice.pk]))
+        self.assertEqual((changes['images'], changes['variants']), ([self.image.pk], [self.variant.pk]))
+
+    def test_next_cycle_sends_only_changes_and_tombstones(self):
+        _, page = self.cycle()
+        self.rice.price = '1200.00'
+        self.rice.save()
+        self.variant.delete()
+        self.image.delete()
+        yam_pk = self.yam.pk
+        self.yam.delete()
+
+        changes, page = self.cycle(page['next'])
+        self.assertEqual((changes['products'], changes['images'], changes['variants']), ([self.rice.pk], [], []))
+        # The product's own tombstone stands for its images and variants.
+        self.assertEqual(changes['deleted'], [yam_pk])
+        self.assertEqual(
+            list(Tombstone.objects.filter(kind=Tombstone.PRODUCT).values_list('object_id', flat=True)), [yam_pk]
+        )
+
+        changes, _ = self.cycle(page['next'])
+        self.assertEqual(changes['products'], [self.rice.pk])  # within the overlap
+        self.assertEqual(changes['deleted'], [yam_pk])
+
+    def test_child_deletions_are_tombstoned_separately(self):
+        _, page = self.cycle()
+        image_pk, variant_pk = self.image.pk, self.variant.pk
+        self.image.delete()
+        self.variant.delete()
+        changes, _ = self.cycle(page['next'])
+        self.assertEqual(sorted(changes['deleted']), sorted([image_pk, variant_pk]))
+
+    def test_expired_tokens_restart_with_a_full_sync(self):
+        stale = sync.make_token(self.user, timezone.now() - timedelta(days=31))
+        changes, page = self.cycle(stale)
+        self.assertTrue(page['reset'])
+        self.assertEqual(sorted(changes['products']), sorted([self.yam.pk, self.rice.pk]))
+
+    def test_tokens_are_bound_to_their_user(self):
+        _, page = self.cycle()
+        self.client.force_login(CustomUser.objects.get(username='bola'))
+        response = self.client.get(reverse('api:sync'), {'token': page['next']})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api:sync'), {'token': page['next'] + 'x'})
+        self.assertEqual(response.json()['error'], 'Invalid sync token.')
+
+    def test_reads_come_from_the_primary(self):
+        with mock.patch('store.sync.routers.read_from_primary') as read_from_primary:
+            self.cycle()
+        read_from_primary.assert_called()
+
+
+class ProductListingTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='ada', email='ada@example.com')
+        self.farm = Farmer.objects.create(
+            user=user, farm_name='Ada Farms', farm_location='Kano', email='ada@example.com'
+        )
+        self.category = Category.objects.create(name='Tubers')
+        self.yam = make_product('Yam', farm=self.farm, category=self.category)
+        self.cocoyam = make_product('Cocoyam', farm=self.farm, category=self.category, farm_location='Wudil')
+
+    def listing(self, product):
+        return ProductListing.objects.get(pk=product.pk)
+
+    def test_listing_copies_the_card_fields(self):
+        listing = self.listing(self.yam)
+        self.assertEqual(
+            (listing.category_slug, listing.farm_name, listing.location, listing.thumbnail),
+            ('tubers', 'Ada Farms', 'Kano', ''),
+        )
+        self.assertEqual(self.listing(self.cocoyam).location, 'Wudil')
+
+    def test_primary_image_becomes_the_thumbnail(self):
+        ProductImage.objects.create(product=self.yam, image='products/side.jpg', order=0)
+        ProductImage.objects.create(product=self.yam, image='products/front.jpg', order=1, is_primary=True)
+        self.assertEqual(self.listing(self.yam).thumbnail, 'products/front.jpg')
+        self.yam.images.get(is_primary=True).delete()
+        self.assertEqual(self.listing(self.yam).thumbnail, 'products/side.jpg')
+
+    def test_category_and_farm_edits_refresh_their_products(self):
+        self.category.slug = 'roots-and-tubers'
+        self.category.save()
+        self.farm.farm_name = 'Ada & Sons'
+        self.farm.save()
+        for product in (self.yam, self.cocoyam):
+            listing = self.listing(product)
+            self.assertEqual((listing.category_slug, listing.farm_name), ('roots-and-tubers', 'Ada & Sons'))
+
+    def test_deleting_a_category_clears_it_from_listings_and_search(self):
+        category_pk = self.category.pk
+        self.category.delete()
+        for product in (self.yam, self.cocoyam):
+            listing = self.listing(product)
+            self.assertEqual((listing.category_id, listing.category_slug), (None, ''))
+        self.assertNotIn(category_pk, dict(search.search('yam').facets['category_id']))
+
+    def test_deleting_a_product_removes_its_listing(self):
+        self.yam.delete()
+        self.assertFalse(ProductListing.objects.filter(pk=self.yam.pk).exists())
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        before = list(ProductListing.objects.order_by('pk').values())
+        self.assertEqual(rebuild_listings(), 2)
+        self.assertEqual(list(ProductListing.objects.order_by('pk').values()), before)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='ada', email='ada@example.com')
+        self.farm = Farmer.objects.create(user=user, farm_name='Ada Farms', email='ada@example.com')
+        self.tubers = Category.objects.create(name='Tubers')
+        self.grains = Category.objects.create(name='Grains')
+        self.yam = make_product('Yam', farm=self.farm, category=self.tubers, price='250.10', stock_quantity=3)
+        self.rice = make_product(
+            'Rice', farm=self.farm, category=self.grains, price='99.99', stock_quantity=5,
+            availability_status='out_of_stock',
+        )
+
+    def counts(self):
+        farmer = FarmerStats.objects.values('product_count', 'in_stock_count', 'total_stock', 'stock_value_kobo')
+        categories = dict(CategoryStats.objects.values_list('pk', 'product_count'))
+        return farmer.get(pk=self.farm.pk), categories
+
+    def test_new_products_are_counted(self):
+        farmer, categories = self.counts()
+        self.assertEqual(farmer, {
+            'product_count': 2, 'in_stock_count': 1, 'total_stock': 8, 'stock_value_kobo': 3 * 25010 + 5 * 9999,
+        })
+        self.assertEqual(categories, {self.tubers.pk: 1, self.grains.pk: 1})
+        self.assertEqual(CategoryStats.objects.get(pk=self.grains.pk).in_stock_count, 0)
+
+    def test_edits_move_contributions(self):
+        self.rice.category = self.tubers
+        self.rice.availability_status = 'in_stock'
+        self.rice.stock_quantity = 1
+        self.rice.save()
+        farmer, categories = self.counts()
+        self.assertEqual(categories, {self.tubers.pk: 2, self.grains.pk: 0})
+        self.assertEqual((farmer['in_stock_count'], farmer['total_stock']), (2, 4))
+        self.assertEqual(CategoryStats.objects.get(pk=self.tubers.pk).in_stock_count, 2)
+
+    def test_edits_to_uncounted_columns_write_no_counters(self):
+        self.yam.description = 'Puna yam from Kano'
+        with CaptureQueriesContext(connection) as queries:
+            self.yam.save()
+        self.assertFalse([query for query in queries if 'stats' in query['sql']])
+
+    def test_deletes_are_uncounted(self):
+        self.yam.delete()
+        farmer, categories = self.counts()
+        self.assertEqual(farmer, {'product_count': 1, 'in_stock_count': 0, 'total_stock': 5, 'stock_value_kobo': 49995})
+        self.assertEqual(categories, {self.tubers.pk: 0, self.grains.pk: 1})
+
+    def test_increments_roll_back_with_the_product(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            make_product('Maize', farm=self.farm, category=self.grains)
+            raise RuntimeError
+        self.assertEqual(self.counts()[0]['product_count'], 2)
+
+    def test_bulk_loads_count_themselves(self):
+        products = Product.objects.bulk_create([
+            Product(name=f'Millet {n}', slug=f'millet-{n}', description='', price='10.00', stock_quantity=2,
+                    farm=self.farm, category=self.grains)
+            for n in range(3)
+        ])
+        counters.count_products(products)
+        self.assertEqual(self.counts()[1][self.grains.pk], 4)
+        self.assertEqual(counters.reconcile(dry_run=True), {CategoryStats: [], FarmerStats: []})
+
+    def test_maintained_counters_do_not_drift(self):
+        self.yam.stock_quantity = 7
+        self.yam.save()
+        self.rice.delete()
+        make_product('Sorghum', farm=self.farm, category=self.grains, price='0.35', stock_quantity=9)
+        self.assertEqual(counters.reconcile(dry_run=True), {CategoryStats: [], FarmerStats: []})
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        # Writes that skip the signals, plus a lost and a corrupted row.
+        Product.objects.filter(pk=self.rice.pk).update(availability_status='in_stock', stock_quantity=6)
+        FarmerStats.objects.filter(pk=self.farm.pk).delete()
+        CategoryStats.objects.filter(pk=self.tubers.pk).update(product_count=40)
+
+        drift = counters.reconcile(dry_run=True)
+        self.assertEqual(drift[CategoryStats], [
+            (self.tubers.pk, {'product_count': 40, 'in_stock_count': 1}, {'product_count': 1, 'in_stock_count': 1}),
+            (self.grains.pk, {'product_count': 1, 'in_stock_count': 0}, {'product_count': 1, 'in_stock_count': 1}),
+        ])
+        self.assertEqual(drift[FarmerStats], [(self.farm.pk, None, {
+            'product_count': 2, 'in_stock_count': 2, 'total_stock': 9, 'stock_value_kobo': 3 * 25010 + 6 * 9999,
+        })])
+        self.assertFalse(FarmerStats.objects.exists())
+
+        out = io.StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('Corrected 3 counter row(s).', out.getvalue())
+        self.assertEqual(counters.reconcile(dry_run=True), {CategoryStats: [], FarmerStats: []})
+        self.assertEqual(self.counts()[0]['stock_value_kobo'], 3 * 25010 + 6 * 9999)
+
+    def test_dry_run_changes_nothing(self):
+        CategoryStats.objects.filter(pk=self.tubers.pk).update(product_count=40)
+        out = io.StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=out)
+        self.assertIn('Dry run: 1 counter row(s) would be corrected.', out.getvalue())
+        self.assertEqual(CategoryStats.objects.get(pk=self.tubers.pk).product_count, 40)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create(username='ada', email='ada@example.com')
+        self.farm = Farmer.objects.create(user=user, farm_name='Ada Farms', email='ada@example.com')
+        self.products = [make_product(f'Yam {n}', farm=self.farm, price='100.00') for n in range(5)]
+
+    def platform(self, metric):
+        return analytics.totals(Rollup.PLATFORM)['all'][metric]
+
+    def test_each_event_is_counted_once_across_batches_and_reruns(self):
+        self.assertEqual(analytics.roll_up(batch_size=2), 5)
+        self.assertEqual(analytics.roll_up(batch_size=2), 0)
+        self.assertEqual(self.platform('listed'), 5)
+        self.assertEqual(analytics.totals(Rollup.FARMER, self.farm.pk)['all']['stock_in'], 50)
+        self.assertEqual(
+            RollupCursor.objects.get(name=analytics.CURSOR_NAME).last_event_id, ProductEvent.objects.latest('id').id
+        )
+
+    def test_later_events_are_added_on_top(self):
+        analytics.roll_up()
+        analytics.record_sale(self.products[0], 3)
+        self.assertEqual(analytics.units_sold(self.products[0].pk), 3)  # pending, not rolled up yet
+        self.assertEqual(analytics.roll_up(), 1)
+        self.assertEqual(analytics.units_sold(self.products[0].pk), 3)
+        self.assertEqual((self.platform('listed'), self.platform('units_sold'), self.platform('revenue_kobo')),
+                         (5, 3, 30000))
+
+    def test_a_failed_batch_leaves_cursor_and_rollups_untouched(self):
+        upsert = analytics.upsert
+        calls = []
+
+        def fail_second_batch(totals):
+            calls.append(totals)
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            upsert(totals)
+
+        with mock.patch.object(analytics, 'upsert', fail_second_batch), self.assertRaises(RuntimeError):
+            analytics.roll_up(batch_size=2)
+        self.assertEqual(self.platform('listed'), 2)
+        self.assertEqual(analytics.roll_up(batch_size=2), 3)
+        self.assertEqual(self.platform('listed'), 5)
+
+    def test_leaders_can_be_limited_to_some_ids(self):
+        for product, quantity in zip(self.products, (1, 4, 2)):
+            analytics.record_sale(product, quantity)
+        analytics.roll_up()
+        self.assertEqual(analytics.leaders(Rollup.PRODUCT, limit=2), [(self.products[1].pk, 4), (self.products[2].pk, 2)])
+        scope_ids = Product.objects.filter(pk__in=[self.products[0].pk, self.products[2].pk]).values('pk')
+        self.assertEqual(
+            analytics.leaders(Rollup.PRODUCT, scope_ids=scope_ids), [(self.products[2].pk, 2), (self.products[0].pk, 1)]
+        )
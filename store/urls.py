@@ -5,6 +5,9 @@ app_name = 'store'
 
 urlpatterns = [
     path('', views.home, name="home"),
+    path('category/<slug:slug>/', views.category_products, name="category"),
+    path('products/more/', views.product_list_partial, name="product_list_partial"),
+    path('search/', views.search, name="search"),
     path('index/', views.index, name='dashboard'),
     path('dashboard/', views.buyer_dashoard, name='buyer_dashboard'),
     path('add-product/', views.add_product, name='add_product'),
@@ -1,12 +1,21 @@
-from django.shortcuts import render, redirect
+import copy
+
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.utils.http import urlencode
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
+from core.db import run_write, write_view
+from farmers.models import Farmer
 from userauths.decorators import email_verification_required
+from userauths.roles import get_user_role
 from .forms import AddProductForm
+from .pagination import paginate_keyset
 from . import models as store_models
-from farmers.models import Farmer
-
-from service_providers.models import Service_Provider
+from . import analytics
+from . import search as product_search
+from .conditional import marketplace_cache, product_etag, product_last_modified
 
 
 # Create your views here.
@@ -16,26 +25,154 @@ def custom_404_view(request, exception):
 def custom_500_view(request):
     return render(request, 'store/500.html', status=500)
 
+MARKETPLACE_PAGE_SIZE = 24
+
+
+def marketplace_page(request, category=None):
+    products = store_models.ProductListing.objects.filter(availability_status='in_stock')
+    if category is not None:
+        products = products.filter(category_id=category.pk)
+    return paginate_keyset(products, request.GET.get('cursor'), MARKETPLACE_PAGE_SIZE)
+
+
+def marketplace_context(request, category=None):
+    page = marketplace_page(request, category)
+    return {
+        "categories": store_models.Category.objects.filter(is_active=True).select_related('stats'),
+        "current_category": category,
+        "products": page.items,
+        "next_cursor": page.next_cursor,
+        "page_cursor": request.GET.get('cursor'),
+    }
+
+
 # @email_verification_required
+@marketplace_cache
 def home(request):
-    categories = store_models.Category.objects.all()
-    products = store_models.Product.objects.filter(availability_status='in_stock')
+    context = marketplace_context(request)
+    return render(request, 'store/marketplace.html', context)
+
+
+@marketplace_cache
+def category_products(request, slug):
+    category = get_object_or_404(store_models.Category, slug=slug, is_active=True)
+    context = marketplace_context(request, category)
+    return render(request, 'store/marketplace.html', context)
+
+
+@marketplace_cache
+def product_list_partial(request):
+    """
+    Next page of marketplace cards for infinite scroll (requested by htmx
+    when the "load more" sentinel scrolls into view).
+    """
+    category = None
+    category_slug = request.GET.get('category')
+    if category_slug:
+        category = get_object_or_404(store_models.Category, slug=category_slug, is_active=True)
+    page = marketplace_page(request, category)
     context = {
-        "categories": categories,
-        "products":products
+        "current_category": category,
+        "products": page.items,
+        "next_cursor": page.next_cursor,
+        "page_cursor": request.GET.get('cursor'),
     }
-    return render(request, 'store/marketplace.html', context)
+    return render(request, 'store/partials/product_cards.html', context)
+
+SEARCH_PAGE_SIZE = 24
+SEARCH_MAX_PAGES = 50
+
+
+@marketplace_cache
+def search(request):
+    query = request.GET.get('q', '').strip()
+    filters = {field: request.GET.get(field) for field in product_search.FACET_FIELDS}
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), SEARCH_MAX_PAGES)
+    except ValueError:
+        page = 1
+
+    results = product_search.search(
+        query, filters, limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE
+    )
+    listings = store_models.ProductListing.objects.in_bulk(results.ids)
+    products = [listings[pk] for pk in results.ids if pk in listings]
+
+    categories = store_models.Category.objects.in_bulk(
+        [value for value, _ in results.facets['category_id']]
+    )
+    labels = {
+        'category_id': {pk: category.name for pk, category in categories.items()},
+        'unit_type': dict(store_models.UNIT_TYPE_CHOICES),
+        'organic_certified': {0: 'Conventional', 1: 'Organic'},
+        'availability_status': dict(store_models.AVAILABILITY_STATUS_CHOICES),
+    }
+    facets = {}
+    for field, values in results.facets.items():
+        facets[field] = []
+        for value, count in values:
+            selected = str(filters.get(field)) == str(value)
+            params = {k: v for k, v in filters.items() if v}
+            params['q'] = query
+            if selected:
+                params.pop(field)
+            else:
+                params[field] = value
+            facets[field].append({
+                "label": labels[field].get(value, value),
+                "count": count,
+                "selected": selected,
+                "url": f"?{urlencode(params)}",
+            })
+
+    page_params = {k: v for k, v in filters.items() if v}
+    page_params['q'] = query
+
+    context = {
+        "query": query,
+        "filters": filters,
+        "products": products,
+        "total": results.total,
+        "facets": facets,
+        "page": page,
+        "has_previous": page > 1,
+        "has_next": page < SEARCH_MAX_PAGES and page * SEARCH_PAGE_SIZE < results.total,
+        "page_query": urlencode(page_params),
+    }
+    return render(request, 'store/search.html', context)
+
+
+def _admin_dashboard_context():
+    # Everything here is read from the analytics rollups (store.analytics).
+    Rollup = store_models.Rollup
+    hourly = analytics.series(Rollup.PLATFORM, period=Rollup.HOUR, count=24)
+    daily = analytics.series(Rollup.PLATFORM, period=Rollup.DAY, count=30)
+    top_categories = analytics.leaders(Rollup.CATEGORY, limit=5)
+    top_farmers = analytics.leaders(Rollup.FARMER, limit=5)
+    categories = store_models.Category.objects.in_bulk([pk for pk, _ in top_categories])
+    farmers = Farmer.objects.in_bulk([pk for pk, _ in top_farmers])
+    return {
+        'totals': analytics.totals(Rollup.PLATFORM, windows={'today': 1, 'week': 7, 'month': 30}),
+        'hourly': hourly,
+        'hourly_peak': max(point['units_sold'] for point in hourly) or 1,
+        'daily': daily,
+        'daily_peak': max(point['revenue_kobo'] for point in daily) or 1,
+        'top_categories': [(categories.get(pk), units) for pk, units in top_categories],
+        'top_farmers': [(farmers.get(pk), units) for pk, units in top_farmers],
+    }
+
 
 @email_verification_required
 def index(request):
-    if request.user.profile.user_type == "farmer":
+    user_type = get_user_role(request)
+    if user_type == "farmer":
         return redirect('farmers:dashboard')
-    elif request.user.profile.user_type == "buyer":
+    elif user_type == "buyer":
         return redirect("store:buyer_dashboard")
-    elif request.user.profile.user_type == "service_provider":
+    elif user_type == "service_provider":
         return render(request, 'store/service_provider_dashboard.html')
-    elif request.user.profile.user_type == "admin":
-        return render(request, 'store/admin_dashboard.html')
+    elif user_type == "admin":
+        return render(request, 'store/admin_dashboard.html', _admin_dashboard_context())
     else:
         return render(request, 'store/dashboard.html')
 
@@ -51,30 +188,45 @@ def orders(request):
 
 
 
+def store_uploads(uploads):
+    """
+    Write uploaded images to storage ahead of the transaction, so a retried
+    run_write() only repeats the database rows. Returns the stored names.
+    """
+    field = store_models.ProductImage._meta.get_field('image')
+    return [
+        field.storage.save(field.generate_filename(None, upload.name), upload, max_length=field.max_length)
+        for upload in uploads
+    ]
+
+
+def save_product(draft, image_names):
+    # Runs inside run_write(): work on a copy so a retry starts from the
+    # unsaved form state (no primary key or slug from the rolled-back try).
+    product = copy.copy(draft)
+    product.save()
+    for idx, name in enumerate(image_names):
+        store_models.ProductImage.objects.create(product=product, image=name, order=idx)
+    return product
+
+
 @email_verification_required
+@write_view
 def add_product(request):
     form = AddProductForm()
     if request.method == "POST":
         form = AddProductForm(request.POST, request.FILES)
         if form.is_valid():
             # Save product instance first, then handle multiple uploaded images
-            if request.user.profile.user_type == "farmer":
-                farm = Farmer.objects.get(user=request.user)   
-                product = form.save(commit=False)
-                product.farm = farm
-                product.save()  
-            elif request.user.profile.user_type == "service_provider":
-                owner = Service_Provider.objects.get(user=request.user)
-                product = form.save(commit=False)
-                product.service_provider = owner
-                product.save()
-            else:
-                product = form.save(commit=False)
-                product.save()
+            user_type = get_user_role(request)
+            product = form.save(commit=False)
+            if user_type == "farmer":
+                product.farm = request.user.farmer_profile
+            elif user_type == "service_provider":
+                product.service_provider = request.user
             # handle multiple uploaded images from the 'image' input
-            images = request.FILES.getlist('image')
-            for idx, img in enumerate(images):
-                store_models.ProductImage.objects.create(product=product, image=img, order=idx)
+            image_names = store_uploads(request.FILES.getlist('image'))
+            run_write(lambda: save_product(product, image_names))
 
             messages.success(request, "Successfully Added Product")
             return redirect("store:dashboard")
@@ -94,6 +246,7 @@ def add_product(request):
     return render(request, "farmers/addproduct.html", context)
 
 @email_verification_required
+@write_view
 def edit_product(request, slug):
     product = store_models.Product.objects.get(slug=slug)
     form = AddProductForm(instance=product)
@@ -101,12 +254,9 @@ def edit_product(request, slug):
         form = AddProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
             product = form.save(commit=False)
-            product.save()
-
             # If new images uploaded, add them
-            images = request.FILES.getlist('image')
-            for idx, img in enumerate(images):
-                store_models.ProductImage.objects.create(product=product, image=img, order=idx)
+            image_names = store_uploads(request.FILES.getlist('image'))
+            run_write(lambda: save_product(product, image_names))
 
             messages.success(request, "Successfully Updated Product")
             return redirect("store:dashboard")
@@ -124,28 +274,32 @@ def edit_product(request, slug):
         "product": product
     }
     
-    return render(request, "store/edit_product.html", context)
+    # The add form posts back to the current URL, so it serves both.
+    return render(request, "farmers/addproduct.html", context)
 
 @email_verification_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=product_etag, last_modified_func=product_last_modified)
 def product_detail(request, slug):
     
-    product = store_models.Product.objects.get(slug=slug)
+    product = get_object_or_404(store_models.Product.objects.with_images(), slug=slug)
     context = {
         "product": product
     }
     return render(request, "farmers/viewsub.html", context)
 
 @email_verification_required
+@write_view
 def delete_product(request, slug):
     product = store_models.Product.objects.get(slug=slug)
-    product.delete()
+    run_write(product.delete)
     messages.success(request, "Successfully Deleted Product")
     return redirect("store:dashboard")
 
 @email_verification_required
 def view_products(request):
-    farmer = Farmer.objects.get(user=request.user)
-    products = store_models.Product.objects.filter(farm=farmer)
+    farmer = request.user.farmer_profile
+    products = store_models.Product.objects.filter(farm=farmer).with_images()
     context = {
         "farmer":farmer,
         "products":products
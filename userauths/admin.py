@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser, Profile
+from .models import CustomUser, Profile, OutboundEmail, UserToken
 
 # Register your models here.
 class CustomUserAdmin(admin.ModelAdmin):
@@ -11,4 +11,15 @@ class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'first_name', 'last_name', 'email')
     search_fields = ('user__username', 'first_name', 'last_name', 'email')
     list_filter = ('state_of_origin', 'nationality')
-admin.site.register(Profile)
\ No newline at end of file
+admin.site.register(Profile)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'created_at', 'sent_at', 'latency_ms')
+    search_fields = ('to', 'subject', 'dedupe_key')
+    list_filter = ('status',)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
+class UserTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'purpose', 'created_at', 'expires_at', 'used_at')
+    search_fields = ('user__username', 'user__email')
+    list_filter = ('purpose',)
+    raw_id_fields = ('user',)
+admin.site.register(UserToken, UserTokenAdmin)
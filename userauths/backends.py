@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+# One-to-one records read on almost every logged-in request.
+ROLE_RELATIONS = ('profile', 'farmer_profile', 'service_provider_profile')
+
+
+class ProfileBackend(ModelBackend):
+    """
+    ModelBackend that loads the user's Profile, Farmer and Service_Provider
+    rows in the same joined query, so `request.user.profile` and friends
+    never cost a query of their own.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related(*ROLE_RELATIONS).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,170 @@
+"""
+Outbound mail spool.
+
+`queue_email` stores a message in OutboundEmail and returns immediately;
+`deliver_batch` (run by `manage.py send_queued_mail`) sends due messages
+over one SMTP connection, retrying failures with exponential backoff.
+"""
+import uuid
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+# A worker that died mid-batch leaves rows in "sending"; reclaim them after this.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_email(subject, message, from_email, recipient_list, html_message='', dedupe_key=''):
+    """
+    Spool a message for delivery. If a message with the same `dedupe_key`
+    is still waiting, it is replaced instead of queueing a second copy
+    (e.g. repeated "resend verification" clicks).
+    """
+    fields = {
+        'to': ','.join(recipient_list),
+        'from_email': from_email,
+        'subject': subject,
+        'body': message,
+        'html_body': html_message or '',
+    }
+    if dedupe_key:
+        waiting = OutboundEmail.objects.filter(dedupe_key=dedupe_key, status=OutboundEmail.QUEUED)
+        with transaction.atomic():
+            if waiting.update(**fields, next_attempt_at=timezone.now()):
+                return None
+            try:
+                with transaction.atomic():
+                    return OutboundEmail.objects.create(dedupe_key=dedupe_key, **fields)
+            except IntegrityError:
+                # Another request queued the same key between our UPDATE and
+                # INSERT; the unique constraint kept it to one row.
+                waiting.update(**fields, next_attempt_at=timezone.now())
+                return None
+    return OutboundEmail.objects.create(**fields)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def claim_batch(batch_size):
+    """Mark up to `batch_size` due messages as ours and return them."""
+    now = timezone.now()
+    due = Q(status=OutboundEmail.QUEUED, next_attempt_at__lte=now) | Q(
+        status=OutboundEmail.SENDING, claimed_at__lt=now - CLAIM_TIMEOUT
+    )
+    ids = list(
+        OutboundEmail.objects.filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Only rows still due when the UPDATE runs become ours, so two workers
+    # never send the same message.
+    OutboundEmail.objects.filter(due, id__in=ids).update(
+        status=OutboundEmail.SENDING, claim_token=token, claimed_at=now
+    )
+    return list(OutboundEmail.objects.filter(claim_token=token, status=OutboundEmail.SENDING))
+
+
+def _build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipients,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def deliver_batch(batch_size=50, max_attempts=5, connection=None):
+    """
+    Send one batch of due messages over a single connection. Returns
+    (sent, retried, failed) counts.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        # Server unreachable: push the whole batch back.
+        for email in emails:
+            _record_failure(email, exc, max_attempts)
+        return _save(emails)
+
+    try:
+        for email in emails:
+            try:
+                connection.send_messages([_build_message(email, connection)])
+            except Exception as exc:
+                _record_failure(email, exc, max_attempts)
+                # The SMTP session may be unusable after an error; start afresh.
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+                continue
+            email.status = OutboundEmail.SENT
+            email.sent_at = timezone.now()
+            email.latency_ms = int((email.sent_at - email.created_at).total_seconds() * 1000)
+            email.attempts += 1
+            email.last_error = ''
+    finally:
+        connection.close()
+        counts = _save(emails)
+    return counts
+
+
+def _record_failure(email, exc, max_attempts):
+    email.attempts += 1
+    email.last_error = f'{type(exc).__name__}: {exc}'
+    if email.attempts >= max_attempts:
+        email.status = OutboundEmail.FAILED
+    else:
+        email.status = OutboundEmail.QUEUED
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+SAVED_FIELDS = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'latency_ms']
+
+
+def _save(emails):
+    """Store the batch's outcomes; returns (sent, retried, failed)."""
+    # Finished rows first and on their own: they cannot clash with the
+    # one-queued-per-key constraint, so a requeue below never undoes them.
+    done = [email for email in emails if email.status != OutboundEmail.QUEUED]
+    OutboundEmail.objects.bulk_update(done, SAVED_FIELDS)
+    for email in emails:
+        if email.status == OutboundEmail.QUEUED:
+            _requeue(email)
+    statuses = [email.status for email in emails]
+    return (
+        statuses.count(OutboundEmail.SENT), statuses.count(OutboundEmail.QUEUED),
+        statuses.count(OutboundEmail.FAILED),
+    )
+
+
+def _requeue(email):
+    try:
+        with transaction.atomic():
+            email.save(update_fields=SAVED_FIELDS)
+    except IntegrityError:
+        # queue_email spooled a newer copy under the same key while this one
+        # was out (e.g. a "resend" click); that copy replaces it.
+        email.status = OutboundEmail.FAILED
+        email.last_error = f'Superseded by a newer message with the same key. {email.last_error}'
+        email.save(update_fields=SAVED_FIELDS)
@@ -1,33 +1,169 @@
-from django.core.management.base import BaseCommand
-from userauths.models import CustomUser
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+def _hash_passwords(password, count):
+    # Every call salts separately, so users never share a stored hash.
+    return [make_password(password) for _ in range(count)]
 
 
 class Command(BaseCommand):
-    help = 'Reset all unusable passwords (marked with !) to allow users to log in'
+    help = 'Reset unusable passwords (marked with !) in batches, hashing across a process pool'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--password',
             type=str,
             default='DefaultPass123!',
-            help='Default password to set for users with unusable passwords'
+            help='Default password to set for the selected users'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Select users whether or not their password is usable; needs a filter '
+                 'below or an interactive confirmation'
+        )
+        parser.add_argument(
+            '--include-staff',
+            action='store_true',
+            help='Also reset staff and superuser accounts (skipped by default)'
+        )
+        parser.add_argument(
+            '--user-type',
+            choices=['buyer', 'farmer', 'service_provider', 'admin'],
+            help='Only reset users whose profile has this user type'
+        )
+        parser.add_argument(
+            '--username',
+            dest='usernames',
+            action='append',
+            help='Only reset this user (repeatable)'
+        )
+        parser.add_argument(
+            '--email-domain',
+            help='Only reset users whose email ends with @<domain>'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users hashed and written per transaction'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of hashing processes'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report which users would be reset without changing anything'
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Do not prompt for confirmation; --all then requires a filter'
         )
 
+    def has_filter(self, options):
+        return bool(options['user_type'] or options['usernames'] or options['email_domain'])
+
+    def get_queryset(self, options):
+        users = get_user_model().objects.all()
+        if not options['all']:
+            users = users.filter(password__startswith=UNUSABLE_PASSWORD_PREFIX)
+        if not options['include_staff']:
+            users = users.filter(is_staff=False, is_superuser=False)
+        if options['user_type']:
+            users = users.filter(profile__user_type=options['user_type'])
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        if options['email_domain']:
+            users = users.filter(email__iendswith='@' + options['email_domain'].lstrip('@'))
+        return users
+
+    def iter_batches(self, users, batch_size):
+        """Yield lists of primary keys, seeking on pk so each batch is an index range."""
+        last_pk = None
+        while True:
+            page = users.order_by('pk')
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            pks = list(page.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return
+            yield pks
+            last_pk = pks[-1]
+
     def handle(self, *args, **options):
-        password = options['password']
-        users = CustomUser.objects.filter(password__startswith='!')
-        count = users.count()
+        batch_size = options['batch_size']
+        workers = options['workers']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        # --all overwrites working passwords with a well-known default.
+        confirm = options['all'] and not self.has_filter(options) and not options['dry_run']
+        if confirm and not options['interactive']:
+            raise CommandError(
+                '--all resets every account; add --user-type, --username or --email-domain, '
+                'or run interactively to confirm'
+            )
 
+        users = self.get_queryset(options)
+        count = users.count()
         if count == 0:
-            self.stdout.write(self.style.SUCCESS('No users with unusable passwords found.'))
+            self.stdout.write(self.style.SUCCESS('No matching users found.'))
+            return
+
+        self.stdout.write(f'Found {count} user(s) to reset.')
+        if options['dry_run']:
+            for username in users.order_by('pk').values_list('username', flat=True)[:20]:
+                self.stdout.write(f'  would reset {username}')
+            if count > 20:
+                self.stdout.write(f'  ... and {count - 20} more')
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {count} user(s) would be reset.'))
             return
+        if confirm:
+            answer = input(
+                f'This will replace the password of {count} user(s), including working ones. '
+                "Type 'yes' to continue: "
+            )
+            if answer != 'yes':
+                raise CommandError('Reset cancelled.')
 
-        self.stdout.write(f'Found {count} users with unusable passwords.')
-        self.stdout.write(f'Setting new password: {password}')
+        User = get_user_model()
+        # Small hashing tasks keep every worker busy until the end of a batch.
+        chunk = max(1, min(64, batch_size // (workers * 4)))
+        done = 0
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for pks in self.iter_batches(users, batch_size):
+                sizes = [min(chunk, len(pks) - start) for start in range(0, len(pks), chunk)]
+                hashes = [
+                    encoded
+                    for encoded_chunk in pool.map(_hash_passwords, [options['password']] * len(sizes), sizes)
+                    for encoded in encoded_chunk
+                ]
+                with transaction.atomic():
+                    User.objects.bulk_update(
+                        [User(pk=pk, password=encoded) for pk, encoded in zip(pks, hashes)],
+                        ['password'],
+                    )
 
-        for user in users:
-            user.set_password(password)
-            user.save()
-            self.stdout.write(f'  ✓ Reset {user.username}')
+                done += len(pks)
+                rate = done / (time.monotonic() - started)
+                self.stdout.write(f'  {done}/{count} ({done * 100 // count}%) reset, {rate:,.1f} users/s')
 
-        self.stdout.write(self.style.SUCCESS(f'Successfully reset {count} user password(s).'))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully reset {done} user password(s) in {elapsed:.1f}s with {workers} worker(s).'
+        ))
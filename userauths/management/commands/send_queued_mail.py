@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, Max
+
+from userauths.mail import deliver_batch
+from userauths.models import OutboundEmail
+
+
+class Command(BaseCommand):
+    help = 'Deliver spooled outbound email in batches over a single SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Messages sent per SMTP connection'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=5,
+            help='Give up on a message after this many failed attempts'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for new mail instead of exiting when the queue is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep between polls when the queue is empty (with --loop)'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        totals = [0, 0, 0]
+        while True:
+            sent, retried, failed = deliver_batch(options['batch_size'], options['max_attempts'])
+            if sent or retried or failed:
+                totals = [totals[0] + sent, totals[1] + retried, totals[2] + failed]
+                self.stdout.write(f'Batch: {sent} sent, {retried} to retry, {failed} failed permanently')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {totals[0]}, {totals[1]} queued for retry, {totals[2]} failed permanently.'
+        ))
+        stats = OutboundEmail.objects.filter(status=OutboundEmail.SENT, latency_ms__isnull=False).aggregate(
+            count=Count('id'), avg=Avg('latency_ms'), worst=Max('latency_ms')
+        )
+        if stats['count']:
+            self.stdout.write(
+                f'Delivery latency over {stats["count"]} sent message(s): '
+                f'avg {stats["avg"] / 1000:.1f}s, max {stats["worst"] / 1000:.1f}s'
+            )
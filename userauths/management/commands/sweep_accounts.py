@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from userauths.models import CustomUser, UserToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired/used tokens and abandoned unverified signups in small transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--token-grace-days',
+            type=int,
+            default=7,
+            help='Keep expired or used tokens for this many days before deleting them'
+        )
+        parser.add_argument(
+            '--abandoned-after-days',
+            type=int,
+            default=30,
+            help='Purge unverified accounts older than this with no live verification token'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Rows deleted per transaction'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches so other writers get the database'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        now = timezone.now()
+
+        token_cutoff = now - timedelta(days=options['token_grace_days'])
+        tokens = UserToken.objects.filter(Q(expires_at__lt=token_cutoff) | Q(used_at__lt=token_cutoff))
+
+        live_token = UserToken.objects.filter(
+            user=OuterRef('pk'), purpose=UserToken.VERIFY_EMAIL, used_at__isnull=True, expires_at__gt=now
+        )
+        abandoned = CustomUser.objects.filter(
+            email_verified=False,
+            is_staff=False,
+            is_superuser=False,
+            date_joined__lt=now - timedelta(days=options['abandoned_after_days']),
+        ).exclude(Exists(live_token))
+
+        if options['dry_run']:
+            self.stdout.write(f'Would delete {tokens.count()} token(s).')
+            self.stdout.write(f'Would purge {abandoned.count()} abandoned unverified account(s).')
+            for username in abandoned.order_by('pk').values_list('username', flat=True)[:20]:
+                self.stdout.write(f'  {username}')
+            return
+
+        deleted_tokens = self.delete_in_batches(tokens, options)
+        self.stdout.write(f'Deleted {deleted_tokens} expired or used token(s).')
+        # Deleting the user cascades to its Profile, Farmer and remaining tokens.
+        purged = self.delete_in_batches(abandoned, options)
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {purged} abandoned unverified account(s) and {deleted_tokens} token(s).'
+        ))
+
+    def delete_in_batches(self, queryset, options):
+        """
+        Delete `queryset` a primary-key batch at a time, each in its own short
+        transaction, so SQLite's write lock is never held for long.
+        """
+        model = queryset.model
+        deleted = 0
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                return deleted
+            with transaction.atomic():
+                # Re-check the filter: a user may have verified since the select.
+                _, per_model = queryset.filter(pk__in=pks).delete()
+            deleted += per_model.get(model._meta.label, 0)
+            self.stdout.write(f'  {model._meta.verbose_name_plural}: {deleted} deleted')
+            time.sleep(options['pause'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userauths', '0002_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='role_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:22
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_verification_tokens(apps, schema_editor):
+    """Keep links already mailed to unverified users working."""
+    CustomUser = apps.get_model('userauths', 'CustomUser')
+    UserToken = apps.get_model('userauths', 'UserToken')
+    users = CustomUser.objects.filter(email_verified=False).values_list('pk', 'verification_token', 'token_created_at')
+    UserToken.objects.bulk_create(
+        [
+            UserToken(
+                user_id=pk,
+                token=token,
+                purpose='verify_email',
+                created_at=created_at,
+                expires_at=created_at + timedelta(hours=24),
+            )
+            for pk, token, created_at in users.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userauths', '0003_profile_role_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('purpose', models.CharField(choices=[('verify_email', 'Email verification'), ('password_reset', 'Password reset')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('used_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'purpose'], name='userauths_u_user_id_02a36d_idx')],
+            },
+        ),
+        migrations.RunPython(copy_verification_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='token_created_at',
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='verification_token',
+        ),
+    ]
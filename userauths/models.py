@@ -1,10 +1,13 @@
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 import string
 import random
 import uuid
 
+from core.slugs import unique_slug
+
 # Create your models here.
 USER_TYPE = [
     ("farmer", "Farmer"),
@@ -19,8 +22,6 @@ class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=50, blank=True, null=True)
     email_verified = models.BooleanField(default=False)
-    verification_token = models.UUIDField(default=uuid.uuid4, editable=False)
-    token_created_at = models.DateTimeField(default=timezone.now)
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
@@ -53,13 +54,105 @@ class Profile(models.Model):
     birth_date = models.DateField(blank=True, null=True)
     user_type = models.CharField(max_length=20, choices=USER_TYPE, blank=True, null=True, default="buyer")
     slug = models.SlugField(unique=True, blank=True, null=True)
+    # Incremented by every save; session role snapshots compare it (userauths.roles).
+    role_version = models.PositiveIntegerField(default=0, editable=False)
     
     def __str__(self):
         return f"{self.user.username}'s profile"
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = f"{self.user.username}-profile"
-            if Profile.objects.filter(slug=self.slug).exists():
-                self.slug += '-' + str(random.randint(1000, 9999))
-        super().save(*args, **kwargs)
\ No newline at end of file
+            self.slug = unique_slug(Profile, f"{self.user.username}-profile")
+        if not self._state.adding:
+            # In SQL, so concurrent saves each count.
+            self.role_version = F('role_version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'role_version'}
+        super().save(*args, **kwargs)
+
+class UserToken(models.Model):
+    """
+    Single-use token mailed to a user (email verification, password reset).
+    Issued and redeemed through `userauths.tokens`; expired and used rows are
+    removed by `manage.py sweep_accounts`.
+    """
+    VERIFY_EMAIL = 'verify_email'
+    PASSWORD_RESET = 'password_reset'
+    PURPOSE_CHOICES = [
+        (VERIFY_EMAIL, 'Email verification'),
+        (PASSWORD_RESET, 'Password reset'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='tokens')
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    used_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'purpose']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_purpose_display()} token for {self.user}"
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+
+class OutboundEmail(models.Model):
+    """
+    Mail spool: views queue messages here and `manage.py send_queued_mail`
+    delivers them in batches over one SMTP connection.
+    """
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    to = models.TextField(help_text="Comma-separated recipient addresses")
+    from_email = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    dedupe_key = models.CharField(max_length=100, blank=True, db_index=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    latency_ms = models.PositiveIntegerField(blank=True, null=True, help_text="Time from queueing to delivery")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        constraints = [
+            # At most one waiting copy per key; see userauths.mail.queue_email.
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='queued') & ~models.Q(dedupe_key=''),
+                name='outbound_email_one_queued_per_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+    @property
+    def recipients(self):
+        return [address for address in self.to.split(',') if address]
@@ -0,0 +1,59 @@
+"""
+Per-session snapshot of the logged-in user's role (Profile.user_type).
+
+Dashboard routing only needs the role, so it is kept in the session for
+ROLE_SNAPSHOT_TTL seconds together with the profile's role_version, which
+every Profile save increments. Each request compares that one column, read
+with a narrow query on the profile, instead of loading the user and its
+related rows; a changed or deleted profile makes the snapshot stale in
+every worker at once. Bulk updates of user_type must increment
+role_version themselves.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+
+from .models import Profile
+
+SNAPSHOT_SESSION_KEY = '_user_role'
+
+
+def _role_from_user(user):
+    try:
+        return user.profile.user_type
+    except user._meta.model.profile.RelatedObjectDoesNotExist:
+        return None
+
+
+def get_user_role(request):
+    """Return the user_type of the logged-in user, or None when anonymous."""
+    if hasattr(request, '_cached_user_role'):
+        return request._cached_user_role
+
+    user_id = request.session.get(SESSION_KEY)
+    if user_id is None:
+        role = None
+    else:
+        ttl = getattr(settings, 'ROLE_SNAPSHOT_TTL', 5 * 60)
+        # None when the user has no profile (any more).
+        version = Profile.objects.filter(user_id=user_id).values_list('role_version', flat=True).first()
+        snapshot = request.session.get(SNAPSHOT_SESSION_KEY)
+        if (
+            snapshot
+            and snapshot['user'] == str(user_id)
+            and snapshot['version'] == version
+            and time.time() - snapshot['at'] < ttl
+        ):
+            role = snapshot['role']
+        else:
+            role = _role_from_user(request.user) if request.user.is_authenticated else None
+            request.session[SNAPSHOT_SESSION_KEY] = {
+                'user': str(user_id),
+                'role': role,
+                'version': version,
+                'at': time.time(),
+            }
+
+    request._cached_user_role = role
+    return role
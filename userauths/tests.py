@@ -1,3 +1,363 @@
-from django.test import TestCase
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .mail import CLAIM_TIMEOUT, RETRY_BASE_SECONDS, claim_batch, deliver_batch, queue_email
+from .models import CustomUser, OutboundEmail, Profile, UserToken
+from .roles import SNAPSHOT_SESSION_KEY, get_user_role
+from .tokens import ExpiredToken, InvalidToken, issue_token, redeem_token
+
+
+def queue(subject='Verify your email', to='ada@example.com', **kwargs):
+    return queue_email(subject, 'Body', 'noreply@example.com', [to], **kwargs)
+
+
+class FlakyBackend(EmailBackend):
+    """Locmem backend whose first `failures` sends raise."""
+
+    def __init__(self, failures=1, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def send_messages(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionResetError('connection reset by peer')
+        return super().send_messages(messages)
+
+
+class UnreachableBackend(EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('connection refused')
+
+
+class QueueEmailTests(TestCase):
+    def test_waiting_copy_is_replaced(self):
+        first = queue('Old link', dedupe_key='verify:1')
+        self.assertIsNone(queue('New link', dedupe_key='verify:1'))
+        self.assertEqual(list(OutboundEmail.objects.values_list('id', 'subject')), [(first.pk, 'New link')])
+
+    def test_sent_copies_and_blank_keys_do_not_dedupe(self):
+        queue(dedupe_key='verify:1')
+        OutboundEmail.objects.update(status=OutboundEmail.SENT)
+        queue(dedupe_key='verify:1')
+        queue()
+        queue()
+        self.assertEqual(OutboundEmail.objects.count(), 4)
+
+    def test_database_allows_one_waiting_copy_per_key(self):
+        queue(dedupe_key='verify:1')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OutboundEmail.objects.create(to='ada@example.com', subject='s', body='b', dedupe_key='verify:1')
+
+    def test_losing_the_insert_race_updates_the_winner(self):
+        winner = queue('Old link', dedupe_key='verify:1')
+        update = QuerySet.update
+        calls = []
+
+        def miss_first_update(queryset, **kwargs):
+            # The concurrent INSERT lands just after our first UPDATE.
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=miss_first_update):
+            self.assertIsNone(queue('New link', dedupe_key='verify:1'))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(list(OutboundEmail.objects.values_list('id', 'subject')), [(winner.pk, 'New link')])
+
+
+class DeliveryTests(TestCase):
+    def test_batch_is_sent_and_recorded(self):
+        queue(to='ada@example.com')
+        queue(to='obi@example.com', html_message='<p>Body</p>')
+        self.assertEqual(deliver_batch(), (2, 0, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['ada@example.com', 'obi@example.com'])
+        for email in OutboundEmail.objects.all():
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.SENT, 1))
+            self.assertIsNotNone(email.latency_ms)
+        self.assertEqual(deliver_batch(), (0, 0, 0))
+
+    def test_claimed_rows_are_not_claimed_twice(self):
+        queue()
+        self.assertEqual(len(claim_batch(10)), 1)
+        self.assertEqual(claim_batch(10), [])
+
+    def test_abandoned_claims_are_reclaimed(self):
+        queue()
+        claim_batch(10)
+        OutboundEmail.objects.update(claimed_at=timezone.now() - CLAIM_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(deliver_batch(), (1, 0, 0))
+
+    def test_failures_back_off_exponentially(self):
+        email = queue()
+        for attempt, delay in ((1, RETRY_BASE_SECONDS), (2, RETRY_BASE_SECONDS * 2)):
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            before = timezone.now()
+            self.assertEqual(deliver_batch(connection=FlakyBackend()), (0, 1, 0))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.QUEUED, attempt))
+            self.assertIn('connection reset', email.last_error)
+            self.assertAlmostEqual(
+                (email.next_attempt_at - before).total_seconds(), delay, delta=5
+            )
+        # Not due yet.
+        self.assertEqual(deliver_batch(), (0, 0, 0))
+
+    def test_retry_succeeds_once_due(self):
+        queue()
+        deliver_batch(connection=FlakyBackend())
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_batch(), (1, 0, 0))
+        self.assertEqual(OutboundEmail.objects.get().attempts, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        queue()
+        self.assertEqual(deliver_batch(max_attempts=1, connection=FlakyBackend()), (0, 0, 1))
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.FAILED)
+
+    def test_one_failure_does_not_stop_the_batch(self):
+        queue(to='ada@example.com')
+        queue(to='obi@example.com')
+        self.assertEqual(deliver_batch(connection=FlakyBackend(failures=1)), (1, 1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_send_yields_to_a_newer_copy_queued_meanwhile(self):
+        queue('Old link', to='ada@example.com', dedupe_key='verify:1')
+        queue(to='obi@example.com')
+
+        class ResendDuringSend(FlakyBackend):
+            def send_messages(self, messages):
+                if messages[0].subject == 'Old link':
+                    # The user clicks "resend" while the first copy is out.
+                    queue('New link', to='ada@example.com', dedupe_key='verify:1')
+                    raise ConnectionResetError('connection reset by peer')
+                return super(FlakyBackend, self).send_messages(messages)
+
+        self.assertEqual(deliver_batch(connection=ResendDuringSend(failures=0)), (1, 0, 1))
+        self.assertEqual(
+            set(OutboundEmail.objects.values_list('subject', 'status')),
+            {('Old link', OutboundEmail.FAILED), ('Verify your email', OutboundEmail.SENT),
+             ('New link', OutboundEmail.QUEUED)},
+        )
+        self.assertIn('Superseded', OutboundEmail.objects.get(subject='Old link').last_error)
+        # The sent row is not claimed again, so nobody gets it twice.
+        OutboundEmail.objects.update(claimed_at=timezone.now() - CLAIM_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(deliver_batch(), (1, 0, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['Verify your email', 'New link'])
+
+    def test_unreachable_server_requeues_the_whole_batch(self):
+        queue(to='ada@example.com')
+        queue(to='obi@example.com')
+        self.assertEqual(deliver_batch(connection=UnreachableBackend()), (0, 2, 0))
+        self.assertEqual(
+            set(OutboundEmail.objects.values_list('status', 'attempts')), {(OutboundEmail.QUEUED, 1)}
+        )
+
+
+class ResetUnusablePasswordsTests(TestCase):
+    def setUp(self):
+        self.locked = CustomUser.objects.create_user('locked', 'locked@example.com')
+        self.working = CustomUser.objects.create_user('working', 'working@farm.ng', password='s3cret-pass')
+        self.admin = CustomUser.objects.create_superuser('admin', 'admin@farm.ng', password='adm1n-pass')
+
+    def reset(self, *args, **options):
+        out = StringIO()
+        call_command('reset_unusable_passwords', *args, workers=1, stdout=out, **options)
+        return out.getvalue()
+
+    def test_only_unusable_passwords_are_reset(self):
+        self.reset()
+        self.locked.refresh_from_db()
+        self.working.refresh_from_db()
+        self.assertTrue(self.locked.check_password('DefaultPass123!'))
+        self.assertTrue(self.working.check_password('s3cret-pass'))
+
+    def test_staff_are_skipped_unless_included(self):
+        self.admin.set_unusable_password()
+        self.admin.save()
+        self.assertNotIn('admin', self.reset('--dry-run'))
+        self.assertIn('would reset admin', self.reset('--dry-run', '--include-staff'))
+
+    def test_all_without_a_filter_needs_confirmation(self):
+        with self.assertRaisesMessage(CommandError, '--all resets every account'):
+            self.reset('--all', '--no-input')
+        with mock.patch('builtins.input', return_value='no'), self.assertRaisesMessage(CommandError, 'cancelled'):
+            self.reset('--all')
+        self.working.refresh_from_db()
+        self.assertTrue(self.working.check_password('s3cret-pass'))
+
+        with mock.patch('builtins.input', return_value='yes'):
+            self.reset('--all')
+        self.working.refresh_from_db()
+        self.admin.refresh_from_db()
+        self.assertTrue(self.working.check_password('DefaultPass123!'))
+        self.assertTrue(self.admin.check_password('adm1n-pass'))
+
+    def test_all_with_a_filter_runs_unattended(self):
+        self.reset('--all', '--email-domain', 'farm.ng', '--no-input')
+        self.working.refresh_from_db()
+        self.assertTrue(self.working.check_password('DefaultPass123!'))
+
+
+class TokenRedemptionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('ada', 'ada@example.com', password='s3cret-pass')
+
+    def message(self, response):
+        return ' '.join(str(message) for message in get_messages(response.wsgi_request))
+
+    def test_token_redeems_once(self):
+        token = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        self.assertEqual(redeem_token(token.token, UserToken.VERIFY_EMAIL).user, self.user)
+        with self.assertRaises(InvalidToken):
+            redeem_token(token.token, UserToken.VERIFY_EMAIL)
+
+    def test_token_only_redeems_for_its_purpose(self):
+        token = issue_token(self.user, UserToken.PASSWORD_RESET)
+        with self.assertRaises(InvalidToken):
+            redeem_token(token.token, UserToken.VERIFY_EMAIL)
+        redeem_token(token.token, UserToken.PASSWORD_RESET)
+
+    def test_expired_token_is_refused(self):
+        token = issue_token(self.user, UserToken.PASSWORD_RESET)
+        UserToken.objects.filter(pk=token.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        with self.assertRaises(ExpiredToken):
+            redeem_token(token.token, UserToken.PASSWORD_RESET)
+        self.assertIsNone(UserToken.objects.get(pk=token.pk).used_at)
+
+    def test_reissuing_retires_unused_tokens_of_that_purpose(self):
+        old = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        reset = issue_token(self.user, UserToken.PASSWORD_RESET)
+        new = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        with self.assertRaises(InvalidToken):
+            redeem_token(old.token, UserToken.VERIFY_EMAIL)
+        redeem_token(new.token, UserToken.VERIFY_EMAIL)
+        redeem_token(reset.token, UserToken.PASSWORD_RESET)
+
+    def test_losing_a_simultaneous_click_is_invalid(self):
+        token = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        # The other request marks it used between our read and our UPDATE.
+        stale = UserToken.objects.select_related('user').get(pk=token.pk)
+        UserToken.objects.filter(pk=token.pk).update(used_at=timezone.now())
+        with mock.patch.object(UserToken.objects, 'select_related') as select_related:
+            select_related.return_value.get.return_value = stale
+            with self.assertRaises(InvalidToken):
+                redeem_token(token.token, UserToken.VERIFY_EMAIL)
+
+    def test_verification_link_verifies_once(self):
+        token = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        url = reverse('userauths:verify-email', args=[token.token])
+        self.assertRedirects(self.client.get(url), reverse('userauths:login'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.email_verified)
+        self.assertTrue(OutboundEmail.objects.filter(dedupe_key=f'welcome:{self.user.pk}').exists())
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('userauths:login'))
+        self.assertIn('already verified', self.message(response))
+
+    def test_unknown_link_is_invalid(self):
+        response = self.client.get(reverse('userauths:verify-email', args=[uuid.uuid4()]))
+        self.assertEqual(self.message(response), 'Invalid verification link.')
+
+    def test_expired_link_offers_a_new_one(self):
+        token = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        UserToken.objects.filter(pk=token.pk).update(expires_at=timezone.now())
+        response = self.client.get(reverse('userauths:verify-email', args=[token.token]))
+        self.assertRedirects(response, reverse('userauths:resend-verification'))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.email_verified)
+
+    def test_resending_replaces_the_token_and_the_queued_email(self):
+        for _ in range(2):
+            self.client.post(reverse('userauths:resend-verification'), {'email': 'ada@example.com'})
+        self.assertEqual(UserToken.objects.filter(user=self.user, used_at__isnull=True).count(), 1)
+        token = UserToken.objects.get(user=self.user)
+        email = OutboundEmail.objects.get(dedupe_key=f'verify:{self.user.pk}')
+        self.assertIn(str(token.token), email.html_body)
+
+    def test_sweep_removes_dead_tokens_and_abandoned_signups(self):
+        long_ago = timezone.now() - timedelta(days=60)
+        expired = issue_token(self.user, UserToken.PASSWORD_RESET)
+        UserToken.objects.filter(pk=expired.pk).update(expires_at=long_ago)
+        live = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        abandoned = CustomUser.objects.create_user('gone', 'gone@example.com')
+        waiting = CustomUser.objects.create_user('waiting', 'waiting@example.com')
+        issue_token(waiting, UserToken.VERIFY_EMAIL)
+        CustomUser.objects.filter(pk__in=[self.user.pk, abandoned.pk, waiting.pk]).update(date_joined=long_ago)
+        CustomUser.objects.filter(pk=self.user.pk).update(email_verified=True)
+
+        call_command('sweep_accounts', pause=0, stdout=StringIO())
+        self.assertEqual(list(UserToken.objects.filter(user=self.user)), [live])
+        self.assertEqual(
+            set(CustomUser.objects.values_list('username', flat=True)), {'ada', 'waiting'}
+        )
+
+
+class VerifyEmailWriteTests(TransactionTestCase):
+    """The redeem and the verified flag commit together (needs real transactions)."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('ada', 'ada@example.com', password='s3cret-pass')
+
+    def test_failed_verification_leaves_the_token_usable(self):
+        token = issue_token(self.user, UserToken.VERIFY_EMAIL)
+        url = reverse('userauths:verify-email', args=[token.token])
+        with mock.patch('userauths.views.send_welcome_email', side_effect=DatabaseError('disk I/O error')):
+            with self.assertRaises(DatabaseError):
+                self.client.get(url)
+        self.assertIsNone(UserToken.objects.get(pk=token.pk).used_at)
+        self.assertRedirects(self.client.get(url), reverse('userauths:login'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.email_verified)
+
+
+class RoleSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('ada', 'ada@example.com', password='s3cret-pass',
+                                                   email_verified=True)
+        self.profile = Profile.objects.create(user=self.user, user_type='farmer')
+        self.client.force_login(self.user)
+
+    def role(self):
+        response = self.client.get(reverse('store:dashboard'))
+        return get_user_role(response.wsgi_request)
+
+    def test_snapshot_is_reused_while_the_profile_is_unchanged(self):
+        self.assertEqual(self.role(), 'farmer')
+        # Another process changes the row behind the snapshot's back; only
+        # role_version tells the snapshot apart.
+        Profile.objects.filter(pk=self.profile.pk).update(user_type='buyer')
+        self.assertEqual(self.role(), 'farmer')
+
+    def test_a_saved_profile_is_seen_by_every_session_at_once(self):
+        self.assertEqual(self.role(), 'farmer')
+        # Saved elsewhere (another worker, the admin site): no shared cache
+        # is involved, the version lives on the row.
+        profile = Profile.objects.get(pk=self.profile.pk)
+        profile.user_type = 'buyer'
+        profile.save(update_fields=['user_type'])
+        self.assertEqual(self.role(), 'buyer')
+        self.assertEqual(self.client.session[SNAPSHOT_SESSION_KEY]['version'], 1)
+
+    def test_a_deleted_profile_drops_the_role(self):
+        self.assertEqual(self.role(), 'farmer')
+        self.profile.delete()
+        self.assertIsNone(self.role())
+
+    def test_concurrent_saves_each_bump_the_version(self):
+        first, second = Profile.objects.get(pk=self.profile.pk), Profile.objects.get(pk=self.profile.pk)
+        first.save()
+        second.save()
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).role_version, 2)
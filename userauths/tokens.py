@@ -0,0 +1,48 @@
+"""
+Issue and redeem UserToken rows. Lookups go through the unique index on
+`token`, and issuing a new token for a purpose retires the user's older ones.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import UserToken
+
+LIFETIMES = {
+    UserToken.VERIFY_EMAIL: timedelta(hours=24),
+    UserToken.PASSWORD_RESET: timedelta(hours=1),
+}
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+def issue_token(user, purpose):
+    now = timezone.now()
+    UserToken.objects.filter(user=user, purpose=purpose, used_at__isnull=True).delete()
+    return UserToken.objects.create(user=user, purpose=purpose, created_at=now, expires_at=now + LIFETIMES[purpose])
+
+
+def redeem_token(token, purpose):
+    """
+    Mark `token` used and return it (with its user loaded). Raises
+    InvalidToken for unknown or already-used tokens, ExpiredToken when it is
+    past its expiry.
+    """
+    try:
+        user_token = UserToken.objects.select_related('user').get(token=token, purpose=purpose)
+    except UserToken.DoesNotExist:
+        raise InvalidToken(token)
+    if user_token.is_expired:
+        raise ExpiredToken(token)
+    # Conditional update so two simultaneous clicks cannot both redeem it.
+    user_token.used_at = timezone.now()
+    claimed = UserToken.objects.filter(pk=user_token.pk, used_at__isnull=True).update(used_at=user_token.used_at)
+    if not claimed:
+        raise InvalidToken(token)
+    return user_token
@@ -1,16 +1,20 @@
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from Agrosite import settings
 from django.urls import reverse
 
+from .mail import queue_email
+from .models import UserToken
+from .tokens import issue_token
+
 def send_verification_email(user, request):
     """
-    Send verification email to user
+    Queue verification email to user with a fresh verification token
     """
     # Generate verification URL
+    token = issue_token(user, UserToken.VERIFY_EMAIL)
     verification_url = request.build_absolute_uri(
-        reverse('userauths:verify-email', kwargs={'token': str(user.verification_token)})
+        reverse('userauths:verify-email', kwargs={'token': str(token.token)})
     )
     
     # Email content
@@ -26,19 +30,20 @@ def send_verification_email(user, request):
     # Plain text version
     plain_message = strip_tags(html_message)
     
-    # Send email
-    send_mail(
+    # Queue email; `manage.py send_queued_mail` delivers it. Repeated resend
+    # requests replace the pending message instead of piling up.
+    queue_email(
         subject=subject,
         message=plain_message,
         from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[user.email],
         html_message=html_message,
-        fail_silently=False,
+        dedupe_key=f'verify:{user.pk}',
     )
 
 def send_welcome_email(user):
     """
-    Send welcome email after verification
+    Queue welcome email after verification
     """
     subject = 'Welcome to Abiagrow.connect!'
     
@@ -49,11 +54,11 @@ def send_welcome_email(user):
     
     plain_message = strip_tags(html_message)
     
-    send_mail(
+    queue_email(
         subject=subject,
         message=plain_message,
         from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[user.email],
         html_message=html_message,
-        fail_silently=False,
+        dedupe_key=f'welcome:{user.pk}',
     )
\ No newline at end of file
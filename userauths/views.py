@@ -1,22 +1,24 @@
+import copy
+
 from django.shortcuts import render, redirect
 from userauths.forms import RegistrationForm
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
-from userauths.models import Profile, CustomUser
+from userauths.models import Profile, CustomUser, UserToken
 from .utils import send_verification_email, send_welcome_email
 from .decorators import email_verification_required
+from core.db import run_write, write_view
+from .tokens import ExpiredToken, InvalidToken, redeem_token
 from farmers.models import Farmer
 
-from django.utils import timezone
-from datetime import timedelta
 from django.core.exceptions import ValidationError
-import uuid
 
 # Create your views here.
 
 def signup_view(request):
     return render(request, "userauths/signup_view.html")
 
+@write_view
 def register_farmer(request):
     if request.user.is_authenticated:
         messages.info(request, 'You are already logged in.')
@@ -28,12 +30,7 @@ def register_farmer(request):
         
         if form.is_valid():
             # Create user but don't commit so we can set password properly
-            user = form.save()
-           
-            # Ensure token and timestamp are set
-            user.verification_token = uuid.uuid4()
-            user.token_created_at = timezone.now()
-            user.save()
+            draft = form.save(commit=False)
 
             # Create profile
             first_name = form.cleaned_data.get('first_name')
@@ -44,27 +41,33 @@ def register_farmer(request):
             farm_name = request.POST.get("farm_name")
             farm_location = request.POST.get("farm_location")
             
-            
-            Profile.objects.create(
-                user=user,
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                phone_number=phone_number,
-                user_type="farmer"
-            )
-
-            Farmer.objects.create(
-                user = user,
-                farm_name=farm_name,
-                farm_location=farm_location,
-                phone_number=phone_number,
-                email=email,
-            )
+            def create_account():
+                # Retried by run_write(), so start from the unsaved user each time.
+                user = copy.copy(draft)
+                user.save()
+                Profile.objects.create(
+                    user=user,
+                    first_name=first_name,
+                    last_name=last_name,
+                    email=email,
+                    phone_number=phone_number,
+                    user_type="farmer"
+                )
+
+                Farmer.objects.create(
+                    user = user,
+                    farm_name=farm_name,
+                    farm_location=farm_location,
+                    phone_number=phone_number,
+                    email=email,
+                )
+                return user
+
+            user = run_write(create_account)
             
              # Send verification email
             try:
-                send_verification_email(user, request)
+                run_write(lambda: send_verification_email(user, request))
                 messages.success(request, 'Registration successful! Please check your email to verify your account.')
             except Exception as e:
                 messages.warning(request, f'Account created but verification email failed to send. Error: {str(e)}')
@@ -91,6 +94,7 @@ def register_farmer(request):
 
 
 
+@write_view
 def register_user(request):
     if request.user.is_authenticated:
         messages.info(request, 'You are already logged in.')
@@ -100,12 +104,7 @@ def register_user(request):
         form = RegistrationForm(request.POST)
         if form.is_valid():
             # Create user but don't commit so we can set password properly
-            user = form.save()
-           
-            # Ensure token and timestamp are set
-            user.verification_token = uuid.uuid4()
-            user.token_created_at = timezone.now()
-            user.save()
+            draft = form.save(commit=False)
 
             # Create profile
             first_name = form.cleaned_data.get('first_name')
@@ -113,17 +112,24 @@ def register_user(request):
             email = form.cleaned_data.get('email')
             phone_number = form.cleaned_data.get('phone_number')
 
-            Profile.objects.create(
-                user=user,
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                phone_number=phone_number
-            )
+            def create_account():
+                # Retried by run_write(), so start from the unsaved user each time.
+                user = copy.copy(draft)
+                user.save()
+                Profile.objects.create(
+                    user=user,
+                    first_name=first_name,
+                    last_name=last_name,
+                    email=email,
+                    phone_number=phone_number
+                )
+                return user
+
+            user = run_write(create_account)
 
             # Send verification email
             try:
-                send_verification_email(user, request)
+                run_write(lambda: send_verification_email(user, request))
                 messages.success(request, 'Registration successful! Please check your email to verify your account.')
             except Exception as e:
                 messages.warning(request, f'Account created but verification email failed to send. Error: {str(e)}')
@@ -156,41 +162,38 @@ def login_view(request):
             
     return render(request, 'userauths/login.html')
 
+def confirm_email(token):
+    """Redeem a verification token and mark its user verified, in one write."""
+    user = redeem_token(token, UserToken.VERIFY_EMAIL).user
+    user.email_verified = True
+    user.save(update_fields=['email_verified'])
+    # Only spools the message; it commits or rolls back with the rest.
+    send_welcome_email(user)
+    return user
+
+
+@write_view
 def verify_email_view(request, token):
     """
     Verify user's email using token
     """
     try:
-        # Find user with token
-        user = CustomUser.objects.get(verification_token=token)
-        
-        # Check if token is expired (24 hours)
-        token_age = timezone.now() - user.token_created_at
-        if token_age > timedelta(hours=24):
-            messages.error(request, 'Verification link has expired. Please request a new one.')
-            return redirect('userauths:resend-verification')
-        
-        # Verify email
-        user.email_verified = True
-        user.verification_token = uuid.uuid4()  # Generate new token for security
-        user.token_created_at = timezone.now()
-        user.save()
-        
-        # Send welcome email
-        try:
-            send_welcome_email(user)
-        except:
-            pass  # Welcome email failure shouldn't stop verification
-        
-        messages.success(request, 'Email verified successfully! You can now log in.')
-        return redirect('userauths:login')
-        
-    except CustomUser.DoesNotExist:
+        run_write(lambda: confirm_email(token))
+    except ExpiredToken:
+        messages.error(request, 'Verification link has expired. Please request a new one.')
+        return redirect('userauths:resend-verification')
+    except InvalidToken:
+        # A second click on a link that already worked.
+        if UserToken.objects.filter(
+            token=token, purpose=UserToken.VERIFY_EMAIL, used_at__isnull=False, user__email_verified=True
+        ).exists():
+            messages.info(request, 'Your email is already verified. You can log in.')
+            return redirect('userauths:login')
         messages.error(request, 'Invalid verification link.')
-        return redirect('userauths:home')
-    except Exception as e:
-        messages.error(request, f'Verification failed: {str(e)}')
-        return redirect('userauths:home')
+        return redirect('store:home')
+
+    messages.success(request, 'Email verified successfully! You can now log in.')
+    return redirect('userauths:login')
 
 def resend_verification_view(request):
     """
@@ -203,16 +206,12 @@ def resend_verification_view(request):
             
             if user.email_verified:
                 messages.info(request, 'Email is already verified.')
-                return redirect('login')
-            
-            # Update token and send new email
-            user.verification_token = uuid.uuid4()
-            user.token_created_at = timezone.now()
-            user.save()
+                return redirect('userauths:login')
             
+            # Issue a new token (retiring the old one) and send new email
             send_verification_email(user, request)
             messages.success(request, 'Verification email sent! Please check your inbox.')
-            return redirect('login')
+            return redirect('userauths:login')
             
         except CustomUser.DoesNotExist:
             messages.error(request, 'No account found with this email.')